@@ -0,0 +1,520 @@
+import math
+
+import numpy as np
+
+from . import metrics
+from .game_simulator import (
+    ATTACK_TO_DEFENSE_EFFICIENCY,
+    ATTACK_TO_ATTACK_EFFICIENCY,
+    DEFENSE_TO_ATTACK_EFFICIENCY,
+)
+from .models import Movement
+from .topology import Topology
+
+
+def _first_occurrence_ids(keys):
+    """
+    Number distinct keys in order of their first occurrence.
+    Returns id of every key and position of first occurrence of every id.
+    """
+    uniques, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    ids = np.empty(len(uniques), dtype=np.int64)
+    ids[order] = np.arange(len(uniques))
+    return ids[inverse.reshape(-1)], first[order]
+
+
+def _occurrence_ranks(groups):
+    """ rank[i] = how many times groups[i] occured before position i """
+    order = np.argsort(groups, kind="stable")
+    sorted_groups = groups[order]
+    positions = np.arange(len(groups))
+    starts = np.ones(len(groups), dtype=bool)
+    starts[1:] = sorted_groups[1:] != sorted_groups[:-1]
+    group_start = np.maximum.accumulate(np.where(starts, positions, 0))
+    ranks = np.empty(len(groups), dtype=np.int64)
+    ranks[order] = positions - group_start
+    return ranks
+
+
+def _greedy_take(groups, amounts, available):
+    """
+    Requests, in order, take min(amount, what is left) from pool of their group.
+    Equivalent of `taken = min(amount, left[group]); left[group] -= taken`.
+    """
+    if not len(groups):
+        return np.zeros(0, dtype=np.int64)
+    order = np.argsort(groups, kind="stable")
+    sorted_groups = groups[order]
+    sorted_amounts = amounts[order]
+    cumulative = np.cumsum(sorted_amounts)
+    starts = np.ones(len(groups), dtype=bool)
+    starts[1:] = sorted_groups[1:] != sorted_groups[:-1]
+    group_start = np.maximum.accumulate(np.where(starts, np.arange(len(groups)), 0))
+    including = cumulative - (cumulative - sorted_amounts)[group_start]
+    excluding = including - sorted_amounts
+    pool = available[sorted_groups]
+    taken = np.empty(len(groups), dtype=np.int64)
+    taken[order] = np.minimum(pool, including) - np.minimum(pool, excluding)
+    return taken
+
+
+def _sum_by(groups, values, size):
+    """ Sums values per group, adding them in order of appearance. """
+    return np.bincount(groups, weights=values, minlength=size)
+
+
+def _int_sum_by(groups, values, size):
+    sums = np.zeros(size, dtype=np.int64)
+    np.add.at(sums, groups, values)
+    return sums
+
+
+class ArrayGameSimulator:
+    """
+    Drop-in replacement of GameSimulator keeping game state in dense arrays.
+
+    Tiles are numbered 0..N-1, players 0..P-1 (-1 stands for no player) and
+    movements are kept as parallel source/target/amount arrays. Phases are
+    computed with scatter-adds over these arrays. Order of floating point
+    operations follows GameSimulator, so diffs are exactly the same.
+    """
+
+    def __init__(
+        self, tiles, movements, players, topology=None, movement_factory=Movement,
+    ):
+        self.tiles_by_id = {tile.id: tile for tile in tiles}
+        self._tiles = list(self.tiles_by_id.values())
+        self.topology = topology or Topology.for_tiles(self._tiles)
+        tile_index = {tile.id: i for i, tile in enumerate(self._tiles)}
+        tile_count = len(self._tiles)
+
+        self.players_by_id = {player.id: player for player in players}
+        self._player_ids = list(self.players_by_id)
+        player_index = {player_id: i for i, player_id in enumerate(self._player_ids)}
+        player_index[None] = -1
+        self._player_bosses = {}  # player id -> set of player ids
+        self.movement_factory = movement_factory
+
+        corporation_index = {None: -1}
+        for player in self.players_by_id.values():
+            corporation_index.setdefault(player.corporation_id, len(corporation_index))
+        # last entry is used for "no player" (index -1)
+        self._corporation = np.array(
+            [
+                corporation_index[player.corporation_id]
+                for player in self.players_by_id.values()
+            ]
+            + [-1],
+            dtype=np.int64,
+        )
+
+        self.army = np.fromiter(
+            (tile.army for tile in self._tiles), dtype=np.int64, count=tile_count,
+        )
+        self.owner = np.fromiter(
+            (player_index[tile.owner_id] for tile in self._tiles),
+            dtype=np.int64,
+            count=tile_count,
+        )
+        # board index of every tile
+        self._board_indices = self.topology.indices(
+            [tile.coords for tile in self._tiles]
+        )
+        self._board_order = np.argsort(self._board_indices)
+
+        self._movements = list(movements)
+        movement_count = len(self._movements)
+        self.source = np.fromiter(
+            (tile_index[m.source_id] for m in self._movements),
+            dtype=np.int64,
+            count=movement_count,
+        )
+        self.target = np.fromiter(
+            (tile_index[m.target_id] for m in self._movements),
+            dtype=np.int64,
+            count=movement_count,
+        )
+        self.amount = np.fromiter(
+            (m.amount for m in self._movements), dtype=np.int64, count=movement_count,
+        )
+        self.next = self._next_on_path(self.source, self.target)
+        self._alive = np.ones(movement_count, dtype=bool)
+
+        self._touched = np.zeros(tile_count, dtype=bool)
+        self._deleted = {}  # path -> movement index
+        self._updated = {}  # movement index -> True, ordered
+        self._created = []  # movement indices
+
+        self.tiles_to_be_updated = set()  # ids of modified tiles
+        self.movements_to_be_created = []
+        self.movements_to_be_updated = []
+        self.movements_to_be_deleted = []
+
+    def _next_on_path(self, sources, targets):
+        next_board_indices = self.topology.next_hops(
+            self._board_indices[sources], self._board_indices[targets]
+        )
+        return self._board_order[
+            np.searchsorted(
+                self._board_indices, next_board_indices, sorter=self._board_order
+            )
+        ]
+
+    def _are_enemies(self, owners_a, owners_b):
+        corporations_a = self._corporation[owners_a]
+        corporations_b = self._corporation[owners_b]
+        return (owners_a != owners_b) & (
+            (owners_a < 0)
+            | (owners_b < 0)
+            | (corporations_a < 0)
+            | (corporations_b < 0)
+            | (corporations_a != corporations_b)
+        )
+
+    def _is_transfer_possible(self, owners_a, owners_b):
+        """ Whether armies can be transfered from owners_a to owners_b """
+        width = len(self._player_ids) + 1
+        pairs, inverse = np.unique(
+            (owners_a + 1) * width + owners_b + 1, return_inverse=True
+        )
+        possible = np.empty(len(pairs), dtype=bool)
+        for i, pair in enumerate(pairs.tolist()):
+            a, b = divmod(pair, width)
+            a = self._player_ids[a - 1] if a else None
+            b = self._player_ids[b - 1] if b else None
+            possible[i] = (
+                a == b
+                or b in self.get_player_bosses(a)
+                or a in self.get_player_bosses(b)
+            )
+        return possible[inverse.reshape(-1)]
+
+    def get_player_bosses(self, player_id):
+        if player_id is None:
+            return set()
+
+        if player_id not in self._player_bosses:
+            bosses = set()
+            player = self.players_by_id[player_id]
+            while player.boss_id is not None:
+                bosses.add(player.boss_id)
+                player = self.players_by_id[player.boss_id]
+            self._player_bosses[player_id] = bosses
+
+        return self._player_bosses[player_id]
+
+    def _path_keys(self, sources, targets):
+        return sources * len(self._tiles) + targets
+
+    def _delete_movements(self, indices):
+        for i in indices.tolist():
+            path = (int(self.source[i]), int(self.target[i]))
+            self._deleted[path] = i
+            self._updated.pop(i, None)
+        self._alive[indices] = False
+
+    @property
+    def movements_by_id(self):
+        return {
+            self._movements[i].id: self._movements[i]
+            for i in np.flatnonzero(self._alive).tolist()
+        }
+
+    def simulate(self):
+        with metrics.phase("battles"):
+            self.simulate_battles()
+        with metrics.phase("owner_changes"):
+            self.simulate_owner_changes()
+        with metrics.phase("movements"):
+            self.simulate_movements()
+        with metrics.phase("collect_diffs"):
+            self._collect_diffs()
+
+    def simulate_battles(self):
+        tile_count = len(self._tiles)
+        if not len(self.amount):
+            return
+
+        # dispatch armies, intially all armies defend
+        dispatched = _greedy_take(self.source, self.amount, self.army)
+        defending = self.army - _int_sum_by(self.source, dispatched, tile_count)
+
+        # gather incoming armies by (next tile, source tile), ordered like dict
+        # iteration in GameSimulator: by first appearance of the tile, then of the pair
+        pair_of_movement, pair_first = _first_occurrence_ids(
+            self._path_keys(self.next, self.source)
+        )
+        tile_first = np.full(tile_count, len(self.next), dtype=np.int64)
+        np.minimum.at(tile_first, self.next, np.arange(len(self.next)))
+        pair_order = np.lexsort((pair_first, tile_first[self.next[pair_first]]))
+        pair_rank = np.empty(len(pair_order), dtype=np.int64)
+        pair_rank[pair_order] = np.arange(len(pair_order))
+        pair_of_movement = pair_rank[pair_of_movement]
+        pair_first = pair_first[pair_order]
+        pair_count = len(pair_first)
+        pair_tile = self.next[pair_first]
+        pair_source = self.source[pair_first]
+        pair_owner = self.owner[pair_source]
+        attacking = _int_sum_by(pair_of_movement, dispatched, pair_count).astype(
+            np.float64
+        )
+
+        # calculate defender losses, decrease attacking armies accordingly
+        army = self.army.astype(np.float64)
+        hostile = self._are_enemies(pair_owner, self.owner[pair_tile])
+        force = (
+            _sum_by(pair_tile, np.where(hostile, attacking, 0), tile_count)
+            * ATTACK_TO_DEFENSE_EFFICIENCY
+        )
+        losses = np.minimum(force, army)
+        hit = losses > 0
+        army[hit] -= losses[hit]
+        self._touched |= hit
+        ratio = np.divide(force, losses, out=np.zeros(tile_count), where=hit)
+        reduced = hostile & hit[pair_tile]
+        attacking[reduced] -= ratio[pair_tile[reduced]] * attacking[reduced]
+
+        # calculate attacker losses
+        attacking_sum = _sum_by(pair_tile, attacking, tile_count)
+
+        # index by player, groups of one tile are contiguous and in dict order
+        width = len(self._player_ids) + 1
+        group_of_pair, group_first = _first_occurrence_ids(
+            pair_tile * width + pair_owner + 1
+        )
+        group_tile = pair_tile[group_first]
+        group_owner = pair_owner[group_first]
+        dealing = _sum_by(group_of_pair, attacking, len(group_first))
+        group_count = np.bincount(group_tile, minlength=tile_count)
+        group_start = np.full(tile_count, len(group_first), dtype=np.int64)
+        np.minimum.at(group_start, group_tile, np.arange(len(group_first)))
+
+        # every pair receives damage from every enemy group on the same tile
+        repeats = group_count[pair_tile]
+        cross_pair = np.repeat(np.arange(pair_count), repeats)
+        cross_group = (
+            group_start[pair_tile][cross_pair]
+            + np.arange(len(cross_pair))
+            - (np.cumsum(repeats) - repeats)[cross_pair]
+        )
+        cross_tile = pair_tile[cross_pair]
+        remaining = attacking_sum[cross_tile] - dealing[cross_group]
+        dealt = (remaining > 0) & self._are_enemies(
+            group_owner[cross_group], pair_owner[cross_pair]
+        )
+        damage = np.zeros(len(cross_pair))
+        damage[dealt] = (
+            (dealing[cross_group[dealt]] * ATTACK_TO_ATTACK_EFFICIENCY)
+            * attacking[cross_pair[dealt]]
+            / remaining[dealt]
+        )
+        deaths = _sum_by(cross_pair, damage, pair_count)
+
+        # received from defenders
+        group_keys = group_tile * width + group_owner + 1
+        group_order = np.argsort(group_keys)
+        defender_group = group_order[
+            np.minimum(
+                np.searchsorted(
+                    group_keys,
+                    pair_tile * width + self.owner[pair_tile] + 1,
+                    sorter=group_order,
+                ),
+                len(group_keys) - 1,
+            )
+        ]
+        defenders_dealing = np.where(
+            (group_tile[defender_group] == pair_tile)
+            & (group_owner[defender_group] == self.owner[pair_tile]),
+            dealing[defender_group],
+            0,
+        )
+        defenders_defending_against = attacking_sum[pair_tile] - defenders_dealing
+        defended = (defenders_defending_against > 0) & hostile
+        deaths[defended] += (
+            (defending[pair_tile[defended]] * DEFENSE_TO_ATTACK_EFFICIENCY)
+            * attacking[defended]
+            / defenders_defending_against[defended]
+        )
+
+        # apply deaths, in rounds so every source tile is updated in order
+        source_rank = _occurrence_ranks(pair_source)
+        for rank in range(int(source_rank.max(initial=-1)) + 1):
+            in_round = source_rank == rank
+            sources = pair_source[in_round]
+            round_deaths = np.minimum(deaths[in_round], army[sources])
+            dying = round_deaths > 0
+            army[sources[dying]] -= round_deaths[dying]
+            self._touched[sources[dying]] = True
+
+        self.army = np.floor(army).astype(np.int64)
+
+    def simulate_owner_changes(self):
+        tile_count = len(self._tiles)
+        movements = np.flatnonzero(self._alive)
+        if not len(movements):
+            return
+        sources = self.source[movements]
+        nexts = self.next[movements]
+
+        # tiles are processed in order of first appearance as a next tile
+        visit_order = np.full(tile_count, len(self.next), dtype=np.int64)
+        np.minimum.at(visit_order, self.next, np.arange(len(self.next)))
+        visited = np.flatnonzero(visit_order < len(self.next))
+        visited = visited[np.argsort(visit_order[visited])]
+
+        outgoing = _int_sum_by(sources, self.amount[movements], tile_count)
+        carried = self.army[sources] * self.amount[movements]
+        effective = np.floor(carried / outgoing[sources])
+        exact = np.abs(carried) > 2 ** 53
+        for i in np.flatnonzero(exact).tolist():
+            effective[i] = math.floor(int(carried[i]) / int(outgoing[sources[i]]))
+        attacking = (effective > 0) & self._are_enemies(
+            self.owner[nexts], self.owner[sources]
+        )
+
+        defended = visited[self.army[visited] > 0]
+        width = len(self._player_ids) + 1
+
+        # Owner change of a tile deletes its outgoing movements, so later visited
+        # tiles don't see them. Iterate until changes are consistent with that.
+        changed = np.zeros(tile_count, dtype=bool)
+        while True:
+            present = attacking & ~(
+                changed[sources] & (visit_order[sources] < visit_order[nexts])
+            )
+            party_tiles = np.concatenate((nexts[present], defended))
+            party_owners = np.concatenate(
+                (self.owner[sources[present]], self.owner[defended])
+            )
+            parties = np.unique(party_tiles * width + party_owners + 1)
+            party_tiles, party_owners = np.divmod(parties, width)
+            party_owners -= 1
+            party_count = np.bincount(party_tiles, minlength=tile_count)
+            single = party_count[party_tiles] == 1
+            conquered = single & (party_owners != self.owner[party_tiles])
+            now_changed = np.zeros(tile_count, dtype=bool)
+            now_changed[party_tiles[conquered]] = True
+            if np.array_equal(now_changed, changed):
+                break
+            changed = now_changed
+
+        new_owners = self.owner.copy()
+        new_owners[party_tiles[conquered]] = party_owners[conquered]
+        lost = movements[changed[sources]]
+        lost = lost[np.argsort(visit_order[self.source[lost]], kind="stable")]
+        self._delete_movements(lost)
+        self.owner = new_owners
+        self._touched |= changed
+
+    def simulate_movements(self):
+        tile_count = len(self._tiles)
+        movements = np.flatnonzero(self._alive)
+        if not len(movements):
+            return
+        sources = self.source[movements]
+        targets = self.target[movements]
+        nexts = self.next[movements]
+
+        possible = self._is_transfer_possible(self.owner[sources], self.owner[nexts])
+        moved = np.zeros(len(movements), dtype=np.int64)
+        moved[possible] = _greedy_take(
+            sources[possible], self.amount[movements][possible], self.army
+        )
+        executed = moved > 0
+
+        # movement deltas by path, ordered by first appearance
+        further = executed & (nexts != targets)
+        keys = np.stack(
+            (self._path_keys(sources, targets), self._path_keys(nexts, targets),),
+            axis=1,
+        )
+        deltas = np.stack((-moved, moved), axis=1)
+        used = np.stack((executed, further), axis=1)
+        keys = keys[used]
+        deltas = deltas[used]
+        if len(keys):
+            path_of_key, path_first = _first_occurrence_ids(keys)
+            path_keys = keys[path_first]
+            path_deltas = _int_sum_by(path_of_key, deltas, len(path_first))
+        else:
+            path_keys = path_deltas = np.zeros(0, dtype=np.int64)
+
+        # update movements
+        live_keys = self._path_keys(sources, targets)
+        live_order = np.argsort(live_keys)
+        found = np.searchsorted(live_keys, path_keys, sorter=live_order)
+        found = np.minimum(found, len(live_keys) - 1)
+        existing = movements[live_order[found]]
+        is_existing = live_keys[live_order[found]] == path_keys
+        created = []
+        for key, delta, index, exists in zip(
+            path_keys.tolist(),
+            path_deltas.tolist(),
+            existing.tolist(),
+            is_existing.tolist(),
+        ):
+            if delta == 0:
+                continue
+            if exists:
+                self.amount[index] += delta
+                if self.amount[index] > 0:
+                    self._updated[index] = True
+                else:
+                    self._delete_movements(np.array([index]))
+            else:
+                path = divmod(key, tile_count)
+                if path in self._deleted:
+                    # path was abandoned this tick - reuse the movement
+                    index = self._deleted.pop(path)
+                    self.amount[index] = delta
+                    self._alive[index] = True
+                    self._updated[index] = True
+                else:
+                    created.append(path + (delta,))
+        self._create_movements(created)
+
+        # update tiles
+        delta = _int_sum_by(nexts, moved, tile_count) - _int_sum_by(
+            sources, moved, tile_count
+        )
+        self.army += delta
+        self._touched |= delta != 0
+
+    def _create_movements(self, rows):
+        if not rows:
+            return
+        sources, targets, amounts = (np.array(c, dtype=np.int64) for c in zip(*rows))
+        self._created.extend(
+            range(len(self._movements), len(self._movements) + len(rows))
+        )
+        self._movements.extend(
+            self.movement_factory(
+                source_id=self._tiles[source].id,
+                target_id=self._tiles[target].id,
+                amount=amount,
+            )
+            for source, target, amount in rows
+        )
+        self.source = np.concatenate((self.source, sources))
+        self.target = np.concatenate((self.target, targets))
+        self.amount = np.concatenate((self.amount, amounts))
+        self.next = np.concatenate((self.next, self._next_on_path(sources, targets)))
+        self._alive = np.concatenate((self._alive, np.ones(len(rows), dtype=bool)))
+
+    def _collect_diffs(self):
+        for i in np.flatnonzero(self._touched).tolist():
+            tile = self._tiles[i]
+            tile.army = int(self.army[i])
+            owner = int(self.owner[i])
+            tile.owner_id = self._player_ids[owner] if owner >= 0 else None
+            self.tiles_to_be_updated.add(tile.id)
+
+        for i in list(self._updated) + self._created:
+            self._movements[i].amount = int(self.amount[i])
+        self.movements_to_be_created = [self._movements[i] for i in self._created]
+        self.movements_to_be_updated = [self._movements[i] for i in self._updated]
+        self.movements_to_be_deleted = [
+            self._movements[i].id for i in self._deleted.values()
+        ]
@@ -0,0 +1,240 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+import numpy as np
+
+from .models import Game, Movement, Player, Tile
+from .state import GameState, PlayerRecord, TileRecord
+
+
+LAYOUTS = ["random", "clustered"]
+PHASES = ["simulate_battles", "simulate_owner_changes", "simulate_movements"]
+
+
+@transaction.atomic
+def generate_game(radius, player_count=4, movement_count=None, seed=None):
+    """ Game with random owners, armies and movements, for benchmarking """
+    rng = random.Random(seed)
+    game = Game.generate_hexagonal(radius)
+    users = get_user_model().objects.bulk_create(
+        [
+            get_user_model()(username=f"benchmark-{uuid.uuid4().hex}")
+            for i in range(player_count)
+        ]
+    )
+    players = Player.objects.bulk_create(
+        [Player(game=game, user=user) for user in users]
+    )
+
+    tiles = list(game.tiles.all())
+    for tile in tiles:
+        tile.owner = rng.choice(players + [None])
+        tile.army = rng.randrange(100)
+    Tile.objects.bulk_update(tiles, ["owner", "army"])
+
+    if movement_count is None:
+        movement_count = len(tiles) // 2
+    owned = [tile for tile in tiles if tile.owner is not None]
+    paths = set()
+    for i in range(movement_count * 2):
+        if not owned or len(paths) >= movement_count:
+            break
+        source = rng.choice(owned)
+        target = rng.choice(tiles)
+        if source != target:
+            paths.add((source, target))
+    Movement.objects.bulk_create(
+        [
+            Movement(source=source, target=target, amount=rng.randrange(1, 20))
+            for source, target in paths
+        ]
+    )
+    return game
+
+
+def delete_games(games):
+    """ Remove generated games together with their users """
+    get_user_model().objects.filter(
+        id__in=Player.objects.filter(game__in=games).values("user_id")
+    ).delete()
+    Game.objects.filter(id__in=[game.id for game in games]).delete()
+
+
+def synthetic_state(
+    radius,
+    player_count=4,
+    layout="random",
+    movement_density=0.5,
+    path_length=3,
+    seed=None,
+):
+    """
+    Random `GameState` built in memory, without the database, so boards can
+    be much bigger than with `generate_game`.
+
+    layout: "random" - owner of every tile drawn separately, some unowned,
+    "clustered" - every tile belongs to the player with the nearest capital
+    movement_density: movements per owned tile
+    path_length: maximal distance from source to target of a movement
+    """
+    rng = np.random.default_rng(seed)
+    state = GameState.empty(Game(radius=radius))
+    topology = state.topology
+    if layout == "random":
+        owners = rng.integers(-1, player_count, topology.size)
+    elif layout == "clustered":
+        capitals = topology.coords[rng.choice(topology.size, player_count, False)]
+        distances = np.abs(topology.coords[:, None, :] - capitals[None, :, :])
+        owners = distances.max(axis=2).argmin(axis=1)
+    else:
+        raise ValueError(f"unknown layout {layout}")
+    armies = rng.integers(0, 100, topology.size)
+
+    owned = np.flatnonzero(owners >= 0)
+    movement_count = int(len(owned) * movement_density)
+    paths = set()
+    for attempt in range(100):
+        missing = movement_count - len(paths)
+        if missing <= 0 or not len(owned):
+            break
+        sources = rng.choice(owned, missing)
+        steps = rng.integers(-path_length, path_length + 1, (missing, 2))
+        distances = np.abs(np.column_stack((steps, -steps.sum(axis=1)))).max(axis=1)
+        targets = topology.coords[sources, :2] + steps
+        on_board = (np.abs(targets) <= radius).all(axis=1) & (
+            np.abs(targets.sum(axis=1)) <= radius
+        )
+        valid = on_board & (distances > 0) & (distances <= path_length)
+        targets = topology.grid[targets[valid, 0] + radius, targets[valid, 1] + radius]
+        paths.update(zip(sources[valid].tolist(), targets.tolist()))
+    paths = sorted(paths)[:movement_count]
+    amounts = rng.integers(1, 20, len(paths)).tolist()
+
+    # in the order players are loaded from the database in
+    player_ids = sorted(uuid.uuid4() for i in range(player_count))
+    return GameState.build(
+        state.game,
+        [
+            TileRecord(index, x, y, None if owner < 0 else owner, army)
+            for index, ((x, y, z), owner, army) in enumerate(
+                zip(topology.coords.tolist(), owners.tolist(), armies.tolist())
+            )
+        ],
+        [uuid.uuid4() for i in range(topology.size)],
+        [PlayerRecord(i, None, None) for i in range(player_count)],
+        player_ids,
+        {path: (uuid.uuid4(), amount) for path, amount in zip(paths, amounts)},
+    )
+
+
+@transaction.atomic
+def save_synthetic_game(state):
+    """ Write a state made by `synthetic_state` to the database, returns the game """
+    game = Game.objects.create(radius=state.game.radius)
+    users = get_user_model().objects.bulk_create(
+        [
+            get_user_model()(username=f"benchmark-{uuid.uuid4().hex}")
+            for player_id in state.player_ids
+        ]
+    )
+    Player.objects.bulk_create(
+        [
+            Player(id=player_id, game=game, user=user)
+            for player_id, user in zip(state.player_ids, users)
+        ]
+    )
+    Tile.objects.bulk_create(
+        [
+            Tile(
+                id=state.tile_ids[tile.id],
+                game=game,
+                index=tile.id,
+                x=tile.x,
+                y=tile.y,
+                z=tile.z,
+                owner_id=None
+                if tile.owner_id is None
+                else state.player_ids[tile.owner_id],
+                army=tile.army,
+            )
+            for tile in state.tiles
+        ]
+    )
+    Movement.objects.bulk_create(
+        [
+            Movement(
+                id=movement_id,
+                source_id=state.tile_ids[movement.source_id],
+                target_id=state.tile_ids[movement.target_id],
+                amount=movement.amount,
+            )
+            for movement_id, movement in state.movements_by_uuid().items()
+        ]
+    )
+    return game
+
+
+def time_phases(state, simulator_class=None):
+    """ Simulate a tick, returns {phase: seconds}, including simulator setup """
+    timings = {}
+    started = time.perf_counter()
+    simulator = state.simulator(simulator_class)
+    timings["setup"] = time.perf_counter() - started
+    for phase in PHASES:
+        started = time.perf_counter()
+        getattr(simulator, phase)()
+        timings[phase] = time.perf_counter() - started
+    state.take_results(simulator)
+    timings["total"] = sum(timings.values())
+    return timings
+
+
+def time_database_tick(game, simulator_class=None):
+    """
+    Times of loading, simulating and saving a tick of a saved game, and of
+    the whole `Game.simulate`. Changes are rolled back.
+    """
+    timings = {}
+    with transaction.atomic():
+        started = time.perf_counter()
+        (state,) = GameState.load_many([game], lock=True, ticks=[1])
+        timings["load"] = time.perf_counter() - started
+        started = time.perf_counter()
+        state.advance(simulator_class)
+        timings["simulate"] = time.perf_counter() - started
+        started = time.perf_counter()
+        GameState.save_many([state])
+        timings["save"] = time.perf_counter() - started
+        transaction.set_rollback(True)
+    with transaction.atomic():
+        started = time.perf_counter()
+        Game.simulate_many([game])
+        timings["game_simulate"] = time.perf_counter() - started
+        game.tick -= 1
+        transaction.set_rollback(True)
+    return timings
+
+
+def median_timings(runs):
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def regressions(baseline, results, threshold, min_difference):
+    """
+    (case, metric, baseline seconds, seconds) of metrics slower than in the
+    baseline by more than threshold (a fraction) and min_difference seconds.
+    Cases and metrics missing from either side are skipped.
+    """
+    found = []
+    for case, timings in results.items():
+        for metric, seconds in timings.items():
+            before = baseline.get(case, {}).get(metric)
+            if not isinstance(before, float) or not isinstance(seconds, float):
+                continue
+            if seconds > before * (1 + threshold) and seconds - before > min_difference:
+                found.append((case, metric, before, seconds))
+    return found
@@ -0,0 +1,59 @@
+"""
+Response bodies built once per game tick.
+
+Between ticks full lists of a game can't change, so they are rendered and
+compressed once, kept in the cache and served as plain bytes to everyone.
+Brotli is used if the `brotli` package is installed, gzip otherwise.
+"""
+import gzip
+
+from django.conf import settings
+from django.core.cache import cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# in order of preference
+ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def encode(content):
+    """ {content coding: body} """
+    bodies = {"identity": content, "gzip": gzip.compress(content, compresslevel=6)}
+    if brotli is not None:
+        bodies["br"] = brotli.compress(content)
+    return bodies
+
+
+def tick_bodies(key, build):
+    """ Encoded bodies stored under the key, built by `build()` if missing """
+    bodies = cache.get(key)
+    if bodies is None:
+        bodies = encode(build())
+        # the key includes the tick, entries are of no use after the next one
+        cache.set(key, bodies, timeout=2 * settings.TICK_DURATION.total_seconds())
+    return bodies
+
+
+def accepted_encoding(accept_encoding, encodings=ENCODINGS):
+    """ The preferred of encodings allowed by an Accept-Encoding header """
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not any(_is_refused(param) for param in params):
+            accepted.add(coding.lower())
+    for coding in encodings:
+        if coding in accepted or "*" in accepted:
+            return coding
+    return "identity"
+
+
+def _is_refused(param):
+    name, _, value = param.partition("=")
+    try:
+        return name.strip().lower() == "q" and float(value) == 0
+    except ValueError:
+        return False
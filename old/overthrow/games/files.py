@@ -0,0 +1,27 @@
+"""
+Files shared between processes: snapshots, topologies and metrics.
+"""
+import contextlib
+import os
+import tempfile
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode="w"):
+    """
+    Open a temporary file that replaces `path` once the block succeeds.
+
+    Readers see either the old or the new file, never a partial one. The
+    temporary file is in the same directory (so the rename is atomic) and is
+    removed if writing fails.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,71 @@
+import functools
+import operator
+
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class RegionFilter(BaseFilterBackend):
+    """
+    Limits rows to a region of the board: a hex range with
+    `?center=x,y,z&radius=r` and/or an axial rectangle with `?x=min,max` and
+    `?y=min,max`. Every region is a range on each coordinate, which the
+    (game, x, y) index of tiles serves.
+
+    Views list in `region_fields` the tiles a row is checked by, a row is
+    kept if any of them is inside the region.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        ranges = self.get_ranges(request.query_params)
+        if not ranges:
+            return queryset
+        return queryset.filter(
+            functools.reduce(
+                operator.or_,
+                [
+                    Q(
+                        **{
+                            f"{prefix}{axis}__range": axis_range
+                            for axis, axis_range in ranges.items()
+                        }
+                    )
+                    for prefix in getattr(view, "region_fields", [""])
+                ],
+            )
+        )
+
+    def get_ranges(self, params):
+        """ {axis: (min, max)}, intersection of all given regions """
+        ranges = {}
+        if "center" in params:
+            center = self.parse_ints(params, "center", 3)
+            if sum(center) != 0:
+                raise ValidationError({"center": _("Coordinates have to sum to 0.")})
+            (radius,) = self.parse_ints(params, "radius", 1)
+            for axis, value in zip("xyz", center):
+                ranges[axis] = (value - radius, value + radius)
+        for axis in "xy":
+            if axis in params:
+                low, high = self.parse_ints(params, axis, 2)
+                if axis in ranges:
+                    low = max(low, ranges[axis][0])
+                    high = min(high, ranges[axis][1])
+                ranges[axis] = (low, high)
+        return ranges
+
+    def parse_ints(self, params, name, count):
+        try:
+            values = [int(value) for value in params[name].split(",")]
+        except (KeyError, ValueError):
+            values = []
+        if len(values) != count:
+            raise ValidationError(
+                {
+                    name: _("%(count)d comma separated integers are required.")
+                    % {"count": count}
+                }
+            )
+        return values
@@ -0,0 +1,150 @@
+"""
+Per process cache of game states, for serving reads without the database.
+
+A game changes only when a tick is simulated (orders wait in the inbox until
+then) or a player joins, which bumps `Game.revision`. So a snapshot stays
+valid as long as the game is at the tick and revision it was taken at.
+Reading them is the only query of a cache hit.
+
+Hits and misses are counted with TICK_METRICS, see `overthrow.games.metrics`.
+"""
+from collections import OrderedDict
+import threading
+
+from django.conf import settings
+
+from . import metrics
+from .models import Game, Movement, Player
+
+
+class GameSnapshot:
+    """
+    State of a game at a tick and revision, as plain rows.
+
+    tiles: (id, index, x, y, z, owner id, army), in the dense index order
+    movements: (id, source id, target id, amount)
+    """
+
+    __slots__ = (
+        "game_id",
+        "tick",
+        "revision",
+        "tiles",
+        "tile_positions",
+        "player_users",
+        "movements",
+        "movement_sources",
+        "movement_paths",
+    )
+
+    def __init__(self, game_id, tick, revision, tiles, player_users, movements):
+        self.game_id = game_id
+        self.tick = tick
+        self.revision = revision
+        self.tiles = tiles
+        self.tile_positions = {tile[0]: position for position, tile in enumerate(tiles)}
+        self.player_users = player_users  # player id -> user id
+        self.movements = movements
+        self.movement_sources = {movement[0]: movement[1] for movement in movements}
+        self.movement_paths = {(m[1], m[2]): m[0] for m in movements}
+
+    @classmethod
+    def load(cls, game):
+        return cls(
+            game.id,
+            game.tick,
+            game.revision,
+            list(
+                game.tiles.order_by("index").values_list(
+                    "id", "index", "x", "y", "z", "owner_id", "army"
+                )
+            ),
+            dict(Player.objects.filter(game=game).values_list("id", "user_id")),
+            list(
+                Movement.objects.filter(source__game=game).values_list(
+                    "id", "source_id", "target_id", "amount"
+                )
+            ),
+        )
+
+    def tile_owner(self, tile_id):
+        """ Owning player of the tile, None also for tiles of other games """
+        position = self.tile_positions.get(tile_id)
+        return None if position is None else self.tiles[position][5]
+
+    def has_tile(self, tile_id):
+        return tile_id in self.tile_positions
+
+    def movement_owner(self, movement_id):
+        """ Player owning source of the movement, None also for other games """
+        return self.tile_owner(self.movement_sources.get(movement_id))
+
+    def movement_on(self, source_id, target_id):
+        """ Id of the movement from source to target, None if there is none """
+        return self.movement_paths.get((source_id, target_id))
+
+    def user_owns(self, user, player_id):
+        return (
+            player_id is not None
+            and user.is_authenticated
+            and self.player_users.get(player_id) == user.id
+        )
+
+    def player_of(self, user_id):
+        for player_id, player_user_id in self.player_users.items():
+            if player_user_id == user_id:
+                return player_id
+        return None
+
+
+class GameStateCache:
+    """ Snapshots of the most recently used games, at most `size` of them """
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, game):
+        """
+        Snapshot of the game at its current tick and revision, both have to
+        be fresh in `game`
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(game.id)
+            hit = snapshot is not None and (snapshot.tick, snapshot.revision) == (
+                game.tick,
+                game.revision,
+            )
+            if hit:
+                self.hits += 1
+                self._snapshots.move_to_end(game.id)
+            else:
+                self.misses += 1
+        # counted for /api/metrics/ as well
+        metrics.add_total("game_cache_hits" if hit else "game_cache_misses")
+        if hit:
+            return snapshot
+
+        snapshot = GameSnapshot.load(game)
+        with self._lock:
+            self._snapshots[game.id] = snapshot
+            self._snapshots.move_to_end(game.id)
+            while len(self._snapshots) > self.size:
+                self._snapshots.popitem(last=False)
+        return snapshot
+
+    def get_by_id(self, game_id):
+        return self.get(Game.objects.only("id", "tick", "revision").get(id=game_id))
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+
+    def stats(self):
+        return {"size": len(self._snapshots), "hits": self.hits, "misses": self.misses}
+
+
+cache = GameStateCache(settings.GAME_STATE_CACHE_SIZE)
@@ -1,8 +1,9 @@
 from collections import defaultdict, OrderedDict
 import math
 
+from . import metrics
 from .models import Movement
-from . import coords
+from .topology import Topology
 
 
 ATTACK_TO_DEFENSE_EFFICIENCY = 0.2
@@ -26,18 +27,29 @@ def zip_dicts(*dcts, default=None):
 
 class GameSimulator:
     def __init__(
-        self, tiles, movements, players,
+        self, tiles, movements, players, topology=None, movement_factory=Movement,
     ):
         self.tiles_by_id = {tile.id: tile for tile in tiles}
-        self.tiles_by_coords = {tile.coords: tile for tile in self.tiles_by_id.values()}
+        self.topology = topology or Topology.for_tiles(self.tiles_by_id.values())
+        self._tile_indices = {
+            tile.id: self.topology.index(tile.coords)
+            for tile in self.tiles_by_id.values()
+        }
+        self.tiles_by_index = {
+            index: self.tiles_by_id[tile_id]
+            for tile_id, index in self._tile_indices.items()
+        }
 
         self.players_by_id = {player.id: player for player in players}
         self._player_bosses = {}  # player id -> set of player ids
 
+        self.movement_factory = movement_factory
+
         self.movements_by_id = {}
         self.movements_by_path = {}  # (source id, target id) -> movement
         self.movements_by_source = defaultdict(set)
         self.movements_by_next = defaultdict(set)
+        self._next_tile_ids = {}  # movement id -> next tile id
         self._total_outgoing_by_tile = {}  # tile id -> outgoing sum
 
         for movement in movements:
@@ -78,12 +90,13 @@ class GameSimulator:
         )
 
     def get_movement_next_tile(self, movement):
-        source_tile = self.tiles_by_id[movement.source_id]
-        target_tile = self.tiles_by_id[movement.target_id]
-        next_tile = self.tiles_by_coords[
-            coords.next_on_path(source_tile.coords, target_tile.coords,)
-        ]
-        return next_tile
+        if movement.id in self._next_tile_ids:
+            return self.tiles_by_id[self._next_tile_ids[movement.id]]
+        next_index = self.topology.next_hop(
+            self._tile_indices[movement.source_id],
+            self._tile_indices[movement.target_id],
+        )
+        return self.tiles_by_index[next_index]
 
     def get_movement_owner(self, movement):
         return self.tiles_by_id[movement.source_id].owner_id
@@ -95,7 +108,9 @@ class GameSimulator:
             movement.amount = amount
             self._movements_to_be_updated[movement.id] = True
         else:
-            movement = Movement(source_id=path[0], target_id=path[1], amount=amount,)
+            movement = self.movement_factory(
+                source_id=path[0], target_id=path[1], amount=amount,
+            )
             self.movements_to_be_created.append(movement)
         self.add_movement(movement)
 
@@ -110,6 +125,7 @@ class GameSimulator:
         self.movements_by_path[path] = movement
         self.movements_by_source[movement.source_id].add(movement)
         self.movements_by_next[next_tile.id].add(movement)
+        self._next_tile_ids[movement.id] = next_tile.id
 
     def delete_movement(self, movement):
         next_tile = self.get_movement_next_tile(movement)
@@ -122,6 +138,7 @@ class GameSimulator:
         del self.movements_by_id[movement.id]
         self.movements_by_source[movement.source_id].remove(movement)
         self.movements_by_next[next_tile.id].remove(movement)
+        del self._next_tile_ids[movement.id]
 
         if movement.id in self._movements_to_be_updated:
             del self._movements_to_be_updated[movement.id]
@@ -185,30 +202,30 @@ class GameSimulator:
         return self._player_bosses[player_id]
 
     def simulate(self):
-        self.simulate_battles()
-        self.simulate_owner_changes()
-        self.simulate_movements()
+        with metrics.phase("battles"):
+            self.simulate_battles()
+        with metrics.phase("owner_changes"):
+            self.simulate_owner_changes()
+        with metrics.phase("movements"):
+            self.simulate_movements()
 
     def simulate_battles(self):
         tile_defending_armies = {}  # tile id -> amount
         tile_attacking_armies = {}  # tile id -> source tile id -> amount
 
-        # intially all armies defend
-        for tile in self.tiles_by_id.values():
-            tile_defending_armies[tile.id] = tile.army
+        # intially all armies defend, only tiles touched by movements matter
+        for movement in self.movements_by_id.values():
+            for tile_id in (movement.source_id, self._next_tile_ids[movement.id]):
+                if tile_id not in tile_defending_armies:
+                    tile_defending_armies[tile_id] = self.tiles_by_id[tile_id].army
 
         # dispatch armies, gather incoming movements
         for movement in self.movements_by_id.values():
-            source_tile = self.tiles_by_id[movement.source_id]
-            target_tile = self.tiles_by_id[movement.target_id]
             movement_amount = min(
                 movement.amount, tile_defending_armies[movement.source_id]
             )
             tile_defending_armies[movement.source_id] -= movement_amount
-            next_tile_coords = coords.next_on_path(
-                source_tile.coords, target_tile.coords
-            )
-            next_tile = self.tiles_by_coords[next_tile_coords]
+            next_tile = self.get_movement_next_tile(movement)
             _add_to_dict_entry(
                 tile_attacking_armies,
                 (next_tile.id, movement.source_id),
@@ -315,9 +332,7 @@ class GameSimulator:
         for movement in list(self.movements_by_id.values()):
             source_tile = self.tiles_by_id[movement.source_id]
             target_tile = self.tiles_by_id[movement.target_id]
-            next_tile = self.tiles_by_coords[
-                coords.next_on_path(source_tile.coords, target_tile.coords,)
-            ]
+            next_tile = self.get_movement_next_tile(movement)
             amount = min(
                 source_tile.army - armies_out[movement.source_id], movement.amount
             )
@@ -0,0 +1,303 @@
+"""
+Tick by tick history of games, for replays and spectators.
+
+Every simulated tick appends a `HistoryFrame` with tiles and movements the
+tick changed, and every GAME_HISTORY_KEYFRAME_INTERVAL-th tick one with the
+whole board. Any tick is rebuilt from the nearest keyframe before it and at
+most interval - 1 frames of changes, see `reconstruct`.
+
+Changes made outside of ticks - players joining and skipped ticks, counted
+by `Game.revision` - have no frames. The tick after them records a keyframe
+instead, flagged as rebased: it can't be derived from the previous frame.
+
+Frames also log orders accepted right before their tick, and a checksum of
+what the tick changed, so ticks can be simulated again and verified - see
+`overthrow.games.replay`.
+
+Frames refer to tiles by their dense index. Each is a header and arrays of
+fixed size records, compressed with zlib:
+players: player ids, owners are positions in this list (-1 for no owner)
+tiles: (index, owner, army) of changed tiles, all in keyframes
+movements: (source, target, amount) of new and changed movements, all in keyframes
+removed: (source, target) of deleted movements
+orders: (source, target, amount) set by orders before the tick, 0 for deleted
+"""
+from collections import namedtuple
+import struct
+import uuid
+import zlib
+
+from django.conf import settings
+import numpy as np
+
+from .models import HistoryFrame
+from .topology import Topology
+
+
+# keyframe and rebased flags, checksum, number of players, tiles, movements,
+# removed movements and orders
+HEADER = struct.Struct("<??IIIIII")
+PLAYER = np.dtype("V16")
+TILE = np.dtype([("index", "<i4"), ("owner", "<i4"), ("army", "<i8")])
+MOVEMENT = np.dtype([("source", "<i4"), ("target", "<i4"), ("amount", "<i8")])
+PATH = np.dtype([("source", "<i4"), ("target", "<i4")])
+ARRAYS = (PLAYER, TILE, MOVEMENT, PATH, MOVEMENT)
+
+Frame = namedtuple(
+    "Frame",
+    [
+        "keyframe",
+        "rebased",
+        "checksum",
+        "players",
+        "tiles",
+        "movements",
+        "removed",
+        "orders",
+    ],
+)
+
+
+def enabled():
+    return settings.GAME_HISTORY_KEYFRAME_INTERVAL > 0
+
+
+def is_keyframe(tick):
+    return tick % settings.GAME_HISTORY_KEYFRAME_INTERVAL == 0
+
+
+def needs_whole_board(game, ticks):
+    """ Whether simulating the ticks records a keyframe, for which all tiles are needed """
+    if is_rebased(game):
+        return True
+    first = game.tick if game.tick == 0 else game.tick + 1
+    return any(is_keyframe(tick) for tick in range(first, game.tick + ticks + 1))
+
+
+def is_rebased(game):
+    """ Whether the board changed outside of ticks since the last frame """
+    return game.revision > 0 and game.tick > 0
+
+
+def encode(frame):
+    arrays = frame[3:]
+    header = HEADER.pack(
+        frame.keyframe,
+        frame.rebased,
+        frame.checksum,
+        *(len(array) for array in arrays),
+    )
+    return zlib.compress(header + b"".join(array.tobytes() for array in arrays))
+
+
+def decode(data):
+    data = zlib.decompress(data)
+    keyframe, rebased, checksum, *counts = HEADER.unpack_from(data)
+    offset = HEADER.size
+    arrays = []
+    for dtype, count in zip(ARRAYS, counts):
+        arrays.append(np.frombuffer(data, dtype, count, offset))
+        offset += dtype.itemsize * count
+    return Frame(keyframe, rebased, checksum, *arrays)
+
+
+def movement_array(paths):
+    """ {(source, target): amount} as records, ordered by paths """
+    array = np.zeros(len(paths), dtype=MOVEMENT)
+    sorted_paths = sorted(paths)
+    array["source"] = [source for source, target in sorted_paths]
+    array["target"] = [target for source, target in sorted_paths]
+    array["amount"] = [paths[path] for path in sorted_paths]
+    return array
+
+
+def checksum(tiles, movements):
+    """ Of tiles changed by a tick (all for keyframes) and all movements after it """
+    return zlib.crc32(movements.tobytes(), zlib.crc32(tiles.tobytes()))
+
+
+class Recorder:
+    """
+    Frames of ticks simulated on a `GameState`, to be saved along with it.
+    Keyframes are recorded only if the state has all tiles loaded.
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self.frames = []
+        self.checksum = None  # of the last recorded tick
+        self._rebased = is_rebased(state.game)
+        self._tiles = self._tile_array()
+        self._paths = self._path_amounts()
+        if state.game.tick == 0 and self._can_keyframe(0):
+            self._append(0, True, self._tiles, self._paths, self._paths, [], {})
+
+    def _can_keyframe(self, tick):
+        return is_keyframe(tick) and len(self.state.tiles) == self.state.topology.size
+
+    def _tile_array(self):
+        tiles = self.state.tiles
+        array = np.zeros(len(tiles), dtype=TILE)
+        array["index"] = [tile.id for tile in tiles]
+        array["owner"] = [
+            -1 if tile.owner_id is None else tile.owner_id for tile in tiles
+        ]
+        array["army"] = [tile.army for tile in tiles]
+        return array
+
+    def _path_amounts(self):
+        return {(m.source_id, m.target_id): m.amount for m in self.state.movements}
+
+    def record(self, orders=None, keyframe=None):
+        """
+        Append frame of the tick just simulated. Orders are changes of
+        movements made before the tick, {(source, target): amount or 0}.
+        Unless told, it's a keyframe every GAME_HISTORY_KEYFRAME_INTERVAL ticks
+        and after changes made outside of ticks.
+        """
+        tick = self.state.game.tick + self.state.unsaved_ticks
+        tiles = self._tile_array()
+        paths = self._path_amounts()
+        rebased, self._rebased = self._rebased, False
+        if keyframe is None:
+            keyframe = rebased or self._can_keyframe(tick)
+        if keyframe:
+            self._append(
+                tick, True, tiles, paths, paths, [], orders or {}, rebased=rebased
+            )
+        else:
+            changed = (tiles["owner"] != self._tiles["owner"]) | (
+                tiles["army"] != self._tiles["army"]
+            )
+            self._append(
+                tick,
+                False,
+                tiles[changed],
+                paths,
+                {
+                    path: amount
+                    for path, amount in paths.items()
+                    if self._paths.get(path) != amount
+                },
+                [path for path in self._paths if path not in paths],
+                orders or {},
+            )
+        self._tiles = tiles
+        self._paths = paths
+
+    def _append(
+        self,
+        tick,
+        keyframe,
+        tiles,
+        paths,
+        changed_paths,
+        removed,
+        orders,
+        rebased=False,
+    ):
+        """
+        Tiles changed by the tick (all in keyframes), {path: amount} of all
+        movements and of changed ones, removed paths and applied orders.
+        """
+        movements = movement_array(paths)
+        self.checksum = checksum(tiles, movements)
+        removed_paths = np.array(sorted(removed), dtype=np.int32).reshape(-1, 2)
+        frame = Frame(
+            keyframe,
+            rebased,
+            self.checksum,
+            np.frombuffer(
+                b"".join(i.bytes for i in self.state.player_ids), dtype=PLAYER
+            ),
+            tiles,
+            movement_array(changed_paths),
+            np.ascontiguousarray(removed_paths).view(PATH).ravel(),
+            movement_array(orders),
+        )
+        self.frames.append(
+            HistoryFrame(
+                game_id=self.state.game.id,
+                tick=tick,
+                keyframe=keyframe,
+                data=encode(frame),
+            )
+        )
+
+    def take_frames(self):
+        frames = self.frames
+        self.frames = []
+        return frames
+
+
+def path_amounts(movements):
+    """ Movement records as {(source, target): amount} """
+    return dict(
+        zip(
+            zip(movements["source"].tolist(), movements["target"].tolist()),
+            movements["amount"].tolist(),
+        )
+    )
+
+
+def reconstruct(game, tick):
+    """
+    Board of the game at a past tick, None if the history doesn't cover it.
+    Tiles are columns as in `serializers.columnar_tiles`, movements are
+    columns of tile indices and amounts.
+    """
+    keyframe_tick = (
+        game.history.filter(keyframe=True, tick__lte=tick)
+        .order_by("-tick")
+        .values_list("tick", flat=True)
+        .first()
+    )
+    if keyframe_tick is None:
+        return None
+    frames = list(
+        game.history.filter(tick__gte=keyframe_tick, tick__lte=tick)
+        .order_by("tick")
+        .values_list("data", flat=True)
+    )
+    if len(frames) != tick - keyframe_tick + 1:
+        return None  # some ticks were not recorded
+
+    size = Topology.for_game(game).size
+    players = []
+    player_positions = {}
+    owners = np.full(size, -1, dtype=np.int64)
+    armies = np.zeros(size, dtype=np.int64)
+    paths = {}
+    for data in frames:
+        frame = decode(data)
+        # frame's owner -> position in players, the last item is for no owner (-1)
+        remap = []
+        for player in frame.players:
+            player_id = uuid.UUID(bytes=player.tobytes())
+            remap.append(player_positions.setdefault(player_id, len(players)))
+            if remap[-1] == len(players):
+                players.append(player_id)
+        remap.append(-1)
+        owners[frame.tiles["index"]] = np.array(remap, dtype=np.int64)[
+            frame.tiles["owner"]
+        ]
+        armies[frame.tiles["index"]] = frame.tiles["army"]
+        if frame.keyframe:
+            paths = {}
+        for path in frame.removed.tolist():
+            paths.pop(path, None)
+        paths.update(path_amounts(frame.movements))
+
+    sorted_paths = sorted(paths)
+    return {
+        "tick": tick,
+        "radius": game.radius,
+        "players": players,
+        "owners": owners.tolist(),
+        "armies": armies.tolist(),
+        "movements": {
+            "sources": [source for source, target in sorted_paths],
+            "targets": [target for source, target in sorted_paths],
+            "amounts": [paths[path] for path in sorted_paths],
+        },
+    }
@@ -0,0 +1,78 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, Sum
+from django.db.models.functions import Length
+from django.test.utils import override_settings
+
+from overthrow.games import history
+from overthrow.games.benchmark import delete_games, generate_game
+from overthrow.games.models import HistoryFrame
+
+
+class Command(BaseCommand):
+    help = "Measure size of the tick history and time of rebuilding ticks from it"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--radius", type=int, default=20)
+        parser.add_argument("--ticks", type=int, default=1000)
+        parser.add_argument("--keyframe-interval", type=int, default=50)
+        parser.add_argument("--samples", type=int, default=100)
+
+    def handle(self, radius, ticks, keyframe_interval, samples, **kwargs):
+        game = generate_game(radius, seed=radius)
+        try:
+            with override_settings(GAME_HISTORY_KEYFRAME_INTERVAL=keyframe_interval):
+                started = time.monotonic()
+                for tick in range(ticks):
+                    game.simulate()
+                self.stdout.write(
+                    f"{game.tiles.count()} tiles, simulated {ticks} ticks "
+                    f"in {time.monotonic() - started:.1f}s"
+                )
+            self.report_size(game, ticks)
+            self.report_latency(game, ticks, keyframe_interval, samples)
+        finally:
+            delete_games([game])
+
+    def report_size(self, game, ticks):
+        sizes = {
+            row["keyframe"]: row
+            for row in HistoryFrame.objects.filter(game=game)
+            .annotate(size=Length("data"))
+            .values("keyframe")
+            .annotate(count=Count("id"), total=Sum("size"), average=Avg("size"))
+        }
+        for keyframe, name in [(True, "keyframes"), (False, "deltas")]:
+            row = sizes.get(keyframe, {"count": 0, "total": 0, "average": 0})
+            self.stdout.write(
+                f"{name}: {row['count']}, {row['total']}B in total, "
+                f"{row['average'] or 0:.0f}B on average"
+            )
+        total = sum(row["total"] for row in sizes.values())
+        if True in sizes:
+            whole_boards = sizes[True]["average"] * (ticks + 1)
+            self.stdout.write(
+                f"history: {total}B, {total / whole_boards:.1%} of a whole board per tick"
+            )
+
+    def report_latency(self, game, ticks, keyframe_interval, samples):
+        rng = random.Random(0)
+        # the last tick before a keyframe is the worst case
+        worst = max(
+            [t for t in range(ticks + 1) if (t + 1) % keyframe_interval == 0],
+            default=ticks,
+        )
+        picked = [worst] + [rng.randrange(ticks + 1) for i in range(samples)]
+        timings = []
+        for tick in picked:
+            started = time.monotonic()
+            board = history.reconstruct(game, tick)
+            timings.append(time.monotonic() - started)
+            assert board is not None, tick
+        self.stdout.write(
+            f"rebuilding tick {worst}: {timings[0] * 1000:.1f}ms, "
+            f"random ticks: {sum(timings[1:]) / samples * 1000:.1f}ms on average, "
+            f"{sorted(timings[1:])[int(samples * 0.95)] * 1000:.1f}ms p95"
+        )
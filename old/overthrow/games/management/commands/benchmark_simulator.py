@@ -0,0 +1,134 @@
+import json
+import platform
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from overthrow.games import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Time phases of the game simulator on synthetic boards, and the load "
+        "and write path of Game.simulate. Results can be saved as JSON and "
+        "compared with a baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--radius", type=int, nargs="+", default=[10, 50, 100, 200])
+        parser.add_argument(
+            "--database-radius",
+            type=int,
+            nargs="*",
+            default=[10, 30],
+            help="Boards to benchmark Game.simulate on, they are saved to the database",
+        )
+        parser.add_argument("--players", type=int, default=8)
+        parser.add_argument("--layout", choices=benchmark.LAYOUTS, default="random")
+        parser.add_argument("--movement-density", type=float, default=0.5)
+        parser.add_argument("--path-length", type=int, default=3)
+        parser.add_argument("--ticks", type=int, default=3, help="Median is taken")
+        parser.add_argument(
+            "--simulator",
+            default=settings.GAME_SIMULATOR,
+            help="Empty picks one by the number of loaded tiles, as in ticks",
+        )
+        parser.add_argument("--output", help="Save results as JSON")
+        parser.add_argument("--baseline", help="Compare with JSON saved before")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="Fraction by which a timing may be slower than in the baseline",
+        )
+        parser.add_argument(
+            "--min-difference",
+            type=float,
+            default=0.005,
+            help="Seconds, smaller slowdowns are ignored as noise",
+        )
+
+    def handle(self, **options):
+        simulator_class = None
+        if options["simulator"]:
+            simulator_class = import_string(options["simulator"])
+        board = {
+            "player_count": options["players"],
+            "layout": options["layout"],
+            "movement_density": options["movement_density"],
+            "path_length": options["path_length"],
+        }
+        results = {}
+        for radius in options["radius"]:
+            results[f"simulator radius={radius}"] = self.benchmark_simulator(
+                radius, board, simulator_class, options["ticks"]
+            )
+        for radius in options["database_radius"]:
+            results[f"database radius={radius}"] = self.benchmark_database(
+                radius, board, simulator_class, options["ticks"]
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(
+                    {
+                        "simulator": options["simulator"],
+                        "board": board,
+                        "python": sys.version.split()[0],
+                        "machine": platform.machine(),
+                        "results": results,
+                    },
+                    f,
+                    indent=2,
+                )
+        if options["baseline"]:
+            self.compare(results, options)
+
+    def benchmark_simulator(self, radius, board, simulator_class, ticks):
+        state = benchmark.synthetic_state(radius, seed=radius, **board)
+        tiles, movements = len(state.tiles), len(state.movements)
+        timings = benchmark.median_timings(
+            [benchmark.time_phases(state, simulator_class) for i in range(ticks)]
+        )
+        self.report(f"simulator radius={radius}", tiles, movements, timings)
+        return {"tiles": tiles, "movements": movements, **timings}
+
+    def benchmark_database(self, radius, board, simulator_class, ticks):
+        state = benchmark.synthetic_state(radius, seed=radius, **board)
+        game = benchmark.save_synthetic_game(state)
+        try:
+            timings = benchmark.median_timings(
+                [
+                    benchmark.time_database_tick(game, simulator_class)
+                    for i in range(ticks)
+                ]
+            )
+        finally:
+            benchmark.delete_games([game])
+        self.report(
+            f"database radius={radius}", len(state.tiles), len(state.movements), timings
+        )
+        return {"tiles": len(state.tiles), "movements": len(state.movements), **timings}
+
+    def report(self, case, tiles, movements, timings):
+        self.stdout.write(
+            f"{case}, {tiles} tiles, {movements} movements: "
+            + ", ".join(f"{name} {seconds:.4f}s" for name, seconds in timings.items())
+        )
+
+    def compare(self, results, options):
+        with open(options["baseline"]) as f:
+            baseline = json.load(f)["results"]
+        found = benchmark.regressions(
+            baseline, results, options["threshold"], options["min_difference"]
+        )
+        for case, metric, before, seconds in found:
+            self.stdout.write(
+                f"{case} {metric}: {before:.4f}s -> {seconds:.4f}s "
+                f"({seconds / before - 1:+.0%})"
+            )
+        if found:
+            raise CommandError(f"{len(found)} timings regressed")
+        self.stdout.write("no regressions")
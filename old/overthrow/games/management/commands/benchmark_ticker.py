@@ -0,0 +1,60 @@
+"""
+Throughput of the ticker by number of worker processes. The pool only helps
+with more than one CPU, on a single one tickers simulate games serially
+whatever the number of workers.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from overthrow.games.benchmark import delete_games, generate_game
+from overthrow.games.models import Game
+from overthrow.games.ticker import Ticker
+
+
+class Command(BaseCommand):
+    help = "Measure how many due games per second the ticker simulates"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--games", type=int, default=200)
+        parser.add_argument("--radius", type=int, default=5)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            nargs="+",
+            default=sorted({1, 2, 4, os.cpu_count()}),
+            help="Worker counts to compare",
+        )
+
+        parser.add_argument("--batch-size", type=int, default=1)
+
+    def handle(self, games, radius, workers, batch_size, **kwargs):
+        generated = [generate_game(radius, seed=i) for i in range(games)]
+        try:
+            baseline = None
+            for worker_count in workers:
+                self.make_due(generated)
+                ticker = Ticker(workers=worker_count, batch_size=batch_size)
+                started = time.monotonic()
+                ticker.run_once()
+                duration = time.monotonic() - started
+                ticker.close()
+
+                throughput = games / duration
+                baseline = baseline or throughput
+                self.stdout.write(
+                    f"{worker_count} workers ({ticker.workers} used): "
+                    f"{throughput:.1f} games/s, "
+                    f"speedup {throughput / baseline:.2f}"
+                )
+        finally:
+            delete_games(generated)
+
+    def make_due(self, games):
+        """ Set clocks so that every game is exactly one tick behind """
+        for game in Game.objects.filter(id__in=[game.id for game in games]):
+            game.started_at = timezone.now() - settings.TICK_DURATION * (game.tick + 1)
+            game.save(update_fields=["started_at"])
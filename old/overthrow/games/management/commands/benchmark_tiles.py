@@ -0,0 +1,50 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from overthrow.games.benchmark import delete_games, generate_game
+from overthrow.games.serializers import TileSerializer, columnar_tiles
+
+
+class Command(BaseCommand):
+    help = "Compare size and time of the tile list with serializer and columnar formats"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--radius", type=int, nargs="+", default=[10, 30, 60])
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, radius, repeat, **kwargs):
+        formats = [
+            (
+                "serializer",
+                lambda game: TileSerializer(game.tiles.all(), many=True).data,
+            ),
+            ("columnar", columnar_tiles),
+        ]
+        for game_radius in radius:
+            game = generate_game(game_radius, movement_count=0, seed=game_radius)
+            try:
+                results = []
+                for name, build in formats:
+                    duration, content = self.measure(build, game, repeat)
+                    results.append(
+                        f"{name} {duration:.3f}s {len(content)}B "
+                        f"{len(gzip.compress(content))}B gzipped"
+                    )
+                self.stdout.write(
+                    f"radius {game_radius}, {game.tiles.count()} tiles: "
+                    + ", ".join(results)
+                )
+            finally:
+                delete_games([game])
+
+    def measure(self, build, game, repeat):
+        """ Best time of building and rendering the list, and the body """
+        timings = []
+        for i in range(repeat):
+            started = time.monotonic()
+            content = JSONRenderer().render(build(game))
+            timings.append(time.monotonic() - started)
+        return min(timings), content
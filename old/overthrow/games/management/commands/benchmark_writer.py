@@ -0,0 +1,89 @@
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from overthrow.games.benchmark import delete_games, generate_game
+from overthrow.games.models import Movement
+from overthrow.games.state import StateDiff
+from overthrow.games.writers import write_diff_copy, write_diff_orm
+
+
+class Command(BaseCommand):
+    help = "Compare the time of writing tick results with ORM and COPY writers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows", type=int, nargs="+", default=[1000, 10000, 100000],
+        )
+
+    def handle(self, rows, **kwargs):
+        writers = [("orm", write_diff_orm)]
+        if connection.vendor == "postgresql":
+            writers.append(("copy", write_diff_copy))
+
+        for row_count in rows:
+            game = self.generate_game(row_count)
+            try:
+                diff = self.random_diff(game, row_count)
+                timings = " ".join(
+                    f"{name} {self.measure(writer, diff):.3f}s"
+                    for name, writer in writers
+                )
+                self.stdout.write(f"{row_count} rows: {timings}")
+            finally:
+                delete_games([game])
+
+    def generate_game(self, row_count):
+        """ Game with at least row_count tiles and row_count movements """
+        radius = 1
+        while 3 * radius * (radius + 1) + 1 < row_count:
+            radius += 1
+        return generate_game(radius, movement_count=row_count, seed=row_count)
+
+    def random_diff(self, game, row_count):
+        """ Changed tiles and movements, row_count of each """
+        rng = random.Random(row_count)
+        players = list(game.players.values_list("id", flat=True)) + [None]
+        tiles = list(game.tiles.values_list("id", flat=True))
+        movements = list(
+            Movement.objects.filter(source__game=game).values_list(
+                "id", "source_id", "target_id"
+            )
+        )
+        third = row_count // 3
+        paths = {(source, target) for movement_id, source, target in movements}
+        created = []
+        while len(created) < row_count - 2 * third:
+            source, target = rng.sample(tiles, 2)
+            if (source, target) not in paths:
+                paths.add((source, target))
+                created.append(
+                    (uuid.uuid4(), source, target, rng.randrange(1, 20), game.tick + 1)
+                )
+        return StateDiff(
+            tiles=[
+                (tile_id, rng.choice(players), rng.randrange(100), game.tick + 1)
+                for tile_id in tiles[:row_count]
+            ],
+            created=created,
+            updated=[
+                (movement_id, source, rng.randrange(1, 20), game.tick + 1)
+                for movement_id, source, target in movements[:third]
+            ],
+            deleted=[
+                (movement_id, game.id, rng.choice(players), game.tick + 1)
+                for movement_id, source, target in movements[third:][:third]
+            ],
+        )
+
+    def measure(self, writer, diff):
+        """ Time of writing the diff, rolled back afterwards """
+        with transaction.atomic():
+            started = time.monotonic()
+            writer(diff)
+            duration = time.monotonic() - started
+            transaction.set_rollback(True)
+        return duration
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from overthrow.games.models import Game
+from overthrow.games.replay import replay
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate recorded ticks of a game again, in memory, timing them and "
+        "verifying results against the recorded checksums"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("game_id")
+        parser.add_argument("--from-tick", type=int, default=0)
+        parser.add_argument("--to-tick", type=int, default=None)
+        parser.add_argument(
+            "--keep-going",
+            action="store_true",
+            help="Don't stop at the first tick with a different result",
+        )
+
+    def handle(self, game_id, from_tick, to_tick, keep_going, verbosity, **kwargs):
+        try:
+            game = Game.objects.get(id=game_id)
+        except (Game.DoesNotExist, ValueError):
+            raise CommandError(f"no game {game_id}")
+
+        timings = []
+        mismatches = []
+        try:
+            for replayed in replay(game, from_tick=from_tick, to_tick=to_tick):
+                timings.append(replayed.duration)
+                matches = replayed.checksum == replayed.expected
+                if verbosity >= 2 or not matches:
+                    self.stdout.write(
+                        f"tick {replayed.tick}: {replayed.duration * 1000:.2f}ms"
+                        + ("" if matches else ", differs from the recorded one")
+                    )
+                if not matches:
+                    mismatches.append(replayed.tick)
+                    if not keep_going:
+                        break
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if timings:
+            ordered = sorted(timings)
+            self.stdout.write(
+                f"replayed {len(timings)} ticks in {sum(timings):.3f}s: "
+                f"{sum(timings) / len(timings) * 1000:.2f}ms on average, "
+                f"{ordered[int(len(ordered) * 0.95)] * 1000:.2f}ms p95, "
+                f"{ordered[-1] * 1000:.2f}ms max"
+            )
+        if mismatches:
+            raise CommandError(
+                f"results of {len(mismatches)} ticks differ, first at {mismatches[0]}"
+            )
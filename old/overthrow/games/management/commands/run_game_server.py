@@ -0,0 +1,54 @@
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from overthrow.games import server
+
+
+class Command(BaseCommand):
+    help = "Keep games in memory, simulate their ticks and write results behind"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--name", help="Identity of this server, defaults to host:game-server",
+        )
+        parser.add_argument(
+            "--games", nargs="+", help="Ids of games to run, all free games by default",
+        )
+        parser.add_argument(
+            "--socket",
+            default=settings.GAME_SERVER_SOCKET,
+            help="Unix socket to receive orders on, GAME_SERVER_SOCKET by default",
+        )
+        parser.add_argument(
+            "--flush-interval",
+            type=float,
+            default=1.0,
+            help="Time between writes to the database [s]",
+        )
+        parser.add_argument(
+            "--max-lag",
+            type=int,
+            default=10,
+            help="Number of ticks a game may get ahead of the database",
+        )
+
+    def handle(self, name, games, socket, flush_interval, max_lag, verbosity, **kwargs):
+        handler = logging.StreamHandler(self.stdout)
+        server.logger.addHandler(handler)
+        server.logger.setLevel(logging.INFO if verbosity > 0 else logging.WARNING)
+
+        runner = server.GameServer(
+            name=name, game_ids=games, flush_interval=flush_interval, max_lag=max_lag
+        )
+        try:
+            runner.load()
+            if socket:
+                runner.serve(socket)
+            runner.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            runner.close()
+            server.logger.removeHandler(handler)
@@ -0,0 +1,88 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from overthrow.games import metrics, ticker
+
+
+class Command(BaseCommand):
+    help = "Simulate ticks of all games as they become due"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--policy",
+            choices=ticker.POLICIES,
+            default=ticker.BATCH,
+            help="What to do with games that are more than one tick behind",
+        )
+        parser.add_argument(
+            "--max-ticks",
+            type=int,
+            default=None,
+            help="Limit of ticks simulated at once in batch policy",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=1.0, help="Maximal idle sleep [s]",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes simulating games in parallel, "
+            "1 on a single CPU",
+        )
+        parser.add_argument(
+            "--name", help="Identity of this ticker, defaults to host:pid",
+        )
+        parser.add_argument(
+            "--claim-size",
+            type=int,
+            default=100,
+            help="Number of due games taken by this ticker at once",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1,
+            help="Number of games loaded, simulated and written together",
+        )
+        parser.add_argument("--once", action="store_true")
+
+    def handle(
+        self,
+        policy,
+        max_ticks,
+        interval,
+        workers,
+        name,
+        claim_size,
+        batch_size,
+        once,
+        verbosity,
+        **kwargs,
+    ):
+        handler = logging.StreamHandler(self.stdout)
+        for logger in (ticker.logger, metrics.logger):
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO if verbosity > 0 else logging.WARNING)
+
+        runner = ticker.Ticker(
+            policy=policy,
+            max_ticks=max_ticks,
+            interval=interval,
+            workers=workers,
+            name=name,
+            claim_size=claim_size,
+            batch_size=batch_size,
+        )
+        try:
+            if once:
+                runner.run_once()
+            else:
+                runner.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            runner.close()
+            for logger in (ticker.logger, metrics.logger):
+                logger.removeHandler(handler)
@@ -0,0 +1,329 @@
+"""
+Tick instrumentation, to see which phase of a tick is slow and why.
+
+With TICK_METRICS on, every `Game.simulate_many` call (and the game locking
+done by its callers) is measured: wall time of each phase - waiting for
+locks, loading rows, simulation steps, history, writing - and numbers of
+rows loaded and changed. A measurement is logged and added to histograms of
+this process, one per phase and bucket of game size (tiles of all games in
+the call), served in the Prometheus text format at /api/metrics/.
+
+Totals of other events, like reads of the game state cache, are counted by
+`add_total` in any process, web processes included.
+
+Tickers run in other processes than the web server, so with TICK_METRICS_DIR
+set each process also keeps its histograms in a file there and the endpoint
+serves the sum of all files. Processes only counting totals write the file
+at most every METRICS_DUMP_INTERVAL. Files of processes that are gone are removed:
+on the same host when their pid no longer runs, from other hosts when they
+were not written for TICK_METRICS_FILE_EXPIRY.
+
+When off, a hook costs a thread local lookup.
+"""
+from collections import defaultdict
+import contextlib
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+
+from django.conf import settings
+
+from .files import atomic_write
+
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of histogram buckets [s]
+DURATION_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    math.inf,
+)
+# upper bounds of game size buckets [tiles]
+SIZE_BUCKETS = (1000, 10000, 100000, math.inf)
+# totals counted by `add_total`, name -> help, exported as overthrow_<name>_total
+TOTALS = {
+    "game_cache_hits": "Reads of game states served from the per process cache",
+    "game_cache_misses": "Reads of game states that loaded them from the database",
+}
+# [s]
+METRICS_DUMP_INTERVAL = 1.0
+
+_local = threading.local()
+_null = contextlib.nullcontext()
+_last_dump = 0.0
+
+
+def enabled():
+    return settings.TICK_METRICS
+
+
+def size_bucket(tiles):
+    """ Label of the bucket for a number of tiles """
+    return _label(next(bound for bound in SIZE_BUCKETS if tiles <= bound))
+
+
+def _label(bound):
+    return "+Inf" if bound == math.inf else str(bound)
+
+
+class Measurement:
+    """ Phase durations [s] and counts of a single measured call """
+
+    def __init__(self, games):
+        self.games = len(games)
+        self.tiles = sum(3 * game.radius * (game.radius + 1) + 1 for game in games)
+        self.size = size_bucket(self.tiles)
+        self.durations = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] += time.perf_counter() - started
+
+    def summary(self):
+        durations = ", ".join(
+            f"{name} {duration:.3f}s" for name, duration in self.durations.items()
+        )
+        counts = ", ".join(f"{name} {count}" for name, count in self.counts.items())
+        return f"{self.games} games ({self.tiles} tiles): {durations}; {counts}"
+
+
+def current():
+    """ Measurement in progress in this thread, None if there is none """
+    return getattr(_local, "measurement", None)
+
+
+@contextlib.contextmanager
+def measure(games):
+    """
+    Measure the enclosed code. Nested measurements are merged into the
+    outermost one, which is recorded when it finishes without an error.
+    """
+    if not enabled() or current() is not None:
+        yield current()
+        return
+    measurement = _local.measurement = Measurement(games)
+    try:
+        with measurement.phase("total"):
+            yield measurement
+    finally:
+        _local.measurement = None
+    logger.info("tick: %s", measurement.summary())
+    registry.observe(measurement)
+    if settings.TICK_METRICS_DIR:
+        registry.dump(_process_path())
+
+
+def phase(name):
+    """ Context timing a phase of the current measurement, if there is one """
+    measurement = current()
+    if measurement is None:
+        return _null
+    return measurement.phase(name)
+
+
+def count(name, value):
+    measurement = current()
+    if measurement is not None:
+        measurement.counts[name] += value
+
+
+def add_total(name, value=1):
+    """ Count an event of this process, one of TOTALS """
+    global _last_dump
+    if not enabled():
+        return
+    registry.add_total(name, value)
+    if settings.TICK_METRICS_DIR:
+        now = time.monotonic()
+        if now - _last_dump >= METRICS_DUMP_INTERVAL:
+            _last_dump = now
+            registry.dump(_process_path())
+
+
+class Registry:
+    """
+    Histograms of phase durations and totals of counts, by game size.
+    Bucket counts are not cumulative, unlike in the rendered text.
+    """
+
+    def __init__(self):
+        self.buckets = {}  # (phase, size) -> [count per bucket]
+        self.sums = defaultdict(float)  # (phase, size) -> total duration
+        self.counts = defaultdict(int)  # (name, size) -> total
+        self.totals = defaultdict(int)  # name -> total, see `add_total`
+        self._lock = threading.Lock()
+
+    def observe(self, measurement):
+        with self._lock:
+            for name, duration in measurement.durations.items():
+                key = (name, measurement.size)
+                buckets = self.buckets.setdefault(key, [0] * len(DURATION_BUCKETS))
+                buckets[
+                    next(
+                        i
+                        for i, bound in enumerate(DURATION_BUCKETS)
+                        if duration <= bound
+                    )
+                ] += 1
+                self.sums[key] += duration
+            for name, value in measurement.counts.items():
+                self.counts[(name, measurement.size)] += value
+
+    def add_total(self, name, value):
+        with self._lock:
+            self.totals[name] += value
+
+    def merge(self, other):
+        for key, buckets in other.buckets.items():
+            merged = self.buckets.setdefault(key, [0] * len(DURATION_BUCKETS))
+            self.buckets[key] = [a + b for a, b in zip(merged, buckets)]
+        for key, value in other.sums.items():
+            self.sums[key] += value
+        for key, value in other.counts.items():
+            self.counts[key] += value
+        for name, value in other.totals.items():
+            self.totals[name] += value
+
+    def clear(self):
+        with self._lock:
+            self.buckets.clear()
+            self.sums.clear()
+            self.counts.clear()
+            self.totals.clear()
+
+    def to_json(self):
+        with self._lock:
+            return {
+                "phases": [
+                    [name, size, buckets, self.sums[(name, size)]]
+                    for (name, size), buckets in self.buckets.items()
+                ],
+                "counts": [
+                    [name, size, value] for (name, size), value in self.counts.items()
+                ],
+                "totals": dict(self.totals),
+            }
+
+    @classmethod
+    def from_json(cls, data):
+        registry = cls()
+        for name, size, buckets, total in data["phases"]:
+            registry.buckets[(name, size)] = buckets
+            registry.sums[(name, size)] = total
+        for name, size, value in data["counts"]:
+            registry.counts[(name, size)] = value
+        registry.totals.update(data.get("totals", {}))
+        return registry
+
+    def dump(self, path):
+        """ Write the file atomically, readers see either the old or the new one """
+        with atomic_write(path) as f:
+            json.dump(self.to_json(), f)
+
+    def render(self):
+        """ Prometheus text exposition format """
+        lines = [
+            "# HELP overthrow_tick_phase_seconds Wall time of a tick phase",
+            "# TYPE overthrow_tick_phase_seconds histogram",
+        ]
+        for (name, size), buckets in sorted(self.buckets.items()):
+            labels = f'phase="{name}",tiles_le="{size}"'
+            cumulative = 0
+            for bound, bucket in zip(DURATION_BUCKETS, buckets):
+                cumulative += bucket
+                lines.append(
+                    f'overthrow_tick_phase_seconds_bucket{{{labels},le="{_label(bound)}"}}'
+                    f" {cumulative}"
+                )
+            lines.append(
+                f"overthrow_tick_phase_seconds_sum{{{labels}}} {self.sums[(name, size)]}"
+            )
+            lines.append(f"overthrow_tick_phase_seconds_count{{{labels}}} {cumulative}")
+        lines += [
+            "# HELP overthrow_tick_rows_total Rows loaded and changed by ticks",
+            "# TYPE overthrow_tick_rows_total counter",
+        ]
+        for (name, size), value in sorted(self.counts.items()):
+            lines.append(
+                f'overthrow_tick_rows_total{{kind="{name}",tiles_le="{size}"}} {value}'
+            )
+        for name, help_text in TOTALS.items():
+            lines += [
+                f"# HELP overthrow_{name}_total {help_text}",
+                f"# TYPE overthrow_{name}_total counter",
+                f"overthrow_{name}_total {self.totals[name]}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _process_path():
+    return os.path.join(
+        settings.TICK_METRICS_DIR, f"{socket.gethostname()}-{os.getpid()}.json"
+    )
+
+
+def _pid_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # running, under another user
+    return True
+
+
+def _is_stale(path, name):
+    """ Whether the file was left by a process that is gone """
+    host, _, pid = name[: -len(".json")].rpartition("-")
+    if host == socket.gethostname() and pid.isdigit():
+        return not _pid_running(int(pid))
+    age = time.time() - os.stat(path).st_mtime
+    return age > settings.TICK_METRICS_FILE_EXPIRY.total_seconds()
+
+
+def collect():
+    """ Registry of this process, or of all processes with TICK_METRICS_DIR """
+    if not settings.TICK_METRICS_DIR:
+        return registry
+    merged = Registry()
+    try:
+        names = os.listdir(settings.TICK_METRICS_DIR)
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(settings.TICK_METRICS_DIR, name)
+        try:
+            if _is_stale(path, name):
+                os.remove(path)
+                continue
+            with open(path) as f:
+                merged.merge(Registry.from_json(json.load(f)))
+        except (OSError, ValueError):
+            continue  # replaced or being written
+    return merged
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:02
+
+from django.db import migrations, models
+from django.db.models import Max
+from django.db.models.functions import Abs, Greatest
+
+
+def set_radius(apps, schema_editor):
+    Game = apps.get_model('games', 'Game')
+    for game in Game.objects.all():
+        radius = game.tiles.aggregate(
+            radius=Max(Greatest(Abs('x'), Abs('y'), Abs('z')))
+        )['radius']
+        if radius is not None:
+            game.radius = radius
+            game.save(update_fields=['radius'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0004_auto_20200403_2231'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='radius',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(set_radius, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:07
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0005_game_radius'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='started_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
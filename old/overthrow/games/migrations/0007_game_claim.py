@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0006_game_started_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='claimed_by',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
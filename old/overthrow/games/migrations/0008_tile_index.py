@@ -0,0 +1,39 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+def set_index(apps, schema_editor):
+    """ Boards are full hexagons, so the dense order is the (x, y) order """
+    Game = apps.get_model('games', 'Game')
+    Tile = apps.get_model('games', 'Tile')
+    for game in Game.objects.all():
+        tiles = list(Tile.objects.filter(game=game).order_by('x', 'y'))
+        for index, tile in enumerate(tiles):
+            tile.index = index
+        Tile.objects.bulk_update(tiles, ['index'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0007_game_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tile',
+            name='index',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.RunPython(set_index, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tile',
+            name='index',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AddConstraint(
+            model_name='tile',
+            constraint=models.UniqueConstraint(fields=('game', 'index'), name='unique_index'),
+        ),
+    ]
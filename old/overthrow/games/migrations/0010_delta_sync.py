@@ -0,0 +1,45 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0009_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedMovement',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('movement_id', models.UUIDField()),
+                ('tick', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='movement',
+            name='changed_tick',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='tile',
+            name='changed_tick',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='tile',
+            index=models.Index(fields=['game', 'changed_tick'], name='tile_changes'),
+        ),
+        migrations.AddField(
+            model_name='deletedmovement',
+            name='game',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deleted_movements', to='games.Game'),
+        ),
+        migrations.AddIndex(
+            model_name='deletedmovement',
+            index=models.Index(fields=['game', 'tick'], name='deleted_movements_tick'),
+        ),
+    ]
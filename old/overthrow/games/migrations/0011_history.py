@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0010_delta_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoryFrame',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('tick', models.PositiveIntegerField()),
+                ('keyframe', models.BooleanField()),
+                ('data', models.BinaryField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history', to='games.Game')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='historyframe',
+            constraint=models.UniqueConstraint(fields=('game', 'tick'), name='unique_frame_tick'),
+        ),
+    ]
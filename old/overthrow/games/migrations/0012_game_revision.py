@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0011_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.28 on 2026-10-18 15:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0012_game_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deletedmovement',
+            name='player',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='games.Player'),
+        ),
+    ]
@@ -1,5 +1,8 @@
+from collections import defaultdict
 from pprint import pformat
+import functools
 import itertools
+import operator
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -9,24 +12,32 @@ from django.db.models import Q, F
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from . import coords
+from . import coords, metrics, snapshots
 from overthrow.utils import UUIDModel
 
 
 class Game(UUIDModel):
     tick = models.PositiveIntegerField(default=0)
+    radius = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(default=timezone.now)
+    # ticker worker simulating the game, see overthrow.games.ticker
+    claimed_by = models.CharField(max_length=255, blank=True, default="")
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    # changes of the board made since the last tick outside of ticks (players
+    # joining), so caches of a tick can tell the boards apart
+    revision = models.PositiveIntegerField(default=0)
 
     @staticmethod
     @transaction.atomic
     def generate_hexagonal(radius):
-        game = Game.objects.create()
+        game = Game.objects.create(radius=radius)
         tiles = []
         for x, y in itertools.product(
             range(-radius, radius + 1), range(-radius, radius + 1),
         ):
             z = -x - y
             if abs(x) <= radius and abs(y) <= radius and abs(z) <= radius:
-                tiles.append(Tile(game=game, x=x, y=y, z=z,))
+                tiles.append(Tile(game=game, x=x, y=y, z=z, index=len(tiles)))
         Tile.objects.bulk_create(tiles)
         return game
 
@@ -35,45 +46,141 @@ class Game(UUIDModel):
         player.grant_initial_tiles(tile_count=10, army=10)
         return player
 
+    def simulate(self, ticks=1):
+        """ Advance the game by given number of ticks, writing the result once """
+        Game.simulate_many([self], ticks=[ticks])
+
+    @staticmethod
     @transaction.atomic
-    def simulate(self):
-        from overthrow.games.game_simulator import GameSimulator
-
-        # lock and retrieve needed objects
-        tiles = list(self.tiles.select_for_update())
-        movements = list(Movement.objects.filter(source__game=self).select_for_update())
-        players = list(self.players.all())
-
-        # simulate
-        simulator = GameSimulator(tiles, movements, players)
-        simulator.simulate()
-
-        # save new state
-        Tile.objects.bulk_update(
-            [
-                simulator.tiles_by_id[tile_id]
-                for tile_id in simulator.tiles_to_be_updated
-            ],
-            ["army", "owner_id"],
-        )
-        Movement.objects.filter(id__in=simulator.movements_to_be_deleted).delete()
-        for m in simulator.movements_to_be_created:
-            m.game = self
-        Movement.objects.bulk_create(simulator.movements_to_be_created)
-        Movement.objects.bulk_update(simulator.movements_to_be_updated, ["amount"])
+    def simulate_many(games, ticks=None):
+        """
+        Advance many games at once, each by its number of ticks (one by
+        default). State of all the games is loaded with a single query per
+        table and the results are written back in single bulk queries.
+        """
+        from overthrow.games import history
+        from overthrow.games.orders import apply_orders
+        from overthrow.games.state import GameState
+
+        if ticks is None:
+            ticks = [1] * len(games)
+
+        with metrics.measure(games):
+            # Snapshots are updated with the tiles loaded for simulation. Games
+            # without a snapshot of the current tick have all their tiles loaded,
+            # as well as games recording a history keyframe.
+            with metrics.phase("snapshots"):
+                base_snapshots = [snapshots.read(game) for game in games]
+            ticks_to_load = [
+                None
+                if (snapshots.enabled() and base is None)
+                or (history.enabled() and history.needs_whole_board(game, game_ticks))
+                else game_ticks
+                for game, base, game_ticks in zip(games, base_snapshots, ticks)
+            ]
+
+            # merge orders submitted since the last tick
+            with metrics.phase("orders"):
+                changes = apply_orders(games)
+
+            # lock and retrieve needed rows
+            with metrics.phase("load"):
+                states = GameState.load_many(games, lock=True, ticks=ticks_to_load)
+            metrics.count("tiles_loaded", sum(len(state.tiles) for state in states))
+            metrics.count(
+                "movements_loaded", sum(len(state.movements) for state in states)
+            )
+
+            # simulate
+            frames = []
+            for state, game_ticks in zip(states, ticks):
+                recorder = history.Recorder(state) if history.enabled() else None
+                for tick in range(game_ticks):
+                    with metrics.phase("simulate"):
+                        state.advance()
+                    if recorder is not None:
+                        with metrics.phase("history"):
+                            # orders were applied before the first of the ticks
+                            recorder.record(
+                                changes[state.game.id] if tick == 0 else None
+                            )
+                if recorder is not None:
+                    frames.extend(recorder.take_frames())
+
+            # save new state
+            with metrics.phase("save"):
+                diffs = GameState.save_many(states)
+                HistoryFrame.objects.bulk_create(frames)
+                games_by_ticks = defaultdict(list)
+                for game, game_ticks in zip(games, ticks):
+                    games_by_ticks[game_ticks].append(game.id)
+                    game.tick += game_ticks
+                    game.revision = 0
+                for game_ticks, game_ids in games_by_ticks.items():
+                    Game.objects.filter(id__in=game_ids).update(
+                        tick=F("tick") + game_ticks, revision=0
+                    )
+            for diff in diffs:
+                metrics.count("tiles_written", len(diff.tiles))
+                metrics.count("movements_created", len(diff.created))
+                metrics.count("movements_updated", len(diff.updated))
+                metrics.count("movements_deleted", len(diff.deleted))
+
+            if snapshots.enabled():
+                # not before the new state is committed, it's lost on a rollback
+                transaction.on_commit(
+                    functools.partial(
+                        Game._write_snapshots, states, base_snapshots, simulated=ticks
+                    )
+                )
+
+            # tombstones are needed only as long as clients may sync changes
+            expired = [
+                Q(game_id=game.id, tick__lte=game.tick - settings.DELTA_SYNC_TICKS)
+                for game in games
+                if game.tick > settings.DELTA_SYNC_TICKS
+            ]
+            if expired:
+                with metrics.phase("tombstones"):
+                    DeletedMovement.objects.filter(
+                        functools.reduce(operator.or_, expired)
+                    ).delete()
+
+    @staticmethod
+    def _write_snapshots(states, base_snapshots, simulated):
+        for state, base, ticks in zip(states, base_snapshots, simulated):
+            if base is not None and base.tick + ticks != state.game.tick:
+                base = None  # the game was at another tick, partial state can't be used
+            snapshots.write(state, base=base)
+
+    @property
+    def next_tick_at(self):
+        return self.started_at + (self.tick + 1) * settings.TICK_DURATION
+
+    def due_ticks(self, now=None):
+        """ Number of ticks that should have been simulated by now, but weren't """
+        elapsed = (now or timezone.now()) - self.started_at
+        return max(0, elapsed // settings.TICK_DURATION - self.tick)
 
     @transaction.atomic
-    def simulate_till_now(self):
-        # simulate steps until we catch up
-        assert False, "not really implemented"
-        # select all realtaed things and lock them untill the end of transaction
-        game = self.__class__.objects.filter(id=self.id).select_for_update().get()
-        while (
-            game.started_at + (game.tick + 1) * settings.TICK_DURATION < timezone.now()
-        ):
-            game.simulate()
-            game.tick += 1
-            game.save()
+    def simulate_till_now(self, max_ticks=None):
+        """
+        Simulate ticks until we catch up, but no more than max_ticks
+        (MAX_CATCH_UP_TICKS by default). Returns number of simulated ticks.
+        """
+        if max_ticks is None:
+            max_ticks = settings.MAX_CATCH_UP_TICKS
+        with metrics.measure([self]):
+            # lock the game, so concurrent catch ups don't simulate the same ticks
+            with metrics.phase("lock"):
+                game = (
+                    self.__class__.objects.filter(id=self.id).select_for_update().get()
+                )
+            ticks = min(game.due_ticks(), max_ticks)
+            if ticks > 0:
+                game.simulate(ticks)
+        self.tick = game.tick
+        return ticks
 
     def as_plain(self):
         return {
@@ -131,6 +238,10 @@ class Player(UUIDModel):
 
     @transaction.atomic
     def grant_initial_tiles(self, tile_count, army):
+        # the board changes outside of a tick. The game row is locked first, as
+        # ticks do, then the tiles.
+        Game.objects.filter(id=self.game_id).update(revision=F("revision") + 1)
+        tick = Game.objects.values_list("tick", flat=True).get(id=self.game_id)
         free_tiles = self.game.tiles.filter(owner=None).select_for_update()
 
         # select tile nearest to origin
@@ -147,10 +258,13 @@ class Player(UUIDModel):
         )[:tile_count]
 
         # set ownership
+        # changes between ticks are marked as made by the next tick, as orders are
         for tile in granted_tiles:
             tile.owner = self
             tile.army = army
-        Tile.objects.bulk_update(granted_tiles, ["owner", "army"])
+            tile.changed_tick = tick + 1
+        Tile.objects.bulk_update(granted_tiles, ["owner", "army", "changed_tick"])
+        snapshots.discard(self.game_id)
         return granted_tiles
 
     def as_plain(self):
@@ -171,17 +285,23 @@ class Tile(UUIDModel):
     x = models.IntegerField()
     y = models.IntegerField()
     z = models.IntegerField()
+    # position in the dense order of the board, see overthrow.games.topology
+    index = models.PositiveIntegerField()
 
     owner = models.ForeignKey(
         Player, on_delete=models.SET_NULL, related_name="tiles", null=True,
     )
     army = models.PositiveIntegerField(default=0,)
+    # tick which last changed the tile, for delta sync of clients
+    changed_tick = models.PositiveIntegerField(default=0)
 
     class Meta:
+        indexes = [models.Index(fields=["game", "changed_tick"], name="tile_changes")]
         constraints = [
             models.UniqueConstraint(fields=["game", "x", "y"], name="unique_xy_coords"),
             models.UniqueConstraint(fields=["game", "x", "z"], name="unique_xz_coords"),
             models.UniqueConstraint(fields=["game", "y", "z"], name="unique_yz_coords"),
+            models.UniqueConstraint(fields=["game", "index"], name="unique_index"),
         ]
 
     def __str__(self):
@@ -209,6 +329,8 @@ class Movement(UUIDModel):
         Tile, on_delete=models.CASCADE, related_name="incoming_movements"
     )
     amount = models.PositiveIntegerField()
+    # tick which last changed the movement, for delta sync of clients
+    changed_tick = models.PositiveIntegerField(default=0, db_index=True)
 
     class Meta:
         constraints = [
@@ -235,3 +357,81 @@ class Movement(UUIDModel):
 
     def __repr__(self):
         return pformat(self.as_plain())
+
+
+class DeletedMovement(models.Model):
+    """
+    Tombstone of a movement, so clients syncing changes since some tick
+    learn about deletions. Kept for DELTA_SYNC_TICKS ticks.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    game = models.ForeignKey(
+        Game, on_delete=models.CASCADE, related_name="deleted_movements"
+    )
+    # owner of the movement, the only one who knew about it
+    player = models.ForeignKey(
+        Player, on_delete=models.CASCADE, related_name="+", null=True
+    )
+    movement_id = models.UUIDField()
+    tick = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=["game", "tick"], name="deleted_movements_tick")]
+
+
+class Order(models.Model):
+    """
+    Movement command of a player, waiting for the next tick.
+
+    Orders are only ever inserted by the API, so submitting one never waits
+    for the locks held by a running tick. The tick merges them into movements
+    when it starts, see `overthrow.games.orders`.
+    """
+
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+    KIND_CHOICES = [(CREATE, "create"), (UPDATE, "update"), (DELETE, "delete")]
+
+    # sequential, orders are applied in the order of submission
+    id = models.BigAutoField(primary_key=True)
+    # No foreign key constraints - checking them would lock the referenced
+    # rows, and a running tick holds locks on the game and its tiles.
+    game = models.ForeignKey(
+        Game, on_delete=models.CASCADE, related_name="orders", db_constraint=False
+    )
+    # orders of a player who lost the source tile meanwhile are dropped
+    player = models.ForeignKey(
+        Player, on_delete=models.CASCADE, related_name="+", db_constraint=False
+    )
+    kind = models.CharField(max_length=6, choices=KIND_CHOICES)
+    # for CREATE it's the id the movement will get
+    movement_id = models.UUIDField()
+    source = models.ForeignKey(
+        Tile, on_delete=models.CASCADE, related_name="+", null=True, db_constraint=False
+    )
+    target = models.ForeignKey(
+        Tile, on_delete=models.CASCADE, related_name="+", null=True, db_constraint=False
+    )
+    amount = models.PositiveIntegerField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class HistoryFrame(models.Model):
+    """
+    A tick of a game: the whole board (keyframe) or changes since the
+    previous tick, as compressed arrays - see `overthrow.games.history`.
+    Frames are only ever appended.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name="history")
+    tick = models.PositiveIntegerField()
+    keyframe = models.BooleanField()
+    data = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["game", "tick"], name="unique_frame_tick"),
+        ]
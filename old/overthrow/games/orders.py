@@ -0,0 +1,260 @@
+"""
+Merging the order inbox (`models.Order`) into movements.
+
+Orders are applied at the start of a tick, inside its transaction. Repeated
+orders for the same movement are coalesced first, so e.g. a movement created
+and then changed twice costs a single insert.
+"""
+import logging
+
+from django.conf import settings
+
+from .models import DeletedMovement, Movement, Order, Tile
+
+
+logger = logging.getLogger(__name__)
+
+
+class PendingMovement:
+    __slots__ = ("kind", "game_id", "player_id", "source_id", "target_id", "amount")
+
+    def __init__(self, kind, game_id, player_id, source_id, target_id, amount):
+        self.kind = kind
+        self.game_id = game_id
+        self.player_id = player_id
+        self.source_id = source_id
+        self.target_id = target_id
+        self.amount = amount
+
+
+def submit(orders):
+    """
+    Queue orders for the next tick: in the game server if one runs, in the
+    database otherwise and for games the server doesn't keep.
+    """
+    if settings.GAME_SERVER_SOCKET and orders:
+        from .server import order_to_json, send
+
+        try:
+            response = send(
+                {"op": "orders", "orders": [order_to_json(order) for order in orders]}
+            )
+            orders = [orders[position] for position in response["rejected"]]
+        except OSError:
+            logger.warning("game server unavailable, orders queued in the database")
+    Order.objects.bulk_create(orders)
+
+
+def coalesce(orders):
+    """ {movement id: PendingMovement}, final effect of the orders """
+    pending = {}
+    for order in orders:
+        current = pending.get(order.movement_id)
+        if order.kind == Order.CREATE:
+            pending[order.movement_id] = PendingMovement(
+                Order.CREATE,
+                order.game_id,
+                order.player_id,
+                order.source_id,
+                order.target_id,
+                order.amount,
+            )
+        elif order.kind == Order.UPDATE:
+            if current is None:
+                pending[order.movement_id] = PendingMovement(
+                    Order.UPDATE,
+                    order.game_id,
+                    order.player_id,
+                    None,
+                    None,
+                    order.amount,
+                )
+            elif current.kind != Order.DELETE:
+                current.amount = order.amount
+        elif order.kind == Order.DELETE:
+            if current is not None and current.kind == Order.CREATE:
+                # never reached the database
+                del pending[order.movement_id]
+            else:
+                pending[order.movement_id] = PendingMovement(
+                    Order.DELETE, order.game_id, order.player_id, None, None, None
+                )
+    return pending
+
+
+def apply_orders(games):
+    """
+    Drain orders of given games into movements. Returns changes the
+    accepted orders made, {game id: {(source index, target index): amount}},
+    with 0 for deleted movements.
+
+    Changes are marked as made by the next tick of their game.
+    """
+    ticks = {game.id: game.tick + 1 for game in games}
+    changes = {game.id: {} for game in games}
+    orders = list(Order.objects.filter(game__in=games).order_by("id"))
+    if not orders:
+        return changes
+    Order.objects.filter(id__in=[order.id for order in orders]).delete()
+    pending = coalesce(orders)
+
+    # orders of players who don't own the source tile anymore are dropped
+    movements = {
+        movement_id: (owner_id, (source, target))
+        for movement_id, owner_id, source, target in Movement.objects.filter(
+            id__in=pending.keys()
+        ).values_list("id", "source__owner_id", "source__index", "target__index")
+    }
+    tiles = {
+        tile_id: (owner_id, index)
+        for tile_id, owner_id, index in Tile.objects.filter(
+            id__in=[
+                tile_id
+                for p in pending.values()
+                if p.kind == Order.CREATE
+                for tile_id in (p.source_id, p.target_id)
+            ]
+        ).values_list("id", "owner_id", "index")
+    }
+    deleted = []
+    updated = []
+    created = []
+    for movement_id, movement in pending.items():
+        if movement.kind == Order.CREATE:
+            if tiles.get(movement.source_id, (None,))[0] == movement.player_id:
+                created.append((movement_id, movement))
+        elif movement_id in movements:
+            owner_id, path = movements[movement_id]
+            if owner_id != movement.player_id:
+                continue
+            if movement.kind == Order.DELETE:
+                deleted.append((movement_id, movement.game_id, owner_id))
+                changes[movement.game_id][path] = 0
+            else:
+                changes[movement.game_id][path] = movement.amount
+                updated.append(
+                    Movement(
+                        id=movement_id,
+                        amount=movement.amount,
+                        changed_tick=ticks[movement.game_id],
+                    )
+                )
+
+    # creating a movement on an already used path just sets its amount
+    used_paths = {
+        (source_id, target_id): movement_id
+        for movement_id, source_id, target_id in Movement.objects.filter(
+            source_id__in={movement.source_id for movement_id, movement in created}
+        )
+        .exclude(id__in=[movement_id for movement_id, game_id, owner_id in deleted])
+        .values_list("id", "source_id", "target_id")
+    }
+    new_movements = []
+    for movement_id, movement in created:
+        path = (movement.source_id, movement.target_id)
+        changes[movement.game_id][
+            (tiles[movement.source_id][1], tiles[movement.target_id][1])
+        ] = movement.amount
+        if path in used_paths:
+            updated.append(
+                Movement(
+                    id=used_paths[path],
+                    amount=movement.amount,
+                    changed_tick=ticks[movement.game_id],
+                )
+            )
+        else:
+            used_paths[path] = movement_id
+            new_movements.append(
+                Movement(
+                    id=movement_id,
+                    source_id=movement.source_id,
+                    target_id=movement.target_id,
+                    amount=movement.amount,
+                    changed_tick=ticks[movement.game_id],
+                )
+            )
+
+    Movement.objects.filter(
+        id__in=[movement_id for movement_id, game_id, owner_id in deleted]
+    ).delete()
+    DeletedMovement.objects.bulk_create(
+        [
+            DeletedMovement(
+                movement_id=movement_id,
+                game_id=game_id,
+                player_id=owner_id,
+                tick=ticks[game_id],
+            )
+            for movement_id, game_id, owner_id in deleted
+        ]
+    )
+    Movement.objects.bulk_create(new_movements)
+    Movement.objects.bulk_update(updated, ["amount", "changed_tick"])
+    return changes
+
+
+def apply_to_state(state, orders, tile_indices):
+    """
+    In memory counterpart of `apply_orders`, for a game kept by the game
+    server. The state has to hold all tiles of the game, tile_indices maps
+    their uuids to indices. Returns changes the accepted orders made, as
+    `apply_orders` does for a single game.
+    """
+    player_indices = {player_id: i for i, player_id in enumerate(state.player_ids)}
+    movements = state.movements_by_uuid()
+    pending = []
+    for movement_id, order in coalesce(orders).items():
+        player = player_indices.get(order.player_id)
+        if player is None:
+            continue
+        if order.kind == Order.CREATE:
+            source = tile_indices.get(order.source_id)
+            target = tile_indices.get(order.target_id)
+            if source is None or target is None:
+                continue
+            if state.tiles[source].owner_id == player:
+                pending.append((source, target, order.amount, movement_id))
+        else:
+            movement = movements.get(movement_id)
+            if movement is None or state.tiles[movement.source_id].owner_id != player:
+                continue
+            amount = 0 if order.kind == Order.DELETE else order.amount
+            pending.append((movement.source_id, movement.target_id, amount, None))
+
+    # as in the database, deletions go first, then a movement created on an
+    # already used path just sets its amount
+    pending.sort(key=lambda change: change[2] != 0)
+    changes = {}
+    paths = {(m.source_id, m.target_id): m for m in state.movements}
+    for source, target, amount, movement_id in pending:
+        changes[(source, target)] = amount
+        if amount == 0:
+            paths.pop((source, target), None)
+        elif (source, target) in paths:
+            paths[(source, target)].amount = amount
+        else:
+            paths[(source, target)] = state.add_movement(
+                source, target, amount, movement_id
+            )
+    _set_movements(state, paths)
+    return changes
+
+
+def apply_changes(state, changes):
+    """ Changes made by orders, as returned by `apply_orders`, to a state in memory """
+    paths = {(m.source_id, m.target_id): m for m in state.movements}
+    for (source, target), amount in changes.items():
+        if amount == 0:
+            paths.pop((source, target), None)
+        elif (source, target) in paths:
+            paths[(source, target)].amount = amount
+        else:
+            paths[(source, target)] = state.new_movement(source, target, amount)
+    _set_movements(state, paths)
+
+
+def _set_movements(state, paths):
+    state.movements = sorted(
+        paths.values(), key=lambda movement: (movement.source_id, movement.target_id)
+    )
@@ -0,0 +1,37 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class TileIndexPagination(BasePagination):
+    """
+    Pages of tiles in the dense index order, for clients that can't take the
+    whole board at once: `?limit=N` gives the first page, its "next" link
+    continues `?after=<last index>`. Without `limit` there is no paging.
+    """
+
+    max_limit = 10000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if "limit" not in request.query_params:
+            return None
+        try:
+            limit = min(int(request.query_params["limit"]), self.max_limit)
+            after = int(request.query_params.get("after", -1))
+        except ValueError:
+            raise ValidationError(_("Limit and after have to be integers."))
+        if limit < 1:
+            raise ValidationError({"limit": _("Limit has to be positive.")})
+
+        page = list(queryset.filter(index__gt=after).order_by("index")[:limit])
+        self.next_url = None
+        if len(page) == limit:
+            self.next_url = replace_query_param(
+                request.build_absolute_uri(), "after", page[-1].index
+            )
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.next_url, "results": data})
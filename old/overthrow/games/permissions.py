@@ -1,17 +1,25 @@
 from rest_framework import permissions
 
+from .models import Player
+
+
+# Single rows are checked in the database, a miss of the game state cache
+# would load the whole board.
+
+
+def _user_owns(user, player_id):
+    return (
+        player_id is not None
+        and Player.objects.filter(id=player_id, user_id=user.id).exists()
+    )
+
 
 class TileCommandPermission(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        if not obj.owner:
-            return False
-        return request.user == obj.owner.user
+        return _user_owns(request.user, obj.owner_id)
 
 
 class MovementCommandPermission(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         movement = obj
-        tile = movement.source
-        if not tile.owner:
-            return False
-        return request.user == tile.owner.user
+        return _user_owns(request.user, movement.source.owner_id)
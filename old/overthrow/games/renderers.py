@@ -0,0 +1,12 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """
+    Compact tile lists, see `serializers.columnar_tiles`. Selected with
+    `?format=columnar` or by the Accept header. Regions, pages and changed
+    tiles are columns too, with indices of the tiles.
+    """
+
+    media_type = "application/vnd.overthrow.columnar+json"
+    format = "columnar"
@@ -0,0 +1,94 @@
+"""
+Simulating recorded ticks of a game again, in memory.
+
+The board is rebuilt from the history (see `overthrow.games.history`), then
+every tick gets the orders logged for it and is simulated with
+GAME_SIMULATOR. Checksums of the results are compared with the recorded
+ones, so a replay either reproduces what happened or tells at which tick it
+went differently. Nothing is written to the database.
+
+The board before a rebased keyframe - recorded after players joined or ticks
+were skipped - isn't known, so a replay stops there with an error. It can go
+on from that tick. Players are those recorded, but with their corporations as
+they are now, so replaying ticks from before a player changed corporation can
+differ.
+"""
+from collections import namedtuple
+import copy
+import itertools
+import time
+
+
+from . import history
+from .orders import apply_changes
+from .state import GameState
+
+
+ReplayedTick = namedtuple("ReplayedTick", ["tick", "duration", "checksum", "expected"])
+
+
+class HistoryBoard:
+    """ Board rebuilt from the history, with rows as `snapshots.Snapshot` gives them """
+
+    def __init__(self, board):
+        self.board = board
+
+    def player_ids(self):
+        return self.board["players"]
+
+    def tile_rows(self):
+        return zip(
+            itertools.count(),
+            itertools.repeat(None),
+            self.board["owners"],
+            self.board["armies"],
+        )
+
+    def movement_rows(self):
+        movements = self.board["movements"]
+        return zip(
+            itertools.repeat(None),
+            movements["sources"],
+            movements["targets"],
+            movements["amounts"],
+        )
+
+
+def replay(game, from_tick=0, to_tick=None, simulator_class=None):
+    """
+    Yields `ReplayedTick`s of ticks after from_tick, up to to_tick (all
+    recorded by default). Duration covers applying orders and simulating.
+    Raises ValueError if the history doesn't cover the ticks, or the board
+    changed outside of them.
+    """
+    board = history.reconstruct(game, from_tick)
+    if board is None:
+        raise ValueError(f"history of the game doesn't reach tick {from_tick}")
+    game = copy.copy(game)
+    game.tick = from_tick
+    game.revision = 0
+    (state,) = GameState.from_snapshots(
+        [game], [HistoryBoard(board)], players=[board["players"]]
+    )
+    recorder = history.Recorder(state)
+
+    frames = game.history.filter(tick__gt=from_tick).order_by("tick")
+    if to_tick is not None:
+        frames = frames.filter(tick__lte=to_tick)
+    for tick, data in frames.values_list("tick", "data").iterator():
+        if tick != from_tick + state.unsaved_ticks + 1:
+            raise ValueError(f"tick {from_tick + state.unsaved_ticks + 1} not recorded")
+        frame = history.decode(data)
+        if frame.rebased:
+            raise ValueError(
+                f"the board changed outside of ticks (players joined or ticks "
+                f"were skipped) before tick {tick}, replay from that tick"
+            )
+        changes = history.path_amounts(frame.orders)
+        started = time.perf_counter()
+        apply_changes(state, changes)
+        state.advance(simulator_class)
+        duration = time.perf_counter() - started
+        recorder.record(changes, keyframe=frame.keyframe)
+        recorder.take_frames()
+        yield ReplayedTick(tick, duration, recorder.checksum, frame.checksum)
@@ -1,6 +1,7 @@
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
-from .models import Tile, Player, Movement
+from .models import Tile, Player, Movement, Order
 
 
 class PlayerSerializer(serializers.ModelSerializer):
@@ -15,8 +16,108 @@ class TileSerializer(serializers.ModelSerializer):
         fields = ["id", "x", "y", "z", "owner", "army"]
 
 
+def columnar_tiles(game, tiles=None, indices=None):
+    """
+    Tiles of the game as columns, in the dense index order (see
+    `overthrow.games.topology`), so coordinates are implicit:
+    {"radius": 2, "players": [player id, ...], "owners": [...], "armies": [...]}
+    Owners are positions in "players", -1 for unowned tiles. Tile ids are
+    left out, they never change.
+
+    Tiles are (owner id, army) rows in the index order, read from the
+    database if not given. Rows of only some tiles come with their indices,
+    given as the "indices" column.
+    """
+    if tiles is None:
+        tiles = game.tiles.order_by("index").values_list("owner_id", "army")
+    players = []
+    player_indices = {None: -1}
+    owners = []
+    armies = []
+    for owner_id, army in tiles:
+        if owner_id not in player_indices:
+            player_indices[owner_id] = len(players)
+            players.append(owner_id)
+        owners.append(player_indices[owner_id])
+        armies.append(army)
+    columns = {
+        "radius": game.radius,
+        "players": players,
+        "owners": owners,
+        "armies": armies,
+    }
+    if indices is not None:
+        columns["indices"] = list(indices)
+    return columns
+
+
+class ColumnarTileListSerializer:
+    """
+    Stands in for `TileSerializer(tiles, many=True)` when some of the tiles
+    are listed in the columnar format - a region, a page or changed tiles.
+    """
+
+    def __init__(self, game, tiles):
+        self.game = game
+        self.tiles = tiles
+
+    @property
+    def data(self):
+        tiles = sorted(self.tiles, key=lambda tile: tile.index)
+        return columnar_tiles(
+            self.game,
+            [(tile.owner_id, tile.army) for tile in tiles],
+            [tile.index for tile in tiles],
+        )
+
+
+def tile_rows(snapshot):
+    """ Tiles of a `game_cache.GameSnapshot`, as `TileSerializer` gives them """
+    return [
+        {"id": tile_id, "x": x, "y": y, "z": z, "owner": owner_id, "army": army}
+        for tile_id, index, x, y, z, owner_id, army in snapshot.tiles
+    ]
+
+
 class MovementSerializer(serializers.ModelSerializer):
     class Meta:
         model = Movement
         fields = ["id", "source", "target", "amount"]
         read_only_fields = ["source"]
+        extra_kwargs = {"amount": {"min_value": 1}}
+
+
+class MovementUpdateSerializer(MovementSerializer):
+    class Meta(MovementSerializer.Meta):
+        read_only_fields = ["source", "target"]
+
+
+class OrderSerializer(serializers.Serializer):
+    """ A single movement command of a batch """
+
+    kind = serializers.ChoiceField(choices=Order.KIND_CHOICES)
+    # existing movement, for updates and deletes
+    movement = serializers.UUIDField(required=False)
+    source = serializers.UUIDField(required=False)
+    target = serializers.UUIDField(required=False)
+    amount = serializers.IntegerField(min_value=1, required=False)
+
+    required_fields = {
+        Order.CREATE: ["source", "target", "amount"],
+        Order.UPDATE: ["movement", "amount"],
+        Order.DELETE: ["movement"],
+    }
+
+    def validate(self, data):
+        missing = {
+            name: _("This field is required.")
+            for name in self.required_fields[data["kind"]]
+            if name not in data
+        }
+        if missing:
+            raise serializers.ValidationError(missing)
+        if data["kind"] == Order.CREATE and data["source"] == data["target"]:
+            raise serializers.ValidationError(
+                {"target": _("Target has to be other than source.")}
+            )
+        return data
@@ -0,0 +1,359 @@
+"""
+Long running game server, keeping states of its games in memory.
+
+Ticks are simulated on resident `GameState`s, without loading and storing
+them every time. Changes are written behind, in batches covering many ticks:
+every `flush_interval` seconds, and before a game gets more than `max_lag`
+ticks ahead of the database. After a crash the server starts over from the
+database, so at most the unwritten ticks and orders are lost.
+
+Players join through the database. A flush notices it by `Game.revision` and
+reloads the game instead of writing its stale board, simulating the
+unwritten ticks again with the orders they applied.
+
+Games are leased to the server the same way as to a `Ticker`, so tickers
+leave them alone while the server is alive. Web processes send orders over a
+local socket, see `send`.
+"""
+from collections import defaultdict
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import history, snapshots
+from .models import Game, HistoryFrame, Order
+from .orders import apply_to_state
+from .state import merge_diffs
+from .writers import write_diff
+
+
+logger = logging.getLogger(__name__)
+
+
+class GameServer:
+    def __init__(self, name=None, game_ids=None, flush_interval=1.0, max_lag=10):
+        # unlike tickers, a restarted server takes over its own leases at once
+        self.name = name or f"{socket.gethostname()}:game-server"
+        self.game_ids = game_ids  # all free games if None
+        self.flush_interval = flush_interval
+        self.max_lag = max_lag
+        self.states = {}
+        self._tile_indices = {}
+        self._recorders = {}
+        self._orders = defaultdict(list)
+        self._applied = defaultdict(list)  # orders of ticks not written yet
+        # guards states and orders, simulation and flushing take turns
+        self._lock = threading.RLock()
+        self._socket_server = None
+        self._stopping = threading.Event()
+
+    def load(self):
+        """ Lease free games and load their whole state, from snapshots if possible """
+        now = timezone.now()
+        with transaction.atomic():
+            games = Game.objects.select_for_update(skip_locked=True).filter(
+                Q(claimed_until=None)
+                | Q(claimed_until__lt=now)
+                | Q(claimed_by=self.name)
+            )
+            if self.game_ids is not None:
+                games = games.filter(id__in=self.game_ids)
+            games = list(games.order_by("id"))
+            self._renew_lease([game.id for game in games])
+        with self._lock:
+            for state in snapshots.load_states(games):
+                self._add(state)
+                self._tile_indices[state.game.id] = {
+                    tile_id: index for index, tile_id in enumerate(state.tile_ids)
+                }
+        logger.info("loaded %d games", len(games))
+        return games
+
+    def _add(self, state):
+        self.states[state.game.id] = state
+        if history.enabled():
+            self._recorders[state.game.id] = history.Recorder(state)
+
+    def _renew_lease(self, game_ids):
+        Game.objects.filter(id__in=game_ids).update(
+            claimed_by=self.name,
+            claimed_until=timezone.now() + settings.TICK_LEASE_DURATION,
+        )
+
+    def tick(self, state):
+        """ Current tick of a game, including not yet written ones """
+        return state.game.tick + state.unsaved_ticks
+
+    def due_ticks(self, state, now):
+        elapsed = now - state.game.started_at
+        return max(0, elapsed // settings.TICK_DURATION - self.tick(state))
+
+    def submit(self, orders):
+        """ Queue orders till the next tick. Returns positions of orders of unknown games. """
+        rejected = []
+        with self._lock:
+            for position, order in enumerate(orders):
+                if order.game_id in self.states:
+                    self._orders[order.game_id].append(order)
+                else:
+                    rejected.append(position)
+        return rejected
+
+    def drain_inbox(self):
+        """ Take over orders queued in the database, e.g. while the server was down """
+        with transaction.atomic():
+            orders = list(
+                Order.objects.filter(game_id__in=list(self.states)).order_by("id")
+            )
+            Order.objects.filter(id__in=[order.id for order in orders]).delete()
+        self.submit(orders)
+        return len(orders)
+
+    def run_once(self, now=None):
+        """ Simulate due ticks of all games. Returns number of simulated ticks. """
+        now = now or timezone.now()
+        simulated = 0
+        for game_id in list(self.states):
+            with self._lock:
+                state = self.states.get(game_id)
+                if state is None:
+                    continue
+                due = min(self.due_ticks(state, now), settings.MAX_CATCH_UP_TICKS)
+                for i in range(due):
+                    orders = self._orders.pop(game_id, [])
+                    changes = None
+                    if orders:
+                        changes = apply_to_state(
+                            state, orders, self._tile_indices[game_id]
+                        )
+                        self._applied[game_id].extend(orders)
+                    state.advance()
+                    if game_id in self._recorders:
+                        self._recorders[game_id].record(changes)
+                simulated += due
+                lagging = state.unsaved_ticks >= self.max_lag
+            if lagging:
+                self._try_flush()
+        return simulated
+
+    def flush(self):
+        """
+        Write changes of all games to the database. Games changed outside of
+        ticks meanwhile are reloaded, games leased by someone else dropped.
+        """
+        self.drain_inbox()
+        batch = []
+        stale = []
+        try:
+            with transaction.atomic():
+                # writes are guarded by the lease, and no player joins till they are done
+                with self._lock:
+                    game_ids = list(self.states)
+                revisions = dict(
+                    Game.objects.select_for_update()
+                    .filter(id__in=game_ids, claimed_by=self.name)
+                    .values_list("id", "revision")
+                )
+                with self._lock:
+                    frames = []
+                    new_snapshots = []
+                    for game_id in game_ids:
+                        state = self.states.get(game_id)
+                        if state is None:
+                            continue
+                        if revisions.get(game_id) != state.game.revision:
+                            stale.append(game_id)
+                            continue
+                        if game_id in self._recorders:
+                            frames.extend(self._recorders[game_id].take_frames())
+                        ticks = state.unsaved_ticks
+                        if ticks:
+                            batch.append((state, ticks, state.take_diff()))
+                            state.game.tick += ticks
+                            state.game.revision = 0
+                            if snapshots.enabled():
+                                new_snapshots.append(
+                                    (game_id, snapshots.Snapshot.from_state(state))
+                                )
+                        self._applied.pop(game_id, None)
+                write_diff(merge_diffs([diff for state, ticks, diff in batch]))
+                HistoryFrame.objects.bulk_create(frames)
+                for state, ticks, diff in batch:
+                    Game.objects.filter(id=state.game.id, claimed_by=self.name).update(
+                        tick=state.game.tick, revision=0
+                    )
+                self._renew_lease(list(revisions))
+        except Exception:
+            logger.exception("writing %d games failed, reloading them", len(batch))
+            self.recover([state.game.id for state, ticks, diff in batch])
+            raise
+        if stale:
+            logger.info("%d games changed or taken over, reloading them", len(stale))
+            self.recover(stale)
+        for game_id, snapshot in new_snapshots:
+            snapshot.save(snapshots.path(game_id))
+        return len(batch)
+
+    def _try_flush(self):
+        try:
+            self.flush()
+        except Exception:
+            pass  # logged and recovered by flush
+
+    def recover(self, game_ids):
+        """
+        Drop in memory state of the games and start over from the database.
+        Orders of the dropped ticks are applied again by the next one. Those
+        of games leased by someone else meanwhile go back to the inbox.
+        """
+        with self._lock:
+            for game_id in game_ids:
+                self.states.pop(game_id, None)
+                self._recorders.pop(game_id, None)
+                self._orders[game_id][:0] = self._applied.pop(game_id, [])
+            games = list(Game.objects.filter(id__in=game_ids, claimed_by=self.name))
+            for state in snapshots.load_states(games):
+                self._add(state)
+            lost = [
+                order
+                for game_id in game_ids
+                if game_id not in self.states
+                for order in self._orders.pop(game_id, [])
+            ]
+        Order.objects.bulk_create(lost)
+
+    def release(self):
+        Game.objects.filter(id__in=list(self.states), claimed_by=self.name).update(
+            claimed_by="", claimed_until=None
+        )
+
+    def status(self):
+        with self._lock:
+            return {
+                str(game_id): {
+                    "tick": self.tick(state),
+                    "saved_tick": state.game.tick,
+                    "orders": len(self._orders.get(game_id, [])),
+                }
+                for game_id, state in self.states.items()
+            }
+
+    def handle(self, request):
+        """ Response to a request received over the socket """
+        if request.get("op") == "orders":
+            orders = [_order_from_json(order) for order in request["orders"]]
+            return {"rejected": self.submit(orders)}
+        if request.get("op") == "status":
+            return {"games": self.status()}
+        return {"error": "unknown op"}
+
+    def serve(self, path):
+        """ Accept requests on a unix socket, in a background thread """
+        if os.path.exists(path):
+            os.unlink(path)
+        self._socket_server = socketserver.ThreadingUnixStreamServer(
+            path, RequestHandler
+        )
+        self._socket_server.game_server = self
+        self._socket_server.daemon_threads = True
+        threading.Thread(target=self._socket_server.serve_forever, daemon=True).start()
+
+    def _flush_forever(self):
+        while not self._stopping.wait(self.flush_interval):
+            self._try_flush()
+
+    def run_forever(self):
+        flusher = threading.Thread(target=self._flush_forever, daemon=True)
+        flusher.start()
+        try:
+            while True:
+                self.run_once()
+                time.sleep(self.sleep_time())
+        finally:
+            self._stopping.set()
+            flusher.join()
+
+    def sleep_time(self):
+        """ Time until the nearest tick, but no longer than the flush interval """
+        now = timezone.now()
+        with self._lock:
+            next_ticks = [
+                state.game.started_at + (self.tick(state) + 1) * settings.TICK_DURATION
+                for state in self.states.values()
+            ]
+        if not next_ticks:
+            return self.flush_interval
+        return max(0, min(self.flush_interval, (min(next_ticks) - now).total_seconds()))
+
+    def close(self):
+        if self._socket_server is not None:
+            self._socket_server.shutdown()
+            self._socket_server.server_close()
+            self._socket_server = None
+        self.flush()
+        with self._lock:
+            # not applied yet, back to the inbox for whoever takes the games over
+            queued = [order for orders in self._orders.values() for order in orders]
+            self._orders.clear()
+        Order.objects.bulk_create(queued)
+        self.release()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """ Newline delimited JSON requests and responses """
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.game_server.handle(json.loads(line))
+            except Exception as e:
+                logger.exception("bad request")
+                response = {"error": str(e)}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+def send(request, path=None):
+    """ Send a request to the game server, returns its response """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(settings.GAME_SERVER_TIMEOUT)
+        connection.connect(path or settings.GAME_SERVER_SOCKET)
+        connection.sendall(json.dumps(request).encode() + b"\n")
+        with connection.makefile("rb") as response:
+            return json.loads(response.readline())
+
+
+def order_to_json(order):
+    return {
+        "game": str(order.game_id),
+        "player": str(order.player_id),
+        "kind": order.kind,
+        "movement": str(order.movement_id),
+        "source": None if order.source_id is None else str(order.source_id),
+        "target": None if order.target_id is None else str(order.target_id),
+        "amount": order.amount,
+    }
+
+
+def _order_from_json(data):
+    def as_uuid(value):
+        return None if value is None else uuid.UUID(value)
+
+    return Order(
+        game_id=as_uuid(data["game"]),
+        player_id=as_uuid(data["player"]),
+        kind=data["kind"],
+        movement_id=as_uuid(data["movement"]),
+        source_id=as_uuid(data["source"]),
+        target_id=as_uuid(data["target"]),
+        amount=data["amount"],
+    )
@@ -0,0 +1,215 @@
+"""
+Binary snapshots of game states, for a fast start of game servers.
+
+A snapshot is a single file holding the state of a game at a tick: a header
+(tick, checksum and array lengths) followed by arrays of fixed size records -
+tiles in the dense index order, players and movements. It's read through
+`mmap` without any parsing, the arrays are views of the mapped file.
+
+A snapshot is valid only as long as its game stays at the tick written in
+the header, changes made outside of ticks (like a player joining) have to
+`discard` it. Player records are always fetched from the database, the
+snapshot keeps just their ids, so changes of corporations don't matter.
+"""
+import mmap
+import os
+import struct
+import uuid
+import zlib
+
+from django.conf import settings
+import numpy as np
+
+from .files import atomic_write
+
+
+MAGIC = b"OTSNAP01"
+# magic, tick, checksum of the arrays, number of tiles, players and movements
+HEADER = struct.Struct("<8sqIIII")
+TILE = np.dtype([("id", "V16"), ("owner", "<i4"), ("army", "<i8")])
+PLAYER = np.dtype([("id", "V16")])
+MOVEMENT = np.dtype(
+    [("id", "V16"), ("source", "<i4"), ("target", "<i4"), ("amount", "<i8")]
+)
+
+
+class Snapshot:
+    """ Arrays of tiles, players and movements of a game at a tick """
+
+    def __init__(self, tick, tiles, players, movements):
+        self.tick = tick
+        self.tiles = tiles
+        self.players = players
+        self.movements = movements
+
+    @classmethod
+    def from_state(cls, state, base=None):
+        """
+        Snapshot of a saved `GameState`. States loading only some tiles
+        (see `GameState.load_many`) need the snapshot of the previous tick
+        as the base, tiles missing from the state are taken from it.
+        """
+        player_ids = _pack_uuids(state.player_ids)
+        if base is None:
+            if len(state.tiles) != state.topology.size:
+                raise ValueError("partial state without a base snapshot")
+            tiles = np.zeros(state.topology.size, dtype=TILE)
+        else:
+            if len(base.tiles) != state.topology.size or not np.array_equal(
+                base.players["id"], player_ids
+            ):
+                raise ValueError("base snapshot of other players or board")
+            tiles = np.array(base.tiles)
+        indices = [tile.id for tile in state.tiles]
+        tiles["id"][indices] = _pack_uuids([state.tile_ids[i] for i in indices])
+        tiles["owner"][indices] = [
+            -1 if tile.owner_id is None else tile.owner_id for tile in state.tiles
+        ]
+        tiles["army"][indices] = [tile.army for tile in state.tiles]
+
+        players = np.zeros(len(player_ids), dtype=PLAYER)
+        players["id"] = player_ids
+
+        saved = sorted(
+            state.movements_by_uuid().items(),
+            key=lambda item: (item[1].source_id, item[1].target_id),
+        )
+        if len(saved) != len(state.movements):
+            raise ValueError("state has unsaved movements")
+        movements = np.zeros(len(saved), dtype=MOVEMENT)
+        movements["id"] = _pack_uuids([movement_id for movement_id, m in saved])
+        movements["source"] = [m.source_id for movement_id, m in saved]
+        movements["target"] = [m.target_id for movement_id, m in saved]
+        movements["amount"] = [m.amount for movement_id, m in saved]
+        return cls(state.game.tick, tiles, players, movements)
+
+    def save(self, path):
+        """ Write the file atomically, readers see either the old or the new one """
+        arrays = (self.tiles, self.players, self.movements)
+        checksum = 0
+        for array in arrays:
+            checksum = zlib.crc32(array.tobytes(), checksum)
+        header = HEADER.pack(
+            MAGIC, self.tick, checksum, *(len(array) for array in arrays)
+        )
+        with atomic_write(path, "wb") as f:
+            f.write(header)
+            for array in arrays:
+                f.write(array.tobytes())
+
+    @classmethod
+    def open(cls, path):
+        """ Map the file into memory. Raises ValueError if it's damaged. """
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(buffer) < HEADER.size:
+            raise ValueError("truncated snapshot")
+        magic, tick, checksum, *counts = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError("not a snapshot")
+        offset = HEADER.size
+        arrays = []
+        for dtype, count in zip((TILE, PLAYER, MOVEMENT), counts):
+            arrays.append(np.frombuffer(buffer, dtype, count, offset))
+            offset += dtype.itemsize * count
+        if offset != len(buffer):
+            raise ValueError("truncated snapshot")
+        if zlib.crc32(memoryview(buffer)[HEADER.size :]) != checksum:
+            raise ValueError("checksum mismatch")
+        return cls(tick, *arrays)
+
+    def player_ids(self):
+        return _unpack_uuids(self.players["id"])
+
+    def tile_rows(self):
+        """ (index, tile id, position of the owner in `player_ids` or -1, army) """
+        return zip(
+            range(len(self.tiles)),
+            _unpack_uuids(self.tiles["id"]),
+            self.tiles["owner"].tolist(),
+            self.tiles["army"].tolist(),
+        )
+
+    def movement_rows(self):
+        """ (movement id, source index, target index, amount) """
+        return zip(
+            _unpack_uuids(self.movements["id"]),
+            self.movements["source"].tolist(),
+            self.movements["target"].tolist(),
+            self.movements["amount"].tolist(),
+        )
+
+
+def _pack_uuids(ids):
+    return np.frombuffer(b"".join(i.bytes for i in ids), dtype="V16")
+
+
+def _unpack_uuids(array):
+    data = np.ascontiguousarray(array).tobytes()
+    return [uuid.UUID(bytes=data[i : i + 16]) for i in range(0, len(data), 16)]
+
+
+def enabled():
+    return bool(settings.GAME_SNAPSHOT_DIR)
+
+
+def path(game_id):
+    return os.path.join(settings.GAME_SNAPSHOT_DIR, f"{game_id}.snapshot")
+
+
+def read(game):
+    """ Snapshot of the game at its current tick, None if there is no such """
+    if not enabled():
+        return None
+    try:
+        snapshot = Snapshot.open(path(game.id))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        discard(game.id)
+        return None
+    if snapshot.tick != game.tick:
+        return None
+    return snapshot
+
+
+def write(state, base=None):
+    """ Store snapshot of a saved state, replacing the previous one """
+    try:
+        snapshot = Snapshot.from_state(state, base=base)
+    except ValueError:
+        discard(state.game.id)
+        return None
+    snapshot.save(path(state.game.id))
+    return snapshot
+
+
+def discard(game_id):
+    if not enabled():
+        return
+    try:
+        os.unlink(path(game_id))
+    except FileNotFoundError:
+        pass
+
+
+def load_states(games):
+    """
+    `GameState`s of the games, restored from snapshots where possible and
+    loaded from the database otherwise.
+    """
+    from .state import GameState
+
+    snapshots = {game.id: read(game) for game in games}
+    restored = [game for game in games if snapshots[game.id] is not None]
+    missing = [game for game in games if snapshots[game.id] is None]
+    states = {}
+    for state in GameState.from_snapshots(
+        restored, [snapshots[game.id] for game in restored]
+    ):
+        states[state.game.id] = state
+    for state in GameState.load_many(missing):
+        states[state.game.id] = state
+        if enabled():
+            write(state)
+    return [states[game.id] for game in games]
@@ -0,0 +1,517 @@
+from collections import namedtuple
+import functools
+import itertools
+import operator
+import uuid
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.module_loading import import_string
+import numpy as np
+
+from . import metrics
+from .models import Movement, Player, Tile
+from .topology import Topology
+from .writers import write_diff
+
+
+class TileRecord:
+    __slots__ = ("id", "x", "y", "owner_id", "army")
+
+    def __init__(self, id, x, y, owner_id, army):
+        self.id = id
+        self.x = x
+        self.y = y
+        self.owner_id = owner_id
+        self.army = army
+
+    @property
+    def z(self):
+        return -self.x - self.y
+
+    @property
+    def coords(self):
+        return (self.x, self.y, -self.x - self.y)
+
+
+class MovementRecord:
+    __slots__ = ("id", "source_id", "target_id", "amount")
+
+    def __init__(self, id, source_id, target_id, amount):
+        self.id = id
+        self.source_id = source_id
+        self.target_id = target_id
+        self.amount = amount
+
+
+class PlayerRecord:
+    __slots__ = ("id", "corporation_id", "boss_id")
+
+    def __init__(self, id, corporation_id, boss_id):
+        self.id = id
+        self.corporation_id = corporation_id
+        self.boss_id = boss_id
+
+
+# Rows to be written to the database, tick is the one which made the change
+# tiles: (tile id, owner id, army, tick)
+# created: (movement id, source id, target id, amount, tick)
+# updated: (movement id, source id, amount, tick)
+# deleted: (movement id, game id, owning player id, tick)
+StateDiff = namedtuple("StateDiff", ["tiles", "created", "updated", "deleted"])
+
+
+class GameState:
+    """
+    Game state detached from the ORM.
+
+    Tiles, players and movements are kept as compact records, all referring
+    to each other by dense integer ids: tile id is its topology index, player
+    and movement ids are positions in the load order. UUIDs are needed only
+    when writing, so they are kept aside in plain lists.
+
+    Simulators work on the records in place. `diff` compares them with the
+    state last loaded or saved, so any number of ticks can be flushed at once.
+    """
+
+    def __init__(self, game, topology, tiles, tile_ids, players, player_ids):
+        self.game = game
+        self.topology = topology
+        self.tiles = tiles
+        self.tile_ids = tile_ids  # tile index -> uuid
+        self.players = players
+        self.player_ids = player_ids  # player index -> uuid
+        self.movements = []
+        self._movement_ids = itertools.count()
+        self._saved_movements = {}  # (source, target) -> (uuid, amount)
+        self._saved_tiles = None
+        self._new_movement_ids = {}  # movement id -> uuid of a not yet saved movement
+        self._ordered = {}  # movement id -> path, of movements added by orders
+        self._ticks = 0  # simulated since the state was loaded or saved
+        self._tile_positions = {}  # tile index -> position in tiles
+
+    @classmethod
+    def load(cls, game, lock=False, ticks=None):
+        """ Fetch state of the game from the database, as plain rows """
+        return cls.load_many(
+            [game], lock=lock, ticks=None if ticks is None else [ticks]
+        )[0]
+
+    @classmethod
+    def load_many(cls, games, lock=False, ticks=None):
+        """
+        Fetch states of many games, with a single query per table.
+
+        If numbers of ticks to be simulated are given (one per game), only
+        tiles these ticks can affect are loaded - see `_active_tiles`. None
+        instead of a number loads all tiles of the game.
+        """
+        states = {game.id: cls.empty(game) for game in games}
+        player_indices = cls._load_players(states)
+
+        movements_query = Movement.objects.filter(
+            source__game_id__in=states.keys()
+        ).values_list(
+            "source__game_id", "id", "source__index", "target__index", "amount"
+        )
+        if lock:
+            movements_query = movements_query.select_for_update(of=("self",))
+        for row in movements_query.iterator():
+            game_id, movement_id, source_id, target_id, amount = row
+            states[game_id]._saved_movements[(source_id, target_id)] = (
+                movement_id,
+                amount,
+            )
+
+        tiles_query = Tile.objects.values_list(
+            "game_id", "id", "index", "x", "y", "owner_id", "army"
+        )
+        if ticks is None:
+            tiles_query = tiles_query.filter(game_id__in=states.keys())
+        else:
+            active = [
+                Q(game_id=game_id)
+                if game_ticks is None
+                else Q(
+                    game_id=game_id, index__in=state._active_tiles(game_ticks).tolist(),
+                )
+                for (game_id, state), game_ticks in zip(states.items(), ticks)
+                if game_ticks is None or state._saved_movements
+            ]
+            if active:
+                tiles_query = tiles_query.filter(functools.reduce(operator.or_, active))
+            else:
+                tiles_query = tiles_query.none()
+        if lock:
+            tiles_query = tiles_query.select_for_update()
+        for game_id, tile_id, index, x, y, owner_id, army in tiles_query.iterator():
+            state = states[game_id]
+            state.tile_ids[index] = tile_id
+            state.tiles.append(
+                TileRecord(index, x, y, player_indices[game_id][owner_id], army)
+            )
+
+        for state in states.values():
+            state._loaded()
+        return [states[game.id] for game in games]
+
+    @classmethod
+    def from_snapshots(cls, games, snapshots, players=None):
+        """
+        States restored from `snapshots.Snapshot`s taken at the current ticks
+        of the games (or other boards giving the same rows). Only players are
+        fetched from the database, all of them unless their ids are given for
+        each game.
+        """
+        states = {game.id: cls.empty(game) for game in games}
+        player_indices = cls._load_players(
+            states, None if players is None else itertools.chain.from_iterable(players),
+        )
+        for game, snapshot in zip(games, snapshots):
+            state = states[game.id]
+            # snapshot's owner -> player index, the last item is for no owner (-1)
+            owners = [player_indices[game.id].get(i) for i in snapshot.player_ids()]
+            owners.append(None)
+            coords = state.topology.coords[:, :2].tolist()
+            for index, tile_id, owner, army in snapshot.tile_rows():
+                state.tile_ids[index] = tile_id
+                x, y = coords[index]
+                state.tiles.append(TileRecord(index, x, y, owners[owner], army))
+            for movement_id, source_id, target_id, amount in snapshot.movement_rows():
+                state._saved_movements[(source_id, target_id)] = (movement_id, amount)
+            state._loaded()
+        return [states[game.id] for game in games]
+
+    @classmethod
+    def build(cls, game, tiles, tile_ids, players, player_ids, movements):
+        """
+        State made of records, e.g. generated ones. Movements are
+        {(source, target): (uuid, amount)}, as if they were saved.
+        """
+        state = cls(game, Topology.for_game(game), tiles, tile_ids, players, player_ids)
+        state._saved_movements = dict(movements)
+        state._loaded()
+        return state
+
+    @classmethod
+    def empty(cls, game):
+        topology = Topology.for_game(game)
+        return cls(game, topology, [], [None] * topology.size, [], [])
+
+    @staticmethod
+    def _load_players(states, player_ids=None):
+        """
+        Fill in players of the states, or those of them with given ids.
+        Returns {game id: {uuid: index}}.
+        """
+        player_indices = {game_id: {None: None} for game_id in states}
+        boss_ids = {game_id: [] for game_id in states}
+        corporation_indices = {game_id: {None: None} for game_id in states}
+        players_query = (
+            Player.objects.filter(game_id__in=states.keys())
+            .order_by("id")
+            .values_list("game_id", "id", "corporation_id", "boss_id")
+        )
+        if player_ids is not None:
+            players_query = players_query.filter(id__in=list(player_ids))
+        for game_id, player_id, corporation_id, boss_id in players_query:
+            state = states[game_id]
+            player_indices[game_id][player_id] = len(state.players)
+            state.player_ids.append(player_id)
+            boss_ids[game_id].append(boss_id)
+            corporation_index = corporation_indices[game_id]
+            corporation_index.setdefault(corporation_id, len(corporation_index) - 1)
+            state.players.append(
+                PlayerRecord(
+                    len(state.players), corporation_index[corporation_id], boss_id=None
+                )
+            )
+        for game_id, state in states.items():
+            player_index = player_indices[game_id]
+            for player, boss_id in zip(state.players, boss_ids[game_id]):
+                player.boss_id = player_index.get(boss_id)
+        return player_indices
+
+    def _loaded(self):
+        # Simulation results depend on the order of tiles and movements,
+        # so keep them in a canonical one, not in the database's order.
+        self.tiles.sort(key=lambda tile: tile.id)
+        self._tile_positions = {tile.id: i for i, tile in enumerate(self.tiles)}
+        self.movements = [
+            self.new_movement(source_id, target_id, amount)
+            for (source_id, target_id), (movement_id, amount) in sorted(
+                self._saved_movements.items()
+            )
+        ]
+        self._saved_tiles = self._tile_columns()
+
+    def _active_tiles(self, ticks):
+        """
+        Indices of tiles that can take part in given number of ticks: sources
+        and targets of movements and tiles on their paths, up to one hop
+        further than armies can get (simulators look up the next hop of the
+        movements they create). Other tiles don't change and can be skipped.
+        """
+        if not self._saved_movements:
+            return np.empty(0, dtype=np.int64)
+        sources, targets = np.array(list(self._saved_movements), dtype=np.int64).T
+        active = [sources, targets]
+        hops = sources
+        for hop in range(ticks + 1):
+            hops = self.topology.next_hops(hops, targets)
+            active.append(hops)
+        return np.unique(np.concatenate(active))
+
+    def new_movement(self, source_id, target_id, amount):
+        """ Factory of movement records, used by simulators """
+        return MovementRecord(next(self._movement_ids), source_id, target_id, amount)
+
+    def add_movement(self, source_id, target_id, amount, movement_id):
+        """ Movement ordered by a player, with its uuid chosen up front """
+        movement = self.new_movement(source_id, target_id, amount)
+        self.movements.append(movement)
+        self._new_movement_ids[movement.id] = movement_id
+        self._ordered[movement.id] = (source_id, target_id)
+        return movement
+
+    def movements_by_uuid(self):
+        """ {uuid: movement record}, for movements which got their uuid already """
+        movements = {}
+        for movement in self.movements:
+            saved = self._saved_movements.get((movement.source_id, movement.target_id))
+            if saved is not None:
+                movements[saved[0]] = movement
+            elif movement.id in self._new_movement_ids:
+                movements[self._new_movement_ids[movement.id]] = movement
+        return movements
+
+    def default_simulator_class(self):
+        """
+        GAME_SIMULATOR if set. Otherwise the numpy based simulator for states
+        of at least ARRAY_SIMULATOR_MIN_TILES tiles and the dict based one for
+        smaller ones, for which the fixed cost of setting up arrays dominates.
+        """
+        if settings.GAME_SIMULATOR:
+            return import_string(settings.GAME_SIMULATOR)
+        if len(self.tiles) >= settings.ARRAY_SIMULATOR_MIN_TILES:
+            return import_string("overthrow.games.array_simulator.ArrayGameSimulator")
+        return import_string("overthrow.games.game_simulator.GameSimulator")
+
+    def simulator(self, simulator_class=None):
+        if simulator_class is None:
+            simulator_class = self.default_simulator_class()
+        return simulator_class(
+            self.tiles,
+            self.movements,
+            self.players,
+            topology=self.topology,
+            movement_factory=self.new_movement,
+        )
+
+    def advance(self, simulator_class=None):
+        """ Simulate a single tick in memory, see `default_simulator_class` """
+        simulator = self.simulator(simulator_class)
+        simulator.simulate()
+        metrics.count("tiles_updated", len(simulator.tiles_to_be_updated))
+        self.take_results(simulator)
+        return simulator
+
+    def take_results(self, simulator):
+        """ Movements as left by the simulator, after it simulated a tick """
+        self._ticks += 1
+        self.movements = sorted(
+            simulator.movements_by_id.values(),
+            key=lambda movement: (movement.source_id, movement.target_id),
+        )
+
+    def _tile_columns(self):
+        count = len(self.tiles)
+        return (
+            np.fromiter(
+                (-1 if t.owner_id is None else t.owner_id for t in self.tiles),
+                dtype=np.int64,
+                count=count,
+            ),
+            np.fromiter((t.army for t in self.tiles), dtype=np.int64, count=count),
+        )
+
+    def diff(self):
+        """ Changes since the state was loaded or saved """
+        tick = self.game.tick + self._ticks
+        saved_owners, saved_armies = self._saved_tiles
+        owners, armies = self._tile_columns()
+        tiles = [
+            (
+                self.tile_ids[self.tiles[i].id],
+                None if owners[i] < 0 else self.player_ids[owners[i]],
+                int(armies[i]),
+                tick,
+            )
+            for i in np.flatnonzero(
+                (owners != saved_owners) | (armies != saved_armies)
+            ).tolist()
+        ]
+
+        updated = []
+        new_movements = []
+        paths = set()
+        for movement in self.movements:
+            path = (movement.source_id, movement.target_id)
+            paths.add(path)
+            saved = self._saved_movements.get(path)
+            if saved is None:
+                new_movements.append(movement)
+            elif saved[1] != movement.amount:
+                updated.append(
+                    (saved[0], self.tile_ids[movement.source_id], movement.amount, tick)
+                )
+        # rows of movements gone since the save, and uuids of movements ordered
+        # since then and gone too, with owners of their sources
+        positions = self._tile_positions
+        deleted = {
+            path: (movement_id, int(saved_owners[positions[path[0]]]))
+            for path, (movement_id, amount) in self._saved_movements.items()
+            if path not in paths
+        }
+        present = {m.id for m in self.movements}
+        unsaved = {
+            path: (self._new_movement_ids[movement_id], int(owners[positions[path[0]]]))
+            for movement_id, path in self._ordered.items()
+            if movement_id not in present
+        }
+
+        # uuids chosen by orders stay, so new movements are paired only if not
+        # ordered, and with ordered ones first
+        new_paths = {
+            (m.source_id, m.target_id): int(owners[positions[m.source_id]])
+            for m in new_movements
+            if m.id not in self._ordered
+        }
+        unsaved_moved = self._follow_armies(new_paths, unsaved)
+        for path in unsaved_moved:
+            del new_paths[path]
+        moved = self._follow_armies(new_paths, deleted)
+        created = []
+        for movement in new_movements:
+            path = (movement.source_id, movement.target_id)
+            if path in unsaved_moved:
+                self._new_movement_ids[movement.id] = unsaved_moved[path]
+            if path in moved:
+                self._new_movement_ids[movement.id] = moved[path]
+                updated.append(
+                    (
+                        moved[path],
+                        self.tile_ids[movement.source_id],
+                        movement.amount,
+                        tick,
+                    )
+                )
+            else:
+                created.append(
+                    (
+                        self._new_movement_ids.setdefault(movement.id, uuid.uuid4()),
+                        self.tile_ids[movement.source_id],
+                        self.tile_ids[movement.target_id],
+                        movement.amount,
+                        tick,
+                    )
+                )
+
+        return StateDiff(
+            tiles,
+            created,
+            updated,
+            [
+                (
+                    movement_id,
+                    self.game.id,
+                    None if owner < 0 else self.player_ids[owner],
+                    tick,
+                )
+                # unsaved ones too, clients got their uuids
+                for movement_id, owner in [*deleted.values(), *unsaved.values()]
+            ],
+        )
+
+    def _follow_armies(self, new_paths, deleted):
+        """
+        Armies of a movement advance along its route: the movement is deleted
+        and one with the same target is created a few hops further. Pair such
+        movements, so the row of the old one can be moved along with the
+        armies - a single update, instead of a delete and an insert.
+
+        Paths map to owners of their sources, {path: owner} for the new
+        movements and {path: (uuid, owner)} for the deleted ones. Only
+        movements of the same owner are paired, as only the owner lists them.
+        Returns {new path: uuid of the old movement}, and removes the old
+        movements from `deleted`.
+        """
+        moved = {}
+        if not new_paths or not deleted:
+            return moved
+        deleted_paths = sorted(deleted)
+        sources, targets = np.array(deleted_paths, dtype=np.int64).T
+        hops = sources
+        # armies move by at most one tile per tick
+        for tick in range(self._ticks):
+            hops = self.topology.next_hops(hops, targets)
+            for path, hop in zip(deleted_paths, hops.tolist()):
+                new_path = (hop, path[1])
+                if (
+                    path in deleted
+                    and new_path in new_paths
+                    and new_path not in moved
+                    and new_paths[new_path] == deleted[path][1]
+                ):
+                    moved[new_path] = deleted.pop(path)[0]
+        return moved
+
+    @property
+    def unsaved_ticks(self):
+        return self._ticks
+
+    def take_diff(self):
+        """ Changes since the last save, from now on considered saved """
+        diff = self.diff()
+        self._mark_saved()
+        return diff
+
+    def save(self):
+        """ Write changes to the database """
+        diff = self.diff()
+        write_diff(diff)
+        self._mark_saved()
+        return diff
+
+    @staticmethod
+    def save_many(states):
+        """ Write changes of many games, with a single bulk query per table """
+        diffs = [state.diff() for state in states]
+        write_diff(merge_diffs(diffs))
+        for state in states:
+            state._mark_saved()
+        return diffs
+
+    def _mark_saved(self):
+        self._saved_tiles = self._tile_columns()
+        self._saved_movements = {
+            (m.source_id, m.target_id): (self._movement_uuid(m), m.amount,)
+            for m in self.movements
+        }
+        self._new_movement_ids = {}
+        self._ordered = {}
+        self._ticks = 0
+
+    def _movement_uuid(self, movement):
+        saved = self._saved_movements.get((movement.source_id, movement.target_id))
+        if saved is not None:
+            return saved[0]
+        return self._new_movement_ids[movement.id]
+
+
+def merge_diffs(diffs):
+    merged = StateDiff([], [], [], [])
+    for diff in diffs:
+        for rows, new_rows in zip(merged, diff):
+            rows.extend(new_rows)
+    return merged
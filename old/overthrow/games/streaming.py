@@ -0,0 +1,37 @@
+"""
+Lists too big to be built in memory, rendered to JSON row by row.
+
+Rows are read with a server side cursor and encoded in chunks, so memory use
+doesn't depend on the number of rows.
+"""
+import zlib
+
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def json_list(rows, chunk_size=1000):
+    """ Chunks of a JSON array of the rows, as bytes """
+    encoder = JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    separator = "["
+    chunk = []
+    for row in rows:
+        chunk.append(separator)
+        chunk.append(encoder.encode(row))
+        separator = ","
+        if len(chunk) >= 2 * chunk_size:
+            yield "".join(chunk).encode()
+            chunk = []
+    if separator == "[":
+        chunk.append(separator)
+    chunk.append("]")
+    yield "".join(chunk).encode()
+
+
+def gzip_chunks(chunks):
+    """ Chunks compressed on the fly, as a single gzip stream """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
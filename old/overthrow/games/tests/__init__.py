@@ -1,4 +1,39 @@
 import hypothesis
+from rest_framework.test import APIClient
+
+from overthrow.games.factories import PlayerFactory
+from overthrow.games.models import Game, Movement
 
 hypothesis.settings.register_profile("dev", print_blob=True)
 hypothesis.settings.load_profile("dev")
+
+
+def get_board(game):
+    """ {tile id: (owner id, army)} and {(source id, target id): amount} """
+    return (
+        {tile.id: (tile.owner_id, tile.army) for tile in game.tiles.all()},
+        {
+            (m.source_id, m.target_id): m.amount
+            for m in Movement.objects.filter(source__game=game)
+        },
+    )
+
+
+class GameClientMixin:
+    """ A game of `radius` and an anonymous API client """
+
+    radius = 2
+
+    def setUp(self):
+        super().setUp()
+        self.game = Game.generate_hexagonal(self.radius)
+        self.client = APIClient()
+
+
+class PlayerClientMixin(GameClientMixin):
+    """ A game with a player, and an API client signed in as them """
+
+    def setUp(self):
+        super().setUp()
+        self.player = PlayerFactory(game=self.game)
+        self.client.force_authenticate(self.player.user)
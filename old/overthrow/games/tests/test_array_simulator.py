@@ -0,0 +1,80 @@
+from django.test import override_settings
+from hypothesis import given
+from hypothesis.extra.django import TestCase
+
+from overthrow.games.array_simulator import ArrayGameSimulator
+from overthrow.games.benchmark import generate_game
+from overthrow.games.game_simulator import GameSimulator
+from overthrow.games.models import Movement
+from overthrow.games.state import GameState
+from overthrow.games.tests import strategies
+
+
+def simulate(simulator_class, game):
+    simulator = simulator_class(
+        list(game.tiles.all()),
+        list(Movement.objects.filter(source__game=game)),
+        list(game.players.all()),
+    )
+    simulator.simulate()
+    return {
+        "tiles": {
+            tile_id: (
+                simulator.tiles_by_id[tile_id].army,
+                simulator.tiles_by_id[tile_id].owner_id,
+            )
+            for tile_id in simulator.tiles_to_be_updated
+        },
+        "created": sorted(
+            (str(m.source_id), str(m.target_id), m.amount)
+            for m in simulator.movements_to_be_created
+        ),
+        "updated": [(m.id, m.amount) for m in simulator.movements_to_be_updated],
+        "deleted": set(simulator.movements_to_be_deleted),
+    }
+
+
+class ArrayGameSimulatorTestCase(TestCase):
+    @given(game=strategies.games())
+    def test_same_diffs(self, game):
+        self.assertEqual(
+            simulate(ArrayGameSimulator, game), simulate(GameSimulator, game),
+        )
+
+    @given(
+        game=strategies.games(
+            max_radius=1,
+            unowned_tiles=False,
+            min_player_count=3,
+            max_player_count=3,
+            min_movement_count=1,
+        )
+    )
+    def test_same_diffs_with_corporation(self, game):
+        boss, intermediate, subordinate = tuple(game.players.all())
+        boss.create_corporation()
+        intermediate.set_boss(boss)
+        subordinate.set_boss(intermediate)
+        self.assertEqual(
+            simulate(ArrayGameSimulator, game), simulate(GameSimulator, game),
+        )
+
+
+@override_settings(GAME_SIMULATOR="", ARRAY_SIMULATOR_MIN_TILES=100)
+class DefaultSimulatorTestCase(TestCase):
+    def test_by_loaded_tiles(self):
+        game = generate_game(10, movement_count=5, seed=1)
+        (partial,) = GameState.load_many([game], ticks=[1])
+        self.assertLess(len(partial.tiles), 100)
+        self.assertIs(partial.default_simulator_class(), GameSimulator)
+        self.assertIs(
+            GameState.load(game).default_simulator_class(), ArrayGameSimulator
+        )
+
+    def test_setting(self):
+        game = generate_game(10, movement_count=5, seed=1)
+        with override_settings(
+            GAME_SIMULATOR="overthrow.games.array_simulator.ArrayGameSimulator"
+        ):
+            (partial,) = GameState.load_many([game], ticks=[1])
+            self.assertIs(partial.default_simulator_class(), ArrayGameSimulator)
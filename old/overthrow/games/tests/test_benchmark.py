@@ -0,0 +1,79 @@
+from io import StringIO
+import json
+import tempfile
+
+from django.core.management import call_command
+from hypothesis.extra.django import TestCase
+
+from overthrow.games import benchmark, coords
+from overthrow.games.state import GameState
+
+
+class SyntheticStateTestCase(TestCase):
+    def test_random(self):
+        state = benchmark.synthetic_state(
+            10, player_count=3, movement_density=0.5, path_length=2, seed=1
+        )
+        self.assertEqual(len(state.tiles), 331)
+        owned = [tile for tile in state.tiles if tile.owner_id is not None]
+        self.assertLess(len(owned), len(state.tiles))
+        self.assertEqual(len(state.movements), len(owned) // 2)
+        for movement in state.movements:
+            self.assertIsNotNone(state.tiles[movement.source_id].owner_id)
+            distance = coords.distance(
+                state.tiles[movement.source_id].coords,
+                state.tiles[movement.target_id].coords,
+            )
+            self.assertIn(distance, [1, 2])
+
+    def test_clustered(self):
+        state = benchmark.synthetic_state(5, player_count=2, layout="clustered", seed=1)
+        self.assertEqual(
+            {tile.owner_id for tile in state.tiles}, {0, 1},
+        )
+
+    def test_saved(self):
+        state = benchmark.synthetic_state(3, seed=2)
+        game = benchmark.save_synthetic_game(state)
+        loaded = GameState.load(game)
+        self.assertEqual(
+            [(t.id, t.owner_id, t.army) for t in loaded.tiles],
+            [(t.id, t.owner_id, t.army) for t in state.tiles],
+        )
+        self.assertEqual(
+            {
+                movement_id: (m.source_id, m.target_id, m.amount)
+                for movement_id, m in loaded.movements_by_uuid().items()
+            },
+            {
+                movement_id: (m.source_id, m.target_id, m.amount)
+                for movement_id, m in state.movements_by_uuid().items()
+            },
+        )
+
+
+class RegressionsTestCase(TestCase):
+    def test_regressions(self):
+        baseline = {"a": {"tiles": 10, "total": 1.0, "load": 0.01}, "b": {"total": 1.0}}
+        results = {"a": {"tiles": 20, "total": 1.5, "load": 0.02}, "c": {"total": 9.0}}
+        self.assertEqual(
+            benchmark.regressions(baseline, results, 0.2, 0.05),
+            [("a", "total", 1.0, 1.5)],
+        )
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile("r", suffix=".json") as output:
+            options = dict(radius=[2], database_radius=[1], ticks=1, stdout=StringIO())
+            call_command("benchmark_simulator", output=output.name, **options)
+            results = json.load(output)["results"]
+            self.assertEqual(
+                set(results["simulator radius=2"]),
+                {"tiles", "movements", "setup", "total", *benchmark.PHASES},
+            )
+            self.assertIn("game_simulate", results["database radius=1"])
+
+            options["stdout"] = StringIO()
+            call_command(
+                "benchmark_simulator", baseline=output.name, threshold=100, **options
+            )
+            self.assertIn("no regressions", options["stdout"].getvalue())
@@ -0,0 +1,148 @@
+import gzip
+import json
+
+from django.test import SimpleTestCase
+from hypothesis import given
+from hypothesis.extra.django import TestCase
+from rest_framework.test import APIClient
+
+from overthrow.games import caching
+from overthrow.games.factories import PlayerFactory
+from overthrow.games.tests import GameClientMixin, strategies
+from overthrow.games.topology import Topology
+
+
+class TickCacheTestCase(GameClientMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = f"/api/game/{self.game.id}/tiles/"
+
+    def test_not_modified_until_tick(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), self.game.tiles.count())
+        etag = response["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.game.simulate()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_modified_by_player_joining(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+
+        player = PlayerFactory(game=self.game)
+        (tile,) = player.grant_initial_tiles(tile_count=1, army=3)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertNotIn("Last-Modified", response)
+        (row,) = [row for row in response.json() if row["id"] == str(tile.id)]
+        self.assertEqual((row["owner"], row["army"]), (str(player.id), 3))
+
+    def test_rendered_once_per_tick(self):
+        expected = self.client.get(self.url).content
+        # the game only
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, br;q=0")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), expected)
+
+    def test_players_join_between_ticks(self):
+        url = f"/api/game/{self.game.id}/players/"
+        self.assertEqual(self.client.get(url).json(), [])
+        player = PlayerFactory(game=self.game)
+        self.assertEqual(
+            json.loads(self.client.get(url).content),
+            [{"id": str(player.id), "user": str(player.user_id)}],
+        )
+
+
+class ColumnarTilesTestCase(TestCase):
+    @given(game=strategies.games())
+    def test_same_as_serializer(self, game):
+        client = APIClient()
+        rows = client.get(f"/api/game/{game.id}/tiles/").json()
+        response = client.get(f"/api/game/{game.id}/tiles/?format=columnar")
+        self.assertEqual(
+            response["Content-Type"], "application/vnd.overthrow.columnar+json"
+        )
+        columns = response.json()
+
+        topology = Topology.for_radius(columns["radius"])
+        players = [None] + columns["players"]
+        self.assertEqual(
+            {
+                (tuple(topology.coords[index]), players[owner + 1], army)
+                for index, (owner, army) in enumerate(
+                    zip(columns["owners"], columns["armies"])
+                )
+            },
+            {((t["x"], t["y"], t["z"]), t["owner"], t["army"]) for t in rows},
+        )
+
+
+class ColumnarSubsetTestCase(GameClientMixin, TestCase):
+    """ Tiles listed by the generic views are columns too, with their indices """
+
+    def setUp(self):
+        super().setUp()
+        self.url = f"/api/game/{self.game.id}/tiles/"
+        player = PlayerFactory(game=self.game)
+        self.game.tiles.filter(x=0, y=0).update(owner=player, army=5)
+
+    def get_both(self, params):
+        """ Columnar and row by row responses """
+        response = self.client.get(self.url, dict(params, format="columnar"))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            response["Content-Type"], "application/vnd.overthrow.columnar+json"
+        )
+        return response.json(), self.client.get(self.url, params).json()
+
+    def assert_same_tiles(self, columns, rows):
+        topology = Topology.for_radius(columns["radius"])
+        players = [None] + columns["players"]
+        self.assertEqual(
+            {
+                (tuple(topology.coords[index]), players[owner + 1], army)
+                for index, owner, army in zip(
+                    columns["indices"], columns["owners"], columns["armies"]
+                )
+            },
+            {((t["x"], t["y"], t["z"]), t["owner"], t["army"]) for t in rows},
+        )
+
+    def test_region(self):
+        columns, rows = self.get_both({"center": "0,0,0", "radius": 1})
+        self.assertEqual(len(columns["indices"]), 7)
+        self.assert_same_tiles(columns, rows)
+
+    def test_pages(self):
+        page, rows = self.get_both({"limit": 7})
+        self.assertIn("after=6", page["next"])
+        self.assertIn("format=columnar", page["next"])
+        self.assertEqual(page["results"]["indices"], list(range(7)))
+        self.assert_same_tiles(page["results"], rows["results"])
+
+    def test_since_tick(self):
+        PlayerFactory(game=self.game).grant_initial_tiles(tile_count=2, army=3)
+        delta, rows = self.get_both({"since_tick": 0})
+        self.assertEqual(
+            (delta["tick"], delta["full"], delta["deleted"]), (0, False, [])
+        )
+        self.assertEqual(len(delta["changed"]["indices"]), 2)
+        self.assert_same_tiles(delta["changed"], rows["changed"])
+
+
+class AcceptEncodingTestCase(SimpleTestCase):
+    def test_accepted_encoding(self):
+        self.assertEqual(caching.accepted_encoding(""), "identity")
+        self.assertEqual(caching.accepted_encoding("gzip;q=0, deflate"), "identity")
+        self.assertEqual(caching.accepted_encoding("deflate, GZIP;q=0.5"), "gzip")
+        self.assertEqual(caching.accepted_encoding("*"), caching.ENCODINGS[0])
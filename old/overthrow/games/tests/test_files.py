@@ -0,0 +1,33 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from overthrow.games.files import atomic_write
+
+
+class AtomicWriteTestCase(SimpleTestCase):
+    def test_replaces_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "nested", "file")
+            with atomic_write(path) as f:
+                f.write("old")
+            with atomic_write(path, "wb") as f:
+                f.write(b"new")
+            with open(path) as f:
+                self.assertEqual(f.read(), "new")
+            self.assertEqual(os.listdir(os.path.dirname(path)), ["file"])
+
+    def test_error_keeps_old_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "file")
+            with atomic_write(path) as f:
+                f.write("old")
+            with self.assertRaises(ValueError):
+                with atomic_write(path) as f:
+                    f.write("partial")
+                    raise ValueError
+            with open(path) as f:
+                self.assertEqual(f.read(), "old")
+            # no temporary file left behind
+            self.assertEqual(os.listdir(directory), ["file"])
@@ -0,0 +1,74 @@
+from hypothesis import given, strategies as st
+from hypothesis.extra.django import TestCase
+
+from overthrow.games import coords
+from overthrow.games.factories import PlayerFactory
+from overthrow.games.models import Movement
+from overthrow.games.tests import GameClientMixin, strategies
+
+
+class RegionFilterTestCase(GameClientMixin, TestCase):
+    radius = 4
+
+    def get_coords(self, **params):
+        response = self.client.get(f"/api/game/{self.game.id}/tiles/", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return {(tile["x"], tile["y"], tile["z"]) for tile in response.json()}
+
+    @given(center=strategies.coords(max_radius=4), radius=st.integers(0, 3))
+    def test_hex_range(self, center, radius):
+        self.assertEqual(
+            self.get_coords(center=",".join(map(str, center)), radius=radius),
+            {
+                tile.coords
+                for tile in self.game.tiles.all()
+                if coords.distance(tile.coords, center) <= radius
+            },
+        )
+
+    def test_rectangle(self):
+        self.assertEqual(
+            self.get_coords(x="0,1", y="-1,0"),
+            {(0, -1, 1), (0, 0, 0), (1, -1, 0), (1, 0, -1)},
+        )
+        # intersected with the hex range
+        self.assertEqual(
+            self.get_coords(x="0,1", y="-1,0", center="0,0,0", radius=0), {(0, 0, 0)}
+        )
+
+    def test_invalid(self):
+        response = self.client.get(
+            f"/api/game/{self.game.id}/tiles/", {"center": "1,1,1", "radius": 1}
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(f"/api/game/{self.game.id}/tiles/", {"x": "1"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_movements_by_source_or_target(self):
+        player = PlayerFactory(game=self.game)
+        self.game.tiles.update(owner=player)
+        tiles = {tile.coords: tile for tile in self.game.tiles.all()}
+        outgoing = Movement.objects.create(
+            source=tiles[(0, 0, 0)], target=tiles[(4, -4, 0)], amount=1
+        )
+        incoming = Movement.objects.create(
+            source=tiles[(-4, 4, 0)], target=tiles[(0, 0, 0)], amount=1
+        )
+        Movement.objects.create(
+            source=tiles[(-4, 0, 4)], target=tiles[(4, 0, -4)], amount=1
+        )
+        self.client.force_authenticate(player.user)
+        url = f"/api/game/{self.game.id}/movements/"
+        region = {"center": "0,0,0", "radius": 1}
+        response = self.client.get(url, region)
+        self.assertEqual(
+            {movement["id"] for movement in response.json()},
+            {str(outgoing.id), str(incoming.id)},
+        )
+
+        Movement.objects.filter(id=incoming.id).update(changed_tick=1)
+        response = self.client.get(url, {"since_tick": 0, **region})
+        self.assertEqual(
+            [movement["id"] for movement in response.json()["changed"]],
+            [str(incoming.id)],
+        )
@@ -0,0 +1,94 @@
+from hypothesis.extra.django import TestCase
+from rest_framework.test import APIClient
+
+from overthrow.games.factories import PlayerFactory
+from overthrow.games.game_cache import GameStateCache
+from overthrow.games.models import Game, Movement
+
+
+class GameStateCacheTestCase(TestCase):
+    def test_versioned_by_tick(self):
+        game = Game.generate_hexagonal(1)
+        states = GameStateCache(size=2)
+        snapshot = states.get(game)
+        self.assertIs(states.get(game), snapshot)
+        self.assertEqual((states.hits, states.misses), (1, 1))
+
+        game.simulate()
+        self.assertEqual(states.get(game).tick, 1)
+        self.assertEqual((states.hits, states.misses), (1, 2))
+
+    def test_versioned_by_revision(self):
+        game = Game.generate_hexagonal(1)
+        states = GameStateCache(size=2)
+        snapshot = states.get(game)
+
+        player = PlayerFactory(game=game)
+        (tile,) = player.grant_initial_tiles(tile_count=1, army=1)
+        game.refresh_from_db()
+        self.assertIsNot(states.get(game), snapshot)
+        self.assertEqual(states.get(game).tile_owner(tile.id), player.id)
+        self.assertEqual((states.hits, states.misses), (1, 2))
+
+    def test_least_recently_used_dropped(self):
+        games = [Game.generate_hexagonal(1) for i in range(3)]
+        states = GameStateCache(size=2)
+        for game in games + games[1:]:
+            states.get(game)
+        self.assertEqual(states.stats(), {"size": 2, "hits": 2, "misses": 3})
+        states.get(games[0])
+        self.assertEqual(states.misses, 4)
+
+    def test_movements_served_from_cache(self):
+        game = Game.generate_hexagonal(1)
+        player = PlayerFactory(game=game)
+        other_player = PlayerFactory(game=game)
+        tiles = list(game.tiles.all())
+        for tile, owner in zip(tiles, [player, other_player]):
+            tile.owner = owner
+            tile.save()
+        movement = Movement.objects.create(source=tiles[0], target=tiles[2], amount=1)
+        Movement.objects.create(source=tiles[1], target=tiles[2], amount=1)
+        client = APIClient()
+        client.force_authenticate(player.user)
+        url = f"/api/game/{game.id}/movements/"
+
+        expected = [
+            {
+                "id": str(movement.id),
+                "source": str(tiles[0].id),
+                "target": str(tiles[2].id),
+                "amount": 1,
+            }
+        ]
+        self.assertEqual(client.get(url).json(), expected)
+        # the game only
+        with self.assertNumQueries(1):
+            self.assertEqual(client.get(url).json(), expected)
+
+    def test_orders_of_joined_player(self):
+        game = Game.generate_hexagonal(2)
+        client = APIClient()
+        # the board is cached before the player joins
+        self.assertEqual(len(client.get(f"/api/game/{game.id}/tiles/").json()), 19)
+        player = PlayerFactory(game=game)
+        source, target = player.grant_initial_tiles(tile_count=2, army=5)
+        client.force_authenticate(player.user)
+
+        response = client.post(
+            f"/api/tile/{source.id}/move/", {"target": str(target.id), "amount": 1}
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        response = client.post(
+            f"/api/game/{game.id}/orders/",
+            [
+                {
+                    "kind": "create",
+                    "source": str(target.id),
+                    "target": str(source.id),
+                    "amount": 1,
+                }
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
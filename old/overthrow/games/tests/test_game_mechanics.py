@@ -17,6 +17,7 @@ from overthrow.games.game_simulator import (
 )
 from overthrow.games.models import Tile, Movement, Player
 from overthrow.games.tests import strategies
+from overthrow.games.topology import Topology
 
 
 def get_armies_by_user_id(game):
@@ -96,6 +97,7 @@ class PossibilitiesTestCase(OSUrandomPatcher, TestCase):
         )
     )
     def test_movement_moves_armies(self, game):
+        topology = Topology.for_game(game)
         tile = Tile.objects.get(game=game, x=0, y=0, z=0)
         expected_tile_army_after = tile.army
         movement_happening = False
@@ -105,7 +107,7 @@ class PossibilitiesTestCase(OSUrandomPatcher, TestCase):
             if movement.source_id == tile.id:
                 movement_happening = True
                 expected_tile_army_after -= movement.amount
-            next_tile_coords = coords.next_on_path(
+            next_tile_coords = topology.next_on_path(
                 movement.source.coords, movement.target.coords
             )
             if next_tile_coords == tile.coords:
@@ -147,8 +149,9 @@ class PossibilitiesTestCase(OSUrandomPatcher, TestCase):
         )
         game.simulate()
 
+        topology = Topology.for_game(game)
         for m in movements:
-            next_tile_coords = coords.next_on_path(m.source.coords, m.target.coords)
+            next_tile_coords = topology.next_on_path(m.source.coords, m.target.coords)
             tile = Tile.objects.get(game=game, **coords.as_dict(next_tile_coords))
             self.assertEqual(
                 tile.owner_id, player.id,
@@ -174,7 +177,9 @@ class PossibilitiesTestCase(OSUrandomPatcher, TestCase):
         next_tile = Tile.objects.filter(
             game=game,
             **coords.as_dict(
-                coords.next_on_path(movement.source.coords, movement.target.coords,)
+                Topology.for_game(game).next_on_path(
+                    movement.source.coords, movement.target.coords,
+                )
             )
         ).first()
         assume(movement.source.owner_id != next_tile.owner_id)
@@ -210,12 +215,13 @@ class FacilitiesTestCase(TestCase):
     )
     def test_movements_work_on_long_distances(self, game):
         """ Movements transfers armies aross many tiles and many turns """
+        topology = Topology.for_game(game)
         tile = Tile.objects.get(game=game, x=0, y=0, z=0)
         amount_by_target = defaultdict(int)
         for movement in Movement.objects.filter(source__game=game).select_related(
             "source", "target"
         ):
-            next_tile_coords = coords.next_on_path(
+            next_tile_coords = topology.next_on_path(
                 movement.source.coords, movement.target.coords
             )
             if next_tile_coords == tile.coords and movement.target_id != tile.id:
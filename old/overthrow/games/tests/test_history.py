@@ -0,0 +1,163 @@
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+from hypothesis.extra.django import TestCase
+from rest_framework.test import APIClient
+
+from overthrow.games import history, ticker
+from overthrow.games.benchmark import generate_game
+from overthrow.games.factories import PlayerFactory
+from overthrow.games.models import Game, HistoryFrame, Movement
+from overthrow.games.server import GameServer
+from overthrow.games.ticker import Ticker
+
+
+def get_indexed_board(game):
+    """ Owners, armies and movements by tile index, as in the database """
+    tiles = list(game.tiles.order_by("index").values_list("owner_id", "army"))
+    return (
+        [owner for owner, army in tiles],
+        [army for owner, army in tiles],
+        sorted(
+            Movement.objects.filter(source__game=game).values_list(
+                "source__index", "target__index", "amount"
+            )
+        ),
+    )
+
+
+def get_history_board(game, tick):
+    board = history.reconstruct(game, tick)
+    movements = board["movements"]
+    return (
+        [None if owner < 0 else board["players"][owner] for owner in board["owners"]],
+        board["armies"],
+        list(zip(movements["sources"], movements["targets"], movements["amounts"])),
+    )
+
+
+@override_settings(GAME_HISTORY_KEYFRAME_INTERVAL=4)
+class HistoryTestCase(TestCase):
+    def setUp(self):
+        self.game = generate_game(3, seed=1)
+
+    def test_every_tick(self):
+        boards = [get_indexed_board(self.game)]
+        for tick in range(9):
+            self.game.simulate()
+            boards.append(get_indexed_board(self.game))
+        self.assertEqual(
+            list(self.game.history.order_by("tick").values_list("tick", "keyframe")),
+            [(tick, tick % 4 == 0) for tick in range(10)],
+        )
+        for tick, board in enumerate(boards):
+            self.assertEqual(get_history_board(self.game, tick), board)
+
+    def test_many_ticks_at_once(self):
+        self.game.simulate(ticks=6)
+        self.assertEqual(
+            list(self.game.history.order_by("tick").values_list("tick", flat=True)),
+            list(range(7)),
+        )
+        self.assertEqual(get_history_board(self.game, 6), get_indexed_board(self.game))
+
+    def test_not_covered(self):
+        self.game.simulate(ticks=2)
+        self.assertIsNone(history.reconstruct(self.game, 3))
+        HistoryFrame.objects.filter(tick=1).delete()
+        self.assertIsNone(history.reconstruct(self.game, 2))
+
+    def frames(self):
+        return [
+            (tick, keyframe, history.decode(data).rebased)
+            for tick, keyframe, data in self.game.history.order_by("tick").values_list(
+                "tick", "keyframe", "data"
+            )
+        ]
+
+    def test_player_joins(self):
+        self.game.simulate()
+        player = PlayerFactory(game=self.game)
+        self.assertTrue(player.grant_initial_tiles(tile_count=3, army=2))
+        self.game.refresh_from_db()
+        self.game.simulate()
+        board = get_indexed_board(self.game)
+        self.game.simulate()
+        self.assertEqual(
+            self.frames(),
+            [(0, True, False), (1, False, False), (2, True, True), (3, False, False)],
+        )
+        self.assertEqual(get_history_board(self.game, 2), board)
+        self.assertEqual(get_history_board(self.game, 3), get_indexed_board(self.game))
+
+    def test_skipped_ticks(self):
+        self.game.simulate()
+        Game.objects.filter(id=self.game.id).update(
+            started_at=timezone.now() - settings.TICK_DURATION * 4.5
+        )
+        self.assertEqual(Ticker(policy=ticker.SKIP).advance(self.game), (1, 2))
+        self.game.refresh_from_db()
+        self.game.simulate()
+        self.assertEqual(
+            self.frames(),
+            [(0, True, False), (1, False, False), (2, False, False), (5, True, True)],
+        )
+        self.assertIsNone(history.reconstruct(self.game, 4))
+        self.assertEqual(get_history_board(self.game, 5), get_indexed_board(self.game))
+
+    def test_game_server(self):
+        Game.objects.filter(id=self.game.id).update(
+            started_at=timezone.now() - settings.TICK_DURATION * 5.5
+        )
+        server = GameServer(game_ids=[self.game.id])
+        server.load()
+        server.run_once()
+        server.flush()
+        self.assertEqual(self.game.history.count(), 6)
+        self.game.refresh_from_db()
+        self.assertEqual(get_history_board(self.game, 5), get_indexed_board(self.game))
+
+    def test_disabled(self):
+        with override_settings(GAME_HISTORY_KEYFRAME_INTERVAL=0):
+            self.game.simulate()
+        self.assertFalse(self.game.history.exists())
+
+
+class HistoryAPITestCase(TestCase):
+    def setUp(self):
+        self.game = generate_game(2, seed=2)
+        self.game.simulate(ticks=2)
+        self.player = (
+            Movement.objects.filter(source__game=self.game).first().source.owner
+        )
+        self.client = APIClient()
+
+    def get(self, tick):
+        return self.client.get(f"/api/game/{self.game.id}/history/", {"tick": tick})
+
+    def test_own_movements(self):
+        owned = set(
+            Movement.objects.filter(source__owner=self.player).values_list(
+                "source__index", "target__index", "amount"
+            )
+        )
+        self.assertTrue(owned)
+        self.client.force_authenticate(self.player.user)
+        response = self.get(2)
+        self.assertEqual(response.status_code, 200)
+        board = response.json()
+        self.assertEqual(board["tick"], 2)
+        movements = board["movements"]
+        self.assertEqual(
+            set(zip(movements["sources"], movements["targets"], movements["amounts"])),
+            owned,
+        )
+
+    def test_anonymous(self):
+        response = self.get(1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["movements"]["sources"], [])
+
+    def test_errors(self):
+        self.assertEqual(self.get(3).status_code, 404)
+        self.assertEqual(self.get("now").status_code, 400)
@@ -0,0 +1,135 @@
+import os
+import socket
+import tempfile
+import time
+
+from django.test import override_settings
+from hypothesis.extra.django import TestCase
+from rest_framework.test import APIClient
+
+from overthrow.games import game_cache, metrics
+from overthrow.games.benchmark import generate_game
+from overthrow.games.ticker import Ticker
+from overthrow.users.factories import UserFactory
+
+
+@override_settings(TICK_METRICS=True, TICK_METRICS_DIR=None)
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        metrics.registry.clear()
+        self.game = generate_game(3, seed=1)
+        self.client = APIClient()
+        self.client.force_authenticate(UserFactory(is_staff=True))
+
+    def tearDown(self):
+        metrics.registry.clear()
+
+    def phases(self):
+        return {name for name, size in metrics.registry.buckets}
+
+    def test_simulate(self):
+        with self.assertLogs(metrics.logger, "INFO"):
+            self.game.simulate(ticks=2)
+        self.assertLessEqual(
+            {"total", "load", "simulate", "battles", "movements", "save"},
+            self.phases(),
+        )
+        self.assertEqual(
+            {size for name, size in metrics.registry.buckets}, {"1000"},
+        )
+        for buckets in metrics.registry.buckets.values():
+            self.assertEqual(sum(buckets), 1)  # one observation per call
+        self.assertEqual(metrics.registry.counts[("tiles_loaded", "1000")], 37)
+
+    def test_lock(self):
+        self.game.simulate_till_now(max_ticks=1)
+        self.assertIn("lock", self.phases())
+        self.assertEqual(len(metrics.registry.buckets[("total", "1000")]), 14)
+        self.assertEqual(sum(metrics.registry.buckets[("total", "1000")]), 1)
+
+        Ticker().advance(self.game)
+        self.assertEqual(sum(metrics.registry.buckets[("total", "1000")]), 2)
+
+    def test_failure_is_not_recorded(self):
+        with self.assertRaises(ZeroDivisionError):
+            with metrics.measure([self.game]):
+                1 / 0
+        self.assertEqual(metrics.registry.buckets, {})
+        self.assertIsNone(metrics.current())
+
+    def test_game_cache(self):
+        game_cache.cache.clear()
+        game_cache.cache.get(self.game)
+        game_cache.cache.get(self.game)
+        text = self.client.get("/api/metrics/").content.decode()
+        self.assertIn("overthrow_game_cache_hits_total 1\n", text)
+        self.assertIn("overthrow_game_cache_misses_total 1\n", text)
+
+    def test_totals_of_web_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(TICK_METRICS_DIR=directory):
+                metrics._last_dump = 0.0
+                metrics.add_total("game_cache_misses")
+                # the registry of this process is only read from its file
+                metrics.registry.clear()
+                collected = metrics.collect()
+        self.assertEqual(collected.totals["game_cache_misses"], 1)
+
+    def test_disabled(self):
+        with override_settings(TICK_METRICS=False):
+            self.game.simulate()
+            response = self.client.get("/api/metrics/")
+        self.assertEqual(metrics.registry.buckets, {})
+        self.assertEqual(response.status_code, 404)
+
+    def test_endpoint(self):
+        self.game.simulate()
+        response = self.client.get("/api/metrics/")
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn(
+            'overthrow_tick_phase_seconds_count{phase="total",tiles_le="1000"} 1', text
+        )
+        self.assertIn(
+            'overthrow_tick_phase_seconds_bucket{phase="total",tiles_le="1000",le="+Inf"} 1',
+            text,
+        )
+        self.assertIn(
+            'overthrow_tick_rows_total{kind="tiles_loaded",tiles_le="1000"} 37', text
+        )
+
+    def test_shared_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(TICK_METRICS_DIR=directory):
+                self.game.simulate()
+                # as if written by another process
+                metrics.registry.dump(os.path.join(directory, "other.json"))
+                collected = metrics.collect()
+        self.assertEqual(sum(collected.buckets[("total", "1000")]), 2)
+        self.assertEqual(collected.counts[("tiles_loaded", "1000")], 74)
+
+    def test_staff_only(self):
+        self.assertEqual(APIClient().get("/api/metrics/").status_code, 401)
+        client = APIClient()
+        client.force_authenticate(UserFactory())
+        self.assertEqual(client.get("/api/metrics/").status_code, 403)
+
+    def test_stale_files_removed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(TICK_METRICS_DIR=directory):
+                self.game.simulate()
+                host = socket.gethostname()
+                paths = {
+                    name: os.path.join(directory, f"{name}.json")
+                    for name in ["old", "recent"]
+                }
+                # no process has a pid that high
+                metrics.registry.dump(os.path.join(directory, f"{host}-99999999.json"))
+                metrics.registry.dump(paths["old"])
+                metrics.registry.dump(paths["recent"])
+                day_ago = time.time() - 24 * 3600 - 1
+                os.utime(paths["old"], (day_ago, day_ago))
+                collected = metrics.collect()
+                left = set(os.listdir(directory))
+        self.assertEqual(sum(collected.buckets[("total", "1000")]), 2)
+        self.assertEqual(left, {f"{host}-{os.getpid()}.json", "recent.json"})
@@ -0,0 +1,187 @@
+from hypothesis.extra.django import TestCase
+
+from overthrow.games.models import Game, Movement, Order
+from overthrow.games.tests import PlayerClientMixin
+
+
+class OrderInboxTestCase(PlayerClientMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.source = self.game.tiles.get(x=0, y=0)
+        self.target = self.game.tiles.get(x=2, y=-2)
+        # no armies, so movements stay where they are
+        self.game.tiles.filter(id=self.source.id).update(owner=self.player, army=0)
+
+    def move(self, amount):
+        response = self.client.post(
+            f"/api/tile/{self.source.id}/move/",
+            {"target": str(self.target.id), "amount": amount},
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()["id"]
+
+    def test_applied_by_tick(self):
+        movement_id = self.move(5)
+        self.assertFalse(Movement.objects.exists())
+        self.game.simulate()
+        movement = Movement.objects.get()
+        self.assertEqual(str(movement.id), movement_id)
+        self.assertEqual(movement.amount, 5)
+        self.assertFalse(Order.objects.exists())
+
+    def test_coalesced(self):
+        movement_id = self.move(5)
+        self.client.patch(f"/api/movement/{movement_id}/", {"amount": 6})
+        self.move(7)
+        self.game.simulate()
+        self.assertEqual(Movement.objects.get().amount, 7)
+
+        self.client.patch(f"/api/movement/{movement_id}/", {"amount": 8})
+        self.client.delete(f"/api/movement/{movement_id}/")
+        self.game.simulate()
+        self.assertFalse(Movement.objects.exists())
+
+    def test_created_and_deleted(self):
+        movement_id = self.move(5)
+        Order.objects.create(
+            game=self.game,
+            player=self.player,
+            kind=Order.DELETE,
+            movement_id=movement_id,
+        )
+        self.game.simulate()
+        self.assertFalse(Movement.objects.exists())
+
+    def test_dropped_when_tile_is_lost(self):
+        self.move(5)
+        self.game.tiles.filter(id=self.source.id).update(owner=None)
+        self.game.simulate()
+        self.assertFalse(Movement.objects.exists())
+
+    def test_target_in_other_game(self):
+        other = Game.generate_hexagonal(1).tiles.first()
+        response = self.client.post(
+            f"/api/tile/{self.source.id}/move/", {"target": str(other.id), "amount": 1},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderBatchTestCase(PlayerClientMixin, TestCase):
+    radius = 3
+
+    def setUp(self):
+        super().setUp()
+        self.game.tiles.filter(x__lte=0).update(owner=self.player, army=0)
+        self.sources = list(self.game.tiles.filter(owner=self.player))
+        self.target = self.game.tiles.get(x=3, y=-3)
+
+    def submit(self, operations):
+        return self.client.post(
+            f"/api/game/{self.game.id}/orders/", operations, format="json"
+        )
+
+    def test_batch(self):
+        existing = Movement.objects.create(
+            source=self.sources[0], target=self.target, amount=1
+        )
+        operations = [{"kind": "update", "movement": str(existing.id), "amount": 3}] + [
+            {
+                "kind": "create",
+                "source": str(source.id),
+                "target": str(self.target.id),
+                "amount": 2,
+            }
+            for source in self.sources[1:]
+        ]
+        # the game, its state on a cache miss (tiles, players, movements), and
+        # the insert of all orders: savepoint, insert, release
+        with self.assertNumQueries(7):
+            response = self.submit(operations)
+        self.assertEqual(response.status_code, 201, response.content)
+
+        self.game.simulate()
+        self.assertEqual(
+            {
+                (m.source_id, m.amount)
+                for m in Movement.objects.filter(source__game=self.game)
+            },
+            {(self.sources[0].id, 3)} | {(s.id, 2) for s in self.sources[1:]},
+        )
+
+    def test_create_on_existing_path(self):
+        existing = Movement.objects.create(
+            source=self.sources[0], target=self.target, amount=1
+        )
+        create = {
+            "kind": "create",
+            "source": str(self.sources[0].id),
+            "target": str(self.target.id),
+            "amount": 4,
+        }
+        response = self.submit([create])
+        self.assertEqual(response.status_code, 201, response.content)
+        (queued,) = response.json()
+        self.assertEqual(
+            (queued["kind"], queued["movement"]), ("update", str(existing.id))
+        )
+
+        # the returned id works for later commands
+        self.game.simulate()
+        response = self.submit(
+            [{"kind": "update", "movement": queued["movement"], "amount": 5}]
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.game.simulate()
+        existing.refresh_from_db()
+        self.assertEqual(existing.amount, 5)
+
+    def test_creates_on_same_path(self):
+        create = {
+            "kind": "create",
+            "source": str(self.sources[0].id),
+            "target": str(self.target.id),
+            "amount": 4,
+        }
+        response = self.submit([create, dict(create, amount=6)])
+        self.assertEqual(response.status_code, 201, response.content)
+        first, second = response.json()
+        self.assertEqual(first["movement"], second["movement"])
+        self.game.simulate()
+        movement = Movement.objects.get(source=self.sources[0])
+        self.assertEqual((str(movement.id), movement.amount), (first["movement"], 6))
+
+    def test_all_or_nothing(self):
+        other_game_tile = Game.generate_hexagonal(1).tiles.first()
+        foreign_tile = self.game.tiles.get(x=1, y=0)
+        response = self.submit(
+            [
+                {
+                    "kind": "create",
+                    "source": str(self.sources[0].id),
+                    "target": str(self.target.id),
+                    "amount": 1,
+                },
+                {
+                    "kind": "create",
+                    "source": str(self.sources[1].id),
+                    "target": str(other_game_tile.id),
+                    "amount": 1,
+                },
+                {
+                    "kind": "create",
+                    "source": str(foreign_tile.id),
+                    "target": str(self.target.id),
+                    "amount": 1,
+                },
+            ]
+        )
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertEqual(errors[0], {})
+        self.assertIn("target", errors[1])
+        self.assertTrue(errors[2])
+        self.assertFalse(Order.objects.exists())
+
+        response = self.submit([{"kind": "delete"}])
+        self.assertEqual(response.json(), [{"movement": ["This field is required."]}])
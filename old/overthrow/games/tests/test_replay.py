@@ -0,0 +1,109 @@
+from io import StringIO
+import uuid
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from django.utils import timezone
+from hypothesis.extra.django import TestCase
+import numpy as np
+
+from overthrow.games import history
+from overthrow.games.benchmark import generate_game
+from overthrow.games.factories import PlayerFactory
+from overthrow.games.models import Game, Order
+from overthrow.games.replay import replay
+from overthrow.games.server import GameServer
+
+
+@override_settings(GAME_HISTORY_KEYFRAME_INTERVAL=4)
+class ReplayTestCase(TestCase):
+    def setUp(self):
+        self.game = generate_game(3, seed=3)
+        self.source = self.game.tiles.exclude(owner=None).order_by("index").first()
+        self.source.army = 50
+        self.source.save()
+        self.target = self.game.tiles.exclude(owner=self.source.owner).last()
+
+    def order(self, kind=Order.CREATE, **kwargs):
+        return Order(
+            game=self.game,
+            player=self.source.owner,
+            kind=kind,
+            movement_id=uuid.uuid4(),
+            source=self.source,
+            target=self.target,
+            amount=30,
+            **kwargs,
+        )
+
+    def test_same_results(self):
+        self.game.simulate()
+        self.order().save()
+        for tick in range(7):
+            self.game.simulate()
+        replayed = list(replay(self.game))
+        self.assertEqual([r.tick for r in replayed], list(range(1, 9)))
+        for r in replayed:
+            self.assertEqual(r.checksum, r.expected, r.tick)
+        self.assertTrue(history.decode(self.game.history.get(tick=2).data).orders.size)
+
+        # from a keyframe in the middle
+        self.assertEqual(len(list(replay(self.game, from_tick=5, to_tick=7))), 2)
+
+    def test_different_results(self):
+        self.game.simulate()
+        self.order().save()
+        self.game.simulate(ticks=3)
+        # as if the order wasn't there
+        frame = self.game.history.get(tick=2)
+        decoded = history.decode(frame.data)
+        frame.data = history.encode(
+            decoded._replace(orders=np.zeros(0, dtype=history.MOVEMENT))
+        )
+        frame.save()
+        replayed = list(replay(self.game))
+        self.assertEqual(replayed[0].checksum, replayed[0].expected)
+        self.assertNotEqual(replayed[1].checksum, replayed[1].expected)
+
+        with self.assertRaises(CommandError):
+            call_command("replay_game", str(self.game.id), stdout=StringIO())
+
+    def test_player_joins(self):
+        self.game.simulate(ticks=2)
+        # sorted first, so indices of the recorded players shift
+        newcomer = PlayerFactory(game=self.game, id=uuid.UUID(int=0))
+        newcomer.grant_initial_tiles(tile_count=3, army=2)
+        self.game.refresh_from_db()
+        self.game.simulate(ticks=2)
+        with self.assertRaisesRegex(ValueError, "before tick 3"):
+            list(replay(self.game))
+        with self.assertRaisesRegex(CommandError, "before tick 3"):
+            call_command("replay_game", str(self.game.id), stdout=StringIO())
+
+        (replayed,) = replay(self.game, from_tick=3)
+        self.assertEqual((replayed.tick, replayed.checksum), (4, replayed.expected))
+
+    def test_game_server(self):
+        Game.objects.filter(id=self.game.id).update(
+            started_at=timezone.now() - settings.TICK_DURATION * 6.5
+        )
+        server = GameServer(game_ids=[self.game.id])
+        server.load()
+        server.submit([self.order()])
+        server.run_once()
+        server.flush()
+        replayed = list(replay(self.game))
+        self.assertEqual(len(replayed), 6)
+        for r in replayed:
+            self.assertEqual(r.checksum, r.expected, r.tick)
+
+    def test_command(self):
+        self.game.simulate(ticks=3)
+        output = StringIO()
+        call_command("replay_game", str(self.game.id), stdout=output)
+        self.assertIn("replayed 3 ticks", output.getvalue())
+        with self.assertRaises(CommandError):
+            call_command(
+                "replay_game", str(self.game.id), from_tick=7, stdout=StringIO()
+            )
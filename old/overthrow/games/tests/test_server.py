@@ -0,0 +1,219 @@
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+from hypothesis.extra.django import TestCase
+
+from overthrow.games import orders
+from overthrow.games.benchmark import generate_game
+from overthrow.games.factories import PlayerFactory
+from overthrow.games.game_simulator import GameSimulator
+from overthrow.games.models import Game, Movement, Order
+from overthrow.games.server import GameServer, order_to_json, send
+from overthrow.games.state import GameState
+from overthrow.games.tests import get_board
+from overthrow.games.ticker import Ticker
+
+
+def get_state_board(state):
+    """ Board of the state, as `get_board` gives it """
+    return (
+        {
+            state.tile_ids[tile.id]: (
+                None if tile.owner_id is None else state.player_ids[tile.owner_id],
+                tile.army,
+            )
+            for tile in state.tiles
+        },
+        {
+            (state.tile_ids[m.source_id], state.tile_ids[m.target_id]): m.amount
+            for m in state.movements
+        },
+    )
+
+
+class GameServerTestCase(TestCase):
+    def setUp(self):
+        self.game = generate_game(2, seed=1)
+        self.make_due(self.game, 3)
+
+    def make_due(self, game, ticks):
+        Game.objects.filter(id=game.id).update(
+            started_at=timezone.now() - settings.TICK_DURATION * (ticks + 0.5)
+        )
+
+    def test_written_behind(self):
+        expected = GameState.load(self.game)
+        for tick in range(3):
+            expected.advance(GameSimulator)
+
+        server = GameServer(game_ids=[self.game.id])
+        server.load()
+        self.assertEqual(server.run_once(), 3)
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.tick, 0)
+
+        server.flush()
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.tick, 3)
+        self.assertEqual(get_board(self.game), get_state_board(expected))
+
+    def test_lag_bounded(self):
+        server = GameServer(game_ids=[self.game.id], max_lag=2)
+        server.load()
+        server.run_once()
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.tick, 3)
+
+    def test_leased(self):
+        server = GameServer(game_ids=[self.game.id])
+        server.load()
+        ticker = Ticker()
+        self.assertEqual(ticker.claim(ticker.due_games()), [])
+        server.close()
+        self.assertEqual(len(ticker.claim(ticker.due_games())), 1)
+
+    def test_recovery(self):
+        server = GameServer(name="server", game_ids=[self.game.id])
+        server.load()
+        server.run_once()
+        # crashed before writing anything, restarted
+        server = GameServer(name="server", game_ids=[self.game.id])
+        self.assertEqual(len(server.load()), 1)
+        self.assertEqual(server.run_once(), 3)
+
+    def test_orders(self):
+        # a quiet board, nothing gets conquered
+        game = Game.generate_hexagonal(1)
+        self.make_due(game, 1)
+        player = PlayerFactory(game=game)
+        source, target = game.tiles.all()[:2]
+        game.tiles.filter(id=source.id).update(owner=player, army=0)
+        movement_id = uuid.uuid4()
+        server = GameServer(game_ids=[game.id])
+        server.load()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/server.sock"
+            server.serve(path)
+            with override_settings(GAME_SERVER_SOCKET=path):
+                orders.submit(
+                    [
+                        Order(
+                            game_id=game.id,
+                            player_id=player.id,
+                            kind=Order.CREATE,
+                            movement_id=movement_id,
+                            source_id=source.id,
+                            target_id=target.id,
+                            amount=3,
+                        )
+                    ]
+                )
+            status = send({"op": "status"}, path)
+            self.assertEqual(status["games"][str(game.id)]["orders"], 1)
+            server.run_once()
+            server.close()
+
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Movement.objects.get(id=movement_id).amount, 3)
+
+    def test_database_inbox_drained(self):
+        player = self.game.players.first()
+        movement = Movement.objects.filter(source__game=self.game).first()
+        self.game.tiles.filter(id=movement.source_id).update(owner=player)
+        server = GameServer(game_ids=[self.game.id])
+        server.load()
+        order = Order(
+            game_id=self.game.id,
+            player_id=player.id,
+            kind=Order.DELETE,
+            movement_id=movement.id,
+        )
+        self.assertEqual(order_to_json(order)["source"], None)
+        order.save()
+        server.flush()
+        server.run_once()
+        server.flush()
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Movement.objects.filter(id=movement.id).exists())
+
+    def test_queued_orders_kept(self):
+        player = self.game.players.first()
+        server = GameServer(game_ids=[self.game.id])
+        server.load()
+        server.submit(
+            [
+                Order(
+                    game_id=self.game.id,
+                    player_id=player.id,
+                    kind=Order.DELETE,
+                    movement_id=uuid.uuid4(),
+                )
+            ]
+        )
+        server.close()
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_player_joins(self):
+        # a quiet board, nothing gets conquered
+        game = Game.generate_hexagonal(2)
+        self.make_due(game, 1)
+        server = GameServer(game_ids=[game.id])
+        server.load()
+
+        player = PlayerFactory(game=game)
+        source, target = player.grant_initial_tiles(tile_count=2, army=5)
+        server.submit(
+            [
+                Order(
+                    game_id=game.id,
+                    player_id=player.id,
+                    kind=Order.CREATE,
+                    movement_id=uuid.uuid4(),
+                    source_id=source.id,
+                    target_id=target.id,
+                    amount=3,
+                )
+            ]
+        )
+        # simulated on the board from before the join, so not written
+        self.assertEqual(server.run_once(), 1)
+        self.assertEqual(server.flush(), 0)
+        game.refresh_from_db()
+        self.assertEqual((game.tick, game.revision), (0, 1))
+
+        self.assertEqual(server.run_once(), 1)
+        self.assertEqual(server.flush(), 1)
+        game.refresh_from_db()
+        self.assertEqual((game.tick, game.revision), (1, 0))
+        # the order moved 3 of 5 armies
+        self.assertEqual(
+            dict(game.tiles.filter(owner=player).values_list("id", "army")),
+            {source.id: 2, target.id: 8},
+        )
+
+    def test_lease_lost(self):
+        server = GameServer(game_ids=[self.game.id])
+        server.load()
+        server.run_once()
+        player = self.game.players.first()
+        server.submit(
+            [
+                Order(
+                    game_id=self.game.id,
+                    player_id=player.id,
+                    kind=Order.DELETE,
+                    movement_id=uuid.uuid4(),
+                )
+            ]
+        )
+        Game.objects.filter(id=self.game.id).update(claimed_by="ticker")
+
+        self.assertEqual(server.flush(), 0)
+        self.assertEqual(server.states, {})
+        self.game.refresh_from_db()
+        self.assertEqual((self.game.tick, self.game.claimed_by), (0, "ticker"))
+        self.assertEqual(Order.objects.count(), 1)
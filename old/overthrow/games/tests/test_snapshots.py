@@ -0,0 +1,124 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+from hypothesis.extra.django import TestCase, TransactionTestCase
+
+from overthrow.games import snapshots
+from overthrow.games.benchmark import generate_game
+from overthrow.games.factories import PlayerFactory
+from overthrow.games.models import Game
+from overthrow.games.server import GameServer
+from overthrow.games.state import GameState
+
+
+def get_plain(state):
+    """ State with uuids in place of dense ids """
+    return (
+        state.game.tick,
+        sorted(
+            (
+                state.tile_ids[tile.id],
+                tile.x,
+                tile.y,
+                None if tile.owner_id is None else state.player_ids[tile.owner_id],
+                tile.army,
+            )
+            for tile in state.tiles
+        ),
+        sorted(
+            (
+                movement_id,
+                state.tile_ids[movement.source_id],
+                state.tile_ids[movement.target_id],
+                movement.amount,
+            )
+            for movement_id, movement in state.movements_by_uuid().items()
+        ),
+    )
+
+
+class SnapshotDirMixin:
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(GAME_SNAPSHOT_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class SnapshotTestCase(SnapshotDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.game = generate_game(3, seed=1)
+        self.state = GameState.load(self.game)
+        snapshots.write(self.state)
+
+    def test_restored(self):
+        snapshot = snapshots.read(self.game)
+        with self.assertNumQueries(1):  # players
+            (restored,) = GameState.from_snapshots([self.game], [snapshot])
+        self.assertEqual(get_plain(restored), get_plain(self.state))
+        self.assertEqual(
+            [(p.corporation_id, p.boss_id) for p in restored.players],
+            [(p.corporation_id, p.boss_id) for p in self.state.players],
+        )
+
+    def test_stale(self):
+        self.game.tick += 1
+        self.assertIsNone(snapshots.read(self.game))
+        self.assertEqual(
+            get_plain(snapshots.load_states([self.game])[0]),
+            get_plain(GameState.load(self.game)),
+        )
+
+    def test_damaged(self):
+        with open(snapshots.path(self.game.id), "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 1]))
+        self.assertIsNone(snapshots.read(self.game))
+        self.assertFalse(os.path.exists(snapshots.path(self.game.id)))
+
+    def test_game_server_restart(self):
+        Game.objects.filter(id=self.game.id).update(
+            started_at=timezone.now() - settings.TICK_DURATION * 2.5
+        )
+        server = GameServer(name="server", game_ids=[self.game.id])
+        server.load()
+        server.run_once()
+        server.flush()
+        expected = get_plain(server.states[self.game.id])
+
+        server = GameServer(name="server", game_ids=[self.game.id])
+        # savepoint, claim, lease, release and players, no tiles nor movements
+        with self.assertNumQueries(5):
+            server.load()
+        self.assertEqual(get_plain(server.states[self.game.id]), expected)
+
+    def test_discarded_when_player_joins(self):
+        PlayerFactory(game=self.game).grant_initial_tiles(tile_count=3, army=1)
+        self.assertIsNone(snapshots.read(self.game))
+
+
+class SimulateSnapshotTestCase(SnapshotDirMixin, TransactionTestCase):
+    def test_written_by_simulate(self):
+        game = generate_game(3, seed=2)
+        for i in range(3):
+            # the first tick loads the whole board, later ones update the snapshot
+            game.simulate()
+            game.refresh_from_db()
+            snapshot = snapshots.read(game)
+            self.assertIsNotNone(snapshot)
+            (restored,) = GameState.from_snapshots([game], [snapshot])
+            self.assertEqual(get_plain(restored), get_plain(GameState.load(game)))
+
+    def test_not_written_when_disabled(self):
+        game = Game.generate_hexagonal(1)
+        with override_settings(GAME_SNAPSHOT_DIR=None):
+            game.simulate()
+        self.assertFalse(os.listdir(settings.GAME_SNAPSHOT_DIR))
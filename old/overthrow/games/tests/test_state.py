@@ -0,0 +1,170 @@
+import uuid
+
+from hypothesis import given
+from hypothesis.extra.django import TestCase
+
+from overthrow.games.factories import PlayerFactory
+from overthrow.games.game_simulator import GameSimulator
+from overthrow.games.models import Game, Movement, Order, Tile
+from overthrow.games.orders import apply_to_state
+from overthrow.games.state import GameState
+from overthrow.games.tests import get_board, strategies
+
+
+class GameStateTestCase(TestCase):
+    @given(game=strategies.games())
+    def test_nothing_changed(self, game):
+        state = GameState.load(game)
+        self.assertEqual(state.diff(), ([], [], [], []))
+
+    @given(game=strategies.games())
+    def test_same_result_as_model_simulation(self, game):
+        tiles, movements = get_board(game)
+        # in the canonical order of GameState
+        simulator = GameSimulator(
+            list(game.tiles.order_by("x", "y")),
+            list(
+                Movement.objects.filter(source__game=game).order_by(
+                    "source__x", "source__y", "target__x", "target__y"
+                )
+            ),
+            list(game.players.order_by("id")),
+        )
+        simulator.simulate()
+        for tile_id in simulator.tiles_to_be_updated:
+            tile = simulator.tiles_by_id[tile_id]
+            tiles[tile_id] = (tile.owner_id, tile.army)
+        movements = {
+            (m.source_id, m.target_id): m.amount
+            for m in simulator.movements_by_id.values()
+        }
+
+        game.simulate()
+
+        self.assertEqual(get_board(game), (tiles, movements))
+
+    @given(game=strategies.games(max_radius=1))
+    def test_records_are_compact(self, game):
+        state = GameState.load(game)
+        for record in state.tiles + state.movements + state.players:
+            self.assertFalse(hasattr(record, "__dict__"))
+
+    @given(game=strategies.games(min_player_count=1))
+    def test_active_tiles_are_enough(self, game):
+        whole = GameState.load(game)
+        active = GameState.load(game, ticks=3)
+        for tick in range(3):
+            whole.advance(GameSimulator)
+            active.advance(GameSimulator)
+        self.assertEqual(set(active.diff().tiles), set(whole.diff().tiles))
+        self.assertEqual(
+            [(m.source_id, m.target_id, m.amount) for m in active.movements],
+            [(m.source_id, m.target_id, m.amount) for m in whole.movements],
+        )
+
+    def test_idle_tiles_not_loaded(self):
+        game = Game.generate_hexagonal(5)
+        source = game.tiles.get(x=0, y=0)
+        target = game.tiles.get(x=5, y=-5)
+        Movement.objects.create(source=source, target=target, amount=1)
+        state = GameState.load(game, ticks=1)
+        self.assertEqual(
+            [tile.coords for tile in state.tiles],
+            [(0, 0, 0), (1, -1, 0), (2, -2, 0), (5, -5, 0)],
+        )
+
+    def test_movement_row_follows_armies(self):
+        game = Game.generate_hexagonal(3)
+        player = PlayerFactory(game=game)
+        source = game.tiles.get(x=0, y=0)
+        game.tiles.filter(id=source.id).update(owner=player, army=10)
+        movement = Movement.objects.create(
+            source=source, target=game.tiles.get(x=3, y=-3), amount=10
+        )
+
+        state = GameState.load(game, ticks=2)
+        state.advance(GameSimulator)
+        state.advance(GameSimulator)
+        diff = state.save()
+        self.assertEqual((diff.created, diff.deleted), ([], []))
+
+        movement.refresh_from_db()
+        self.assertEqual(movement.source.coords, (2, -2, 0))
+        self.assertEqual(movement.amount, 10)
+
+    def ordered_state(self, army):
+        """
+        State of a game with a saved movement, deleted by an order along with
+        a movement ordered one hop further on its route, from a tile of army
+        """
+        game = Game.generate_hexagonal(3)
+        player = PlayerFactory(game=game)
+        source = game.tiles.get(x=0, y=0)
+        hop = game.tiles.get(x=1, y=-1)
+        target = game.tiles.get(x=3, y=-3)
+        game.tiles.filter(id=source.id).update(owner=player, army=0)
+        game.tiles.filter(id=hop.id).update(owner=player, army=army)
+        saved = Movement.objects.create(source=source, target=target, amount=10)
+        ordered = uuid.uuid4()
+        state = GameState.load(game)
+        apply_to_state(
+            state,
+            [
+                Order(
+                    game=game, player=player, kind=Order.DELETE, movement_id=saved.id
+                ),
+                Order(
+                    game=game,
+                    player=player,
+                    kind=Order.CREATE,
+                    movement_id=ordered,
+                    source=hop,
+                    target=target,
+                    amount=5,
+                ),
+            ],
+            {tile_id: index for index, tile_id in enumerate(state.tile_ids)},
+        )
+        state.advance(GameSimulator)
+        return state, saved.id, ordered
+
+    def test_ordered_movement_keeps_uuid(self):
+        state, saved, ordered = self.ordered_state(army=0)
+        diff = state.save()
+        self.assertEqual([m[0] for m in diff.created], [ordered])
+        self.assertEqual([m[0] for m in diff.deleted], [saved])
+        self.assertEqual(diff.updated, [])
+        self.assertFalse(Movement.objects.filter(id=saved).exists())
+        self.assertTrue(Movement.objects.filter(id=ordered).exists())
+
+    def test_ordered_movement_uuid_follows_armies(self):
+        state, saved, ordered = self.ordered_state(army=10)
+        diff = state.save()
+        self.assertEqual(
+            [(m[0], Tile.objects.get(id=m[1]).coords) for m in diff.created],
+            [(ordered, (2, -2, 0))],
+        )
+        self.assertEqual([m[0] for m in diff.deleted], [saved])
+
+    def test_movement_row_not_passed_to_boss(self):
+        game = Game.generate_hexagonal(3)
+        boss, subordinate = PlayerFactory(game=game), PlayerFactory(game=game)
+        boss.create_corporation()
+        subordinate.set_boss(boss)
+        source = game.tiles.get(x=0, y=0)
+        game.tiles.filter(id=source.id).update(owner=subordinate, army=10)
+        game.tiles.filter(x=1, y=-1).update(owner=boss, army=0)
+        movement = Movement.objects.create(
+            source=source, target=game.tiles.get(x=3, y=-3), amount=10
+        )
+
+        state = GameState.load(game)
+        state.advance(GameSimulator)
+        diff = state.save()
+        # the subordinate's clients learn the movement is gone
+        self.assertEqual(
+            [(m[0], m[2]) for m in diff.deleted], [(movement.id, subordinate.id)]
+        )
+        ((created, source_id, *rest),) = diff.created
+        self.assertNotEqual(created, movement.id)
+        self.assertEqual(Tile.objects.get(id=source_id).owner, boss)
@@ -0,0 +1,56 @@
+import gzip
+import json
+
+from django.test import SimpleTestCase, override_settings
+from hypothesis.extra.django import TestCase
+
+from overthrow.games import streaming
+from overthrow.games.tests import GameClientMixin
+
+
+class StreamingTestCase(GameClientMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = f"/api/game/{self.game.id}/tiles/"
+
+    def sorted_tiles(self, tiles):
+        return sorted(tiles, key=lambda tile: tile["id"])
+
+    @override_settings(STREAM_LIST_ROWS=10, STREAM_CHUNK_SIZE=3)
+    def test_same_as_rendered_at_once(self):
+        expected = self.sorted_tiles(
+            self.client.get(self.url, {"limit": 100}).data["results"]
+        )
+
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            self.sorted_tiles(json.loads(b"".join(response.streaming_content))),
+            expected,
+        )
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        content = gzip.decompress(b"".join(response.streaming_content))
+        self.assertEqual(self.sorted_tiles(json.loads(content)), expected)
+
+    def test_pages(self):
+        url = f"{self.url}?limit=7"
+        tiles = []
+        while url:
+            page = self.client.get(url).json()
+            tiles.extend(page["results"])
+            url = page["next"]
+        self.assertEqual(len(tiles), 19)
+        self.assertEqual(
+            [(tile["x"], tile["y"]) for tile in tiles],
+            list(self.game.tiles.order_by("index").values_list("x", "y")),
+        )
+
+
+class JSONListTestCase(SimpleTestCase):
+    def test_chunks(self):
+        for count in range(5):
+            rows = [{"row": i} for i in range(count)]
+            chunks = list(streaming.json_list(rows, chunk_size=2))
+            self.assertEqual(json.loads(b"".join(chunks)), rows)
@@ -0,0 +1,91 @@
+from django.test import override_settings
+from hypothesis.extra.django import TestCase
+
+from overthrow.games.factories import PlayerFactory
+from overthrow.games.models import Movement, Order
+from overthrow.games.tests import PlayerClientMixin
+
+
+class DeltaSyncTestCase(PlayerClientMixin, TestCase):
+    radius = 3
+
+    def setUp(self):
+        super().setUp()
+        self.source = self.game.tiles.get(x=0, y=0)
+        self.game.tiles.filter(id=self.source.id).update(owner=self.player, army=10)
+        self.movement = Movement.objects.create(
+            source=self.source, target=self.game.tiles.get(x=3, y=-3), amount=10
+        )
+
+    def get(self, rows, since_tick):
+        response = self.client.get(
+            f"/api/game/{self.game.id}/{rows}/", {"since_tick": since_tick}
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_changed_tiles(self):
+        self.game.simulate()
+        self.game.simulate()
+        tiles = self.get("tiles", 1)
+        self.assertEqual(
+            (tiles["tick"], tiles["full"], tiles["deleted"]), (2, False, [])
+        )
+        # armies left (1, -1) for (2, -2)
+        self.assertEqual(
+            {(tile["x"], tile["y"], tile["army"]) for tile in tiles["changed"]},
+            {(1, -1, 0), (2, -2, 10)},
+        )
+        self.assertEqual(self.get("tiles", 2)["changed"], [])
+
+    def test_deleted_movements(self):
+        self.game.simulate()
+        self.assertEqual(
+            [m["id"] for m in self.get("movements", 0)["changed"]],
+            [str(self.movement.id)],
+        )
+        Order.objects.create(
+            game=self.game,
+            player=self.player,
+            kind=Order.DELETE,
+            movement_id=self.movement.id,
+        )
+        self.game.simulate()
+        movements = self.get("movements", 1)
+        self.assertEqual(movements["changed"], [])
+        self.assertEqual(movements["deleted"], [str(self.movement.id)])
+
+    @override_settings(DELTA_SYNC_TICKS=1)
+    def test_too_far_behind(self):
+        for tick in range(3):
+            self.game.simulate()
+        tiles = self.get("tiles", 1)
+        self.assertTrue(tiles["full"])
+        self.assertEqual(len(tiles["changed"]), self.game.tiles.count())
+        self.assertFalse(self.get("tiles", 2)["full"])
+
+    def test_granted_tiles(self):
+        self.game.simulate()
+        self.get("tiles", 1)
+        newcomer = PlayerFactory(game=self.game)
+        granted = newcomer.grant_initial_tiles(3, 5)
+        tiles = self.get("tiles", 1)
+        self.assertEqual(
+            {tile["id"] for tile in tiles["changed"]},
+            {str(tile.id) for tile in granted},
+        )
+
+    def test_deleted_movements_of_others(self):
+        other = PlayerFactory(game=self.game)
+        source = self.game.tiles.get(x=-1, y=1)
+        self.game.tiles.filter(id=source.id).update(owner=other, army=10)
+        movement = Movement.objects.create(
+            source=source, target=self.game.tiles.get(x=-3, y=3), amount=10
+        )
+        Order.objects.create(
+            game=self.game, player=other, kind=Order.DELETE, movement_id=movement.id,
+        )
+        self.game.simulate()
+        self.assertEqual(self.get("movements", 0)["deleted"], [])
+        self.client.force_authenticate(other.user)
+        self.assertEqual(self.get("movements", 0)["deleted"], [str(movement.id)])
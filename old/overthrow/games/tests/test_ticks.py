@@ -0,0 +1,258 @@
+import io
+import multiprocessing
+import os
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from django.utils import timezone
+from hypothesis import given
+from hypothesis.extra.django import TestCase
+
+from overthrow.games import ticker
+from overthrow.games.benchmark import generate_game
+from overthrow.games.models import Game
+from overthrow.games.tests import get_board, strategies
+from overthrow.games.ticker import Ticker
+
+
+class CatchUpTestCase(TestCase):
+    @given(game=strategies.games(min_player_count=1))
+    def test_many_ticks_at_once(self, game):
+        savepoint = transaction.savepoint()
+        for _ in range(3):
+            game.simulate()
+        tick_by_tick = get_board(game)
+        transaction.savepoint_rollback(savepoint)
+
+        game.simulate(ticks=3)
+        self.assertEqual(get_board(game), tick_by_tick)
+
+    def test_simulate_till_now(self):
+        game = Game.generate_hexagonal(1)
+        game.started_at = timezone.now() - settings.TICK_DURATION * 5.5
+        game.save()
+
+        self.assertEqual(game.simulate_till_now(max_ticks=2), 2)
+        self.assertEqual(game.tick, 2)
+        self.assertEqual(game.simulate_till_now(), 3)
+        game.refresh_from_db()
+        self.assertEqual(game.tick, 5)
+        self.assertEqual(game.simulate_till_now(), 0)
+
+
+class SimulateManyTestCase(TestCase):
+    @given(
+        first=strategies.games(min_player_count=1),
+        second=strategies.games(min_player_count=1),
+    )
+    def test_same_as_one_by_one(self, first, second):
+        savepoint = transaction.savepoint()
+        first.simulate(ticks=2)
+        second.simulate()
+        one_by_one = (get_board(first), get_board(second))
+        transaction.savepoint_rollback(savepoint)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        Game.simulate_many([first, second], ticks=[2, 1])
+        self.assertEqual((get_board(first), get_board(second)), one_by_one)
+        self.assertEqual((first.tick, second.tick), (2, 1))
+
+    def test_queries_independent_of_game_count(self):
+        games = [generate_game(2, seed=i) for i in range(10)]
+        # savepoint, orders, 3 selects, writes (2 temporary tables and 2 statement
+        # batches with COPY, 5 bulk queries otherwise), history, tick update, release
+        writes = 4 if connection.vendor == "postgresql" else 5
+        with self.assertNumQueries(8 + writes):
+            Game.simulate_many(games)
+
+
+class TickerTestCase(TestCase):
+    def overdue_game(self, ticks):
+        game = Game.generate_hexagonal(1)
+        game.started_at = timezone.now() - settings.TICK_DURATION * ticks
+        game.save()
+        return game
+
+    def test_most_overdue_first(self):
+        slightly = self.overdue_game(1.5)
+        badly = self.overdue_game(3.5)
+        self.overdue_game(0.5)
+        self.assertEqual(
+            [game.id for lag, game in Ticker().due_games()], [badly.id, slightly.id],
+        )
+
+    def test_batch(self):
+        game = self.overdue_game(5.5)
+        self.assertEqual(Ticker(policy=ticker.BATCH).run_once(), 1)
+        game.refresh_from_db()
+        self.assertEqual(game.tick, 5)
+        self.assertEqual(Ticker().run_once(), 0)
+
+    def test_serial_on_single_cpu(self):
+        with mock.patch.object(ticker.os, "cpu_count", return_value=1):
+            self.assertEqual(Ticker(workers=4).workers, 1)
+        with mock.patch.object(ticker.os, "cpu_count", return_value=2):
+            self.assertEqual(Ticker(workers=4).workers, 4)
+
+    def test_skip(self):
+        game = self.overdue_game(5.5)
+        self.assertEqual(Ticker(policy=ticker.SKIP).advance(game), (1, 4))
+        game.refresh_from_db()
+        self.assertEqual(game.tick, 5)
+        self.assertEqual(game.due_ticks(), 0)
+
+    def test_slow(self):
+        game = self.overdue_game(5.5)
+        self.assertEqual(Ticker(policy=ticker.SLOW).advance(game), (1, 0))
+        game.refresh_from_db()
+        self.assertEqual(game.tick, 1)
+        self.assertEqual(game.due_ticks(), 0)
+
+    def test_failure_isolation(self):
+        broken = self.overdue_game(2.5)
+        healthy = self.overdue_game(1.5)
+        simulate_many = Game.simulate_many
+
+        def simulate_or_fail(games, ticks=None):
+            if broken.id in [game.id for game in games]:
+                raise RuntimeError("simulation failed")
+            simulate_many(games, ticks)
+
+        with mock.patch.object(Game, "simulate_many", simulate_or_fail):
+            with self.assertLogs(ticker.logger, "ERROR"):
+                self.assertEqual(Ticker(batch_size=2).run_once(), 2)
+        healthy.refresh_from_db()
+        self.assertEqual(healthy.tick, 1)
+        broken.refresh_from_db()
+        self.assertEqual(broken.tick, 0)
+
+    def test_command(self):
+        self.overdue_game(2.5)
+        out = io.StringIO()
+        call_command("run_ticker", "--once", stdout=out)
+        self.assertIn("2 ticks simulated", out.getvalue())
+
+
+class ClaimTestCase(TestCase):
+    def setUp(self):
+        self.game = Game.generate_hexagonal(1)
+        self.game.started_at = timezone.now() - settings.TICK_DURATION * 1.5
+        self.game.save()
+
+    def test_leased_by_other(self):
+        Game.objects.update(
+            claimed_by="other", claimed_until=timezone.now() + settings.TICK_DURATION
+        )
+        self.assertEqual(Ticker(name="me").run_once(), 0)
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.tick, 0)
+
+    def test_expired_lease(self):
+        Game.objects.update(
+            claimed_by="crashed", claimed_until=timezone.now() - settings.TICK_DURATION
+        )
+        self.assertEqual(Ticker(name="me").run_once(), 1)
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.tick, 1)
+        self.assertEqual(self.game.claimed_by, "")
+        self.assertIsNone(self.game.claimed_until)
+
+    def test_advanced_meanwhile(self):
+        runner = Ticker(name="me")
+        due = runner.due_games()
+        self.game.simulate()
+        self.assertEqual(runner.claim(due), [])
+
+    def test_claim_size(self):
+        self.game.pk = None
+        self.game.save()
+        runner = Ticker(name="me", claim_size=1)
+        self.assertEqual(len(runner.claim(runner.due_games())), 1)
+        self.assertEqual(Game.objects.filter(claimed_by="me").count(), 1)
+
+    def test_most_overdue_claimed_first(self):
+        games = []
+        for ticks in [3.5, 0.5, 2.5, 4.5, 1.5]:
+            game = Game.generate_hexagonal(1)
+            game.started_at = timezone.now() - settings.TICK_DURATION * ticks
+            game.save()
+            games.append(game)
+        Game.objects.filter(id=games[3].id).update(
+            claimed_by="other", claimed_until=timezone.now() + settings.TICK_DURATION
+        )
+        runner = Ticker(name="me", claim_size=2)
+        claimed = runner.claim(runner.due_games())
+        self.assertEqual(
+            [game.id for lag, game in claimed], [games[0].id, games[2].id],
+        )
+
+
+def run_ticker_process(name):
+    ticker._init_worker()
+    return Ticker(name=name, claim_size=2).run_once()
+
+
+def exit_worker(*args):
+    os._exit(1)
+
+
+@skipUnless(connection.vendor == "postgresql", "worker processes need a shared db")
+class ParallelTickerTestCase(TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        # pools are used only with more CPUs
+        patcher = mock.patch.object(ticker.os, "cpu_count", return_value=4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_workers(self):
+        games = [generate_game(2, seed=i) for i in range(6)]
+        Game.objects.update(started_at=timezone.now() - settings.TICK_DURATION * 2.5)
+        runner = Ticker(workers=3)
+        try:
+            self.assertEqual(runner.run_once(), 6)
+        finally:
+            runner.close()
+        for game in games:
+            game.refresh_from_db()
+            self.assertEqual(game.tick, 2)
+
+    def test_broken_pool(self):
+        game = generate_game(2, seed=1)
+        Game.objects.update(started_at=timezone.now() - settings.TICK_DURATION * 1.5)
+        runner = Ticker(workers=2)
+        shutdown = ticker.ProcessPoolExecutor.shutdown
+        try:
+            with mock.patch.object(ticker, "_advance_by_ids", exit_worker):
+                with mock.patch.object(
+                    ticker.ProcessPoolExecutor,
+                    "shutdown",
+                    autospec=True,
+                    side_effect=shutdown,
+                ) as broken_shutdown:
+                    self.assertEqual(runner.run_once(), 1)
+            broken_shutdown.assert_called_once_with(mock.ANY, wait=False)
+            self.assertIsNone(runner._pool)
+            # a new pool next time
+            self.assertEqual(runner.run_once(), 1)
+        finally:
+            runner.close()
+        game.refresh_from_db()
+        self.assertEqual(game.tick, 1)
+
+    def test_many_tickers(self):
+        games = [generate_game(2, seed=i) for i in range(10)]
+        Game.objects.update(started_at=timezone.now() - settings.TICK_DURATION * 1.5)
+        connection.close()
+        with multiprocessing.Pool(4) as pool:
+            processed = []
+            while sum(processed) < len(games):
+                processed += pool.map(run_ticker_process, [f"w{i}" for i in range(4)])
+        self.assertEqual(sum(processed), len(games))
+        self.assertEqual(
+            set(Game.objects.values_list("tick", "claimed_by")), {(1, "")},
+        )
@@ -0,0 +1,67 @@
+import tempfile
+
+from django.test import SimpleTestCase
+from hypothesis import given, strategies as st
+from hypothesis.extra.django import TestCase
+import numpy as np
+
+from overthrow.games import coords
+from overthrow.games.tests import strategies
+from overthrow.games.topology import Topology
+
+
+class TopologyTestCase(SimpleTestCase):
+    @given(data=st.data(), radius=st.integers(min_value=1, max_value=8))
+    def test_next_on_path_is_step_towards(self, data, radius):
+        topology = Topology.for_radius(radius)
+        src = data.draw(strategies.coords(max_radius=radius))
+        dst = data.draw(strategies.coords(max_radius=radius))
+        self.assertEqual(
+            topology.next_on_path(src, dst), coords.next_on_path(src, dst),
+        )
+
+    def test_vectorized_next_hops(self):
+        topology = Topology.for_radius(3)
+        sources, targets = np.divmod(np.arange(topology.size ** 2), topology.size)
+        next_hops = topology.next_hops(sources, targets)
+        for source, target, next_hop in zip(sources, targets, next_hops):
+            self.assertEqual(next_hop, topology.next_hop(source, target))
+
+    def test_neighbours(self):
+        topology = Topology.for_radius(3)
+        for index, tile_coords in enumerate(topology.coords.tolist()):
+            expected = {
+                coords.sum(tile_coords, d)
+                for d in coords.neighbour_deltas
+                if coords.distance(coords.sum(tile_coords, d), (0, 0, 0)) <= 3
+            }
+            self.assertEqual(
+                {tuple(topology.coords[n]) for n in topology.neighbours(index)},
+                expected,
+            )
+
+    def test_shared_between_games(self):
+        self.assertIs(Topology.for_radius(4), Topology.for_radius(4))
+
+    def test_memory_mapped(self):
+        topology = Topology.build(5)
+        with tempfile.TemporaryDirectory() as directory:
+            topology.save(f"{directory}/hexagonal-5")
+            loaded = Topology.load(5, f"{directory}/hexagonal-5")
+            self.assertIsInstance(loaded.steps, np.memmap)
+            for name in Topology._arrays:
+                np.testing.assert_array_equal(
+                    getattr(loaded, name), getattr(topology, name)
+                )
+
+
+class BoardTopologyTestCase(TestCase):
+    @given(game=strategies.boards(max_radius=3))
+    def test_dense_index(self, game):
+        topology = Topology.for_game(game)
+        tiles = list(game.tiles.all())
+        self.assertEqual(len(tiles), topology.size)
+        for tile in tiles:
+            self.assertEqual(
+                tuple(topology.coords[topology.index(tile.coords)]), tile.coords
+            )
@@ -0,0 +1,52 @@
+from unittest import skipUnless
+
+from django.db import IntegrityError, connection, transaction
+from hypothesis import given
+from hypothesis.extra.django import TestCase
+
+from overthrow.games.benchmark import generate_game
+from overthrow.games.game_simulator import GameSimulator
+from overthrow.games.models import Movement
+from overthrow.games.state import GameState, StateDiff
+from overthrow.games.tests import strategies
+from overthrow.games.writers import write_diff_copy, write_diff_orm
+
+
+def get_rows(game):
+    return (
+        set(game.tiles.values_list("id", "owner_id", "army", "changed_tick")),
+        set(
+            Movement.objects.filter(source__game=game).values_list(
+                "id", "source_id", "target_id", "amount", "changed_tick"
+            )
+        ),
+        set(game.deleted_movements.values_list("movement_id", "player_id", "tick")),
+    )
+
+
+@skipUnless(connection.vendor == "postgresql", "COPY is Postgres only")
+class CopyWriterTestCase(TestCase):
+    @given(game=strategies.games(min_player_count=1))
+    def test_same_as_orm(self, game):
+        state = GameState.load(game)
+        state.advance(GameSimulator)
+        state.advance(GameSimulator)
+        diff = state.diff()
+
+        savepoint = transaction.savepoint()
+        write_diff_orm(diff)
+        expected = get_rows(game)
+        transaction.savepoint_rollback(savepoint)
+
+        write_diff_copy(diff)
+        self.assertEqual(get_rows(game), expected)
+
+    def test_created_id_collision(self):
+        game = generate_game(2, seed=1)
+        movement = Movement.objects.filter(source__game=game).first()
+        diff = StateDiff(
+            [], [(movement.id, movement.source_id, movement.target_id, 1, 1)], [], [],
+        )
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                write_diff_copy(diff)
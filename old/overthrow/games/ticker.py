@@ -0,0 +1,302 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import datetime
+import itertools
+import logging
+import os
+import socket
+import time
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import metrics
+from .models import Game
+
+
+logger = logging.getLogger(__name__)
+
+# What to do with a game that is more than one tick behind
+BATCH = "batch"  # simulate all missed ticks at once (up to max_ticks)
+SKIP = "skip"  # simulate one tick, drop the rest
+SLOW = "slow"  # simulate one tick, delay the game clock by the rest
+POLICIES = (BATCH, SKIP, SLOW)
+
+
+class Ticker:
+    """ Drives game clocks: simulates games whose next tick is due. """
+
+    def __init__(
+        self,
+        policy=BATCH,
+        max_ticks=None,
+        interval=1.0,
+        workers=1,
+        name=None,
+        claim_size=100,
+        batch_size=1,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown catch up policy {policy}")
+        self.policy = policy
+        self.max_ticks = max_ticks
+        self.interval = interval
+        if workers > 1 and os.cpu_count() == 1:
+            # worker processes only add overhead without another CPU to run on
+            logger.warning("single CPU, simulating games in this process")
+            workers = 1
+        self.workers = workers  # simulate games in that many processes
+        self._pool = None
+        # identity of this ticker among all tickers sharing the database
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.claim_size = claim_size
+        # games simulated together, with state loaded and written in bulk
+        self.batch_size = batch_size
+
+    def due_games(self, now=None):
+        """ [(lag, game)] for games with a due tick, most overdue first """
+        now = now or timezone.now()
+        due = []
+        for game in Game.objects.only("id", "tick", "started_at"):
+            lag = now - game.next_tick_at
+            if lag >= datetime.timedelta(0):
+                due.append((lag, game))
+        due.sort(key=lambda item: item[0], reverse=True)
+        return due
+
+    def claim(self, due, now=None):
+        """
+        Lease some of the due games to this ticker.
+
+        Games leased by other tickers, locked by their transactions or already
+        advanced since `due` was read are skipped, so tickers on many hosts
+        can share the database without double simulating or waiting for each
+        other. A lease expires after TICK_LEASE_DURATION, so games of a
+        crashed ticker are eventually taken over.
+        """
+        now = now or timezone.now()
+        claimed = set()
+        with transaction.atomic():
+            # in chunks following the order of `due`, so the most overdue
+            # games are taken first when there are more than claim_size
+            for start in range(0, len(due), self.claim_size):
+                ticks = {
+                    game.id: game.tick
+                    for lag, game in due[start : start + self.claim_size]
+                }
+                claimable = dict(
+                    Game.objects.select_for_update(skip_locked=True)
+                    .filter(id__in=ticks.keys())
+                    .filter(Q(claimed_until=None) | Q(claimed_until__lt=now))
+                    .values_list("id", "tick")
+                )
+                claimed.update(
+                    [
+                        game_id
+                        for game_id, tick in ticks.items()
+                        if claimable.get(game_id) == tick
+                    ][: self.claim_size - len(claimed)]
+                )
+                if len(claimed) >= self.claim_size:
+                    break
+            Game.objects.filter(id__in=claimed).update(
+                claimed_by=self.name, claimed_until=now + settings.TICK_LEASE_DURATION
+            )
+        return [(lag, game) for lag, game in due if game.id in claimed]
+
+    def release(self, games):
+        Game.objects.filter(
+            id__in=[game.id for game in games], claimed_by=self.name
+        ).update(claimed_by="", claimed_until=None)
+
+    def run_once(self):
+        """ Advance claimed due games. Returns number of processed games. """
+        due = self.claim(self.due_games())
+        try:
+            self._run(due)
+        finally:
+            self.release([game for lag, game in due])
+        return len(due)
+
+    def _run(self, due):
+        lags = {game.id: lag for lag, game in due}
+        games = [game for lag, game in due]
+        batches = [
+            games[i : i + self.batch_size]
+            for i in range(0, len(games), self.batch_size)
+        ]
+        if self.workers > 1:
+            results = self._advance_in_pool(batches)
+        else:
+            results = itertools.chain.from_iterable(
+                _timed_advance(self, batch) for batch in batches
+            )
+        for game, result in results:
+            if isinstance(result, Exception):
+                logger.error(
+                    "game %s: simulation failed",
+                    game.id,
+                    exc_info=(type(result), result, result.__traceback__),
+                )
+                continue
+            simulated, dropped, duration = result
+            logger.info(
+                "game %s: lag %.3fs, %d ticks simulated in %.3fs, %d dropped",
+                game.id,
+                lags[game.id].total_seconds(),
+                simulated,
+                duration,
+                dropped,
+            )
+            if duration > settings.TICK_DURATION.total_seconds():
+                logger.warning(
+                    "game %s: tick took %.3fs, longer than tick duration",
+                    game.id,
+                    duration,
+                )
+
+    def _advance_in_pool(self, batches):
+        if self._pool is None:
+            # forked workers must not inherit open connections
+            connections.close_all()
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker
+            )
+        futures = {}
+        for batch in batches:
+            future = self._pool.submit(
+                _advance_by_ids,
+                self.policy,
+                self.max_ticks,
+                [game.id for game in batch],
+            )
+            futures[future] = batch
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                results = dict(future.result())
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool) and self._pool is not None:
+                    # a worker died, start over with a fresh pool next time
+                    self._pool.shutdown(wait=False)
+                    self._pool = None
+                results = {game.id: e for game in batch}
+            for game in batch:
+                yield game, results[game.id]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def advance(self, game):
+        """ Returns numbers of simulated and dropped ticks """
+        return self.advance_many([game])[0]
+
+    @transaction.atomic
+    def advance_many(self, games):
+        """ Simulate due ticks of games together, see `Game.simulate_many` """
+        with metrics.measure(games):
+            return self._advance_many(games)
+
+    def _advance_many(self, games):
+        with metrics.phase("lock"):
+            locked = list(
+                Game.objects.filter(id__in=[game.id for game in games])
+                .select_for_update()
+                .order_by("id")
+            )
+        now = timezone.now()
+        results = {}
+        for game in locked:
+            due = game.due_ticks(now)
+            if self.policy == BATCH:
+                max_ticks = self.max_ticks or settings.MAX_CATCH_UP_TICKS
+                results[game.id] = (min(due, max_ticks), 0)
+            else:
+                results[game.id] = (min(due, 1), 0)
+
+        to_simulate = [game for game in locked if results[game.id][0]]
+        Game.simulate_many(
+            to_simulate, ticks=[results[game.id][0] for game in to_simulate]
+        )
+
+        for game in locked:
+            missed = game.due_ticks(now)
+            if missed and self.policy == SKIP:
+                # not simulated, so the history has to start over with a keyframe
+                Game.objects.filter(id=game.id).update(
+                    tick=F("tick") + missed, revision=F("revision") + 1
+                )
+                results[game.id] = (results[game.id][0], missed)
+            if missed and self.policy == SLOW:
+                Game.objects.filter(id=game.id).update(
+                    started_at=F("started_at") + settings.TICK_DURATION * missed
+                )
+        return [results[game.id] for game in games]
+
+    def sleep_time(self):
+        """ Time until the nearest tick of a free game, but no longer than interval """
+        now = timezone.now()
+        next_ticks = [
+            game.next_tick_at
+            for game in Game.objects.filter(
+                Q(claimed_until=None) | Q(claimed_until__lt=now)
+            ).only("id", "tick", "started_at")
+        ]
+        if not next_ticks:
+            return self.interval
+        return max(0, min(self.interval, (min(next_ticks) - now).total_seconds()))
+
+    def run_forever(self):
+        try:
+            while True:
+                if not self.run_once():
+                    time.sleep(self.sleep_time())
+        finally:
+            self.close()
+
+
+def _timed_advance(ticker, games):
+    """
+    [(game, result)] where result is (simulated, dropped, duration) or the
+    exception that stopped the simulation. If a batch fails, its games are
+    retried one by one, so a single broken game doesn't stop the others.
+    """
+    started = time.monotonic()
+    try:
+        results = ticker.advance_many(games)
+    except Exception as e:
+        if len(games) == 1:
+            return [(games[0], e)]
+        return list(
+            itertools.chain.from_iterable(
+                _timed_advance(ticker, [game]) for game in games
+            )
+        )
+    duration = time.monotonic() - started
+    return [
+        (game, (simulated, dropped, duration))
+        for game, (simulated, dropped) in zip(games, results)
+    ]
+
+
+def _init_worker():
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def _advance_by_ids(policy, max_ticks, game_ids):
+    """ Pool worker entry point """
+    games = list(Game.objects.filter(id__in=game_ids))
+    return [
+        (game.id, result)
+        for game, result in _timed_advance(
+            Ticker(policy=policy, max_ticks=max_ticks), games
+        )
+    ]
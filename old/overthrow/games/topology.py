@@ -0,0 +1,159 @@
+import functools
+import os
+
+from django.conf import settings
+import numpy as np
+
+from . import coords as hex_coords
+from .files import atomic_write
+
+
+class Topology:
+    """
+    Shape of a hexagonal board: dense tile indices, adjacency and paths.
+
+    Tiles are indexed 0..N-1 in the order of `Game.generate_hexagonal`. Topology
+    depends only on the radius, so a single instance is shared by all games
+    of the same radius in the process (see `for_radius`).
+    """
+
+    _arrays = (
+        "coords",
+        "grid",
+        "neighbour_indptr",
+        "neighbour_indices",
+        "steps",
+    )
+
+    def __init__(
+        self, radius, coords, grid, neighbour_indptr, neighbour_indices, steps,
+    ):
+        self.radius = radius
+        self.coords = coords  # index -> (x, y, z)
+        self.grid = grid  # [x + radius, y + radius] -> index, -1 outside of board
+        # CSR adjacency: neighbours of i are indices[indptr[i]:indptr[i + 1]]
+        self.neighbour_indptr = neighbour_indptr
+        self.neighbour_indices = neighbour_indices
+        # [dx + 2 * radius, dy + 2 * radius] -> (x, y) of the first step on
+        # the path between two tiles differing by (dx, dy). Paths depend only
+        # on the difference, so this covers every (tile, target) pair.
+        self.steps = steps
+
+    @classmethod
+    def build(cls, radius):
+        span = np.arange(-radius, radius + 1)
+        xs, ys = (a.ravel() for a in np.meshgrid(span, span, indexing="ij"))
+        on_board = np.abs(xs + ys) <= radius
+        coords = np.stack((xs, ys, -xs - ys), axis=1)[on_board]
+        grid = np.full(len(xs), -1, dtype=np.int64)
+        grid[on_board] = np.arange(len(coords))
+        grid = grid.reshape(2 * radius + 1, 2 * radius + 1)
+
+        deltas = np.array(hex_coords.neighbour_deltas)
+        candidates = (coords[:, None, :] + deltas[None, :, :]).reshape(-1, 3)
+        inside = np.all(np.abs(candidates) <= radius, axis=1)
+        neighbours = np.full(len(candidates), -1, dtype=np.int64)
+        neighbours[inside] = grid[
+            candidates[inside, 0] + radius, candidates[inside, 1] + radius
+        ]
+        neighbours = neighbours.reshape(len(coords), len(deltas))
+        neighbour_indptr = np.zeros(len(coords) + 1, dtype=np.int64)
+        np.cumsum((neighbours >= 0).sum(axis=1), out=neighbour_indptr[1:])
+        neighbour_indices = neighbours[neighbours >= 0]
+
+        # vectorized coords.step_towards for every possible difference
+        span = np.arange(-2 * radius, 2 * radius + 1)
+        dxs, dys = (a.ravel() for a in np.meshgrid(span, span, indexing="ij"))
+        differences = np.stack((dxs, dys, -dxs - dys), axis=1)
+        smallest = np.argmin(np.abs(differences), axis=1)
+        differences[np.arange(len(differences)), smallest] = 0
+        steps = np.sign(differences[:, :2]).astype(np.int8)
+        steps = steps.reshape(len(span), len(span), 2)
+
+        return cls(radius, coords, grid, neighbour_indptr, neighbour_indices, steps)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def for_radius(radius):
+        """ Shared topology, loaded from TOPOLOGY_CACHE_DIR when configured """
+        if not settings.TOPOLOGY_CACHE_DIR:
+            return Topology.build(radius)
+        path = os.path.join(settings.TOPOLOGY_CACHE_DIR, f"hexagonal-{radius}")
+        try:
+            return Topology.load(radius, path)
+        except FileNotFoundError:
+            topology = Topology.build(radius)
+            topology.save(path)
+            return topology
+
+    @staticmethod
+    def for_game(game):
+        return Topology.for_radius(game.radius)
+
+    @staticmethod
+    def for_tiles(tiles):
+        """ Topology of the smallest board containing all given tiles """
+        return Topology.for_radius(
+            max((max(map(abs, tile.coords)) for tile in tiles), default=0)
+        )
+
+    def save(self, path):
+        """ Each array is replaced atomically, so concurrent saves don't clash """
+        for name in self._arrays:
+            with atomic_write(os.path.join(path, f"{name}.npy"), "wb") as f:
+                np.save(f, getattr(self, name))
+
+    @classmethod
+    def load(cls, radius, path):
+        return cls(
+            radius,
+            **{
+                name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                for name in cls._arrays
+            },
+        )
+
+    @property
+    def size(self):
+        return len(self.coords)
+
+    def index(self, coords):
+        x, y, z = coords
+        if max(abs(x), abs(y), abs(z)) > self.radius or x + y + z != 0:
+            raise KeyError(coords)
+        return int(self.grid[x + self.radius, y + self.radius])
+
+    def indices(self, coords):
+        """ Vectorized index, for array of (x, y, ...) rows """
+        coords = np.asarray(coords, dtype=np.int64).reshape(-1, 3)
+        return self.grid[coords[:, 0] + self.radius, coords[:, 1] + self.radius]
+
+    def neighbours(self, index):
+        return self.neighbour_indices[
+            self.neighbour_indptr[index] : self.neighbour_indptr[index + 1]
+        ]
+
+    def next_hop(self, source, target):
+        """ Index of the next tile on the path from source to target """
+        r = self.radius
+        sx, sy, _ = self.coords[source].tolist()
+        tx, ty, _ = self.coords[target].tolist()
+        dx, dy = self.steps[tx - sx + 2 * r, ty - sy + 2 * r].tolist()
+        return int(self.grid[sx + dx + r, sy + dy + r])
+
+    def next_hops(self, sources, targets):
+        """ Vectorized next_hop """
+        r = self.radius
+        source_coords = self.coords[sources]
+        differences = self.coords[targets] - source_coords
+        steps = self.steps[differences[:, 0] + 2 * r, differences[:, 1] + 2 * r]
+        return self.grid[
+            source_coords[:, 0] + steps[:, 0] + r,
+            source_coords[:, 1] + steps[:, 1] + r,
+        ]
+
+    def next_on_path(self, src, dst):
+        """ Same as coords.next_on_path, for tiles on this board """
+        return tuple(
+            self.coords[self.next_hop(self.index(src), self.index(dst))].tolist()
+        )
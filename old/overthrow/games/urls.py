@@ -11,5 +11,8 @@ urlpatterns = [
     path("api/game/<uuid:id>/players/", views.PlayerListView.as_view()),
     path("api/tile/<uuid:id>/move/", views.MoveAPIView.as_view()),
     path("api/game/<uuid:id>/movements/", views.MoveListAPIView.as_view()),
+    path("api/game/<uuid:id>/orders/", views.OrderBatchAPIView.as_view()),
+    path("api/game/<uuid:id>/history/", views.HistoryAPIView.as_view()),
     path("api/movement/<uuid:pk>/", views.MovementAPIView.as_view()),
+    path("api/metrics/", views.MetricsAPIView.as_view()),
 ]
@@ -1,9 +1,33 @@
-from rest_framework import generics
+import uuid
+
+from rest_framework import generics, status, views
+from rest_framework import permissions as rest_permissions
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
 from django.utils.functional import cached_property
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy as _
 
-from .models import Game, Tile, Movement
-from . import serializers, permissions
+from .models import DeletedMovement, Game, Tile, Movement, Order, Player
+from . import (
+    caching,
+    filters,
+    game_cache,
+    history,
+    metrics,
+    orders,
+    pagination,
+    permissions,
+    renderers,
+    serializers,
+    streaming,
+)
 
 
 class GameViewMixin:
@@ -16,15 +40,161 @@ class GameViewMixin:
             return Game.objects.first()
 
 
-class PlayerListView(GameViewMixin, generics.ListAPIView):
+class TickCacheMixin:
+    """
+    Full lists change only with game ticks and players joining. They are
+    rendered once per tick and revision of the game (see
+    `overthrow.games.caching`) and get ETag and Last-Modified based on them,
+    so clients can revalidate with a 304.
+
+    Lists too long to be kept in memory are streamed instead, see
+    `overthrow.games.streaming`.
+    """
+
+    cached_formats = ["json"]
+
+    def should_stream(self):
+        return False
+
+    def get_version(self):
+        return f"{self.game.tick}.{self.game.revision}"
+
+    def get_list_data(self):
+        return self.get_serializer(self.get_queryset(), many=True).data
+
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        filtered = set(request.query_params) - {"format"}
+        if renderer.format not in self.cached_formats or filtered:
+            return super().list(request, *args, **kwargs)
+
+        version = f"{self.get_version()}-{renderer.format}"
+        etag = f'W/"{self.game.id}-{version}"'
+        last_modified = None
+        if not self.game.revision:
+            # time of the tick, players joining since then would change it
+            last_modified = (
+                self.game.started_at + self.game.tick * settings.TICK_DURATION
+            ).timestamp()
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        accept_encoding = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        if response is None and renderer.format == "json" and self.should_stream():
+            response = self.streaming_response(renderer, accept_encoding)
+        elif response is None:
+            encoding = caching.accepted_encoding(accept_encoding)
+            bodies = caching.tick_bodies(
+                f"games:{self.game.id}:{self.cache_name}:{version}",
+                lambda: renderer.render(self.get_list_data()),
+            )
+            response = HttpResponse(bodies[encoding], content_type=renderer.media_type)
+            if encoding != "identity":
+                response["Content-Encoding"] = encoding
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        patch_vary_headers(response, ["Accept", "Accept-Encoding"])
+        return response
+
+    def streaming_response(self, renderer, accept_encoding):
+        serializer = self.get_serializer()
+        chunks = streaming.json_list(
+            serializer.to_representation(row)
+            for row in self.get_queryset().iterator(
+                chunk_size=settings.STREAM_CHUNK_SIZE
+            )
+        )
+        # brotli can't be streamed with the standard library
+        encoding = caching.accepted_encoding(accept_encoding, ["gzip"])
+        if encoding == "gzip":
+            chunks = streaming.gzip_chunks(chunks)
+        response = StreamingHttpResponse(chunks, content_type=renderer.media_type)
+        if encoding != "identity":
+            response["Content-Encoding"] = encoding
+        return response
+
+
+class DeltaSyncMixin:
+    """
+    With `?since_tick=N` only rows changed by ticks after N are listed, along
+    with ids of rows deleted meanwhile:
+    {"tick": current tick, "full": false, "changed": [...], "deleted": [...]}
+
+    A client further behind than DELTA_SYNC_TICKS gets all the rows instead,
+    with "full": true, and should drop what it had.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if "since_tick" not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        try:
+            since_tick = int(request.query_params["since_tick"])
+        except ValueError:
+            raise ValidationError({"since_tick": _("A valid integer is required.")})
+
+        # the tick has to be read before rows, so no change is missed
+        tick = self.game.tick
+        queryset = self.filter_queryset(self.get_queryset())
+        full = not (tick - settings.DELTA_SYNC_TICKS <= since_tick <= tick)
+        if full:
+            deleted = []
+        else:
+            queryset = queryset.filter(changed_tick__gt=since_tick)
+            deleted = self.get_deleted(since_tick)
+        return Response(
+            {
+                "tick": tick,
+                "full": full,
+                "changed": self.get_serializer(queryset, many=True).data,
+                "deleted": deleted,
+            }
+        )
+
+    def get_deleted(self, since_tick):
+        return []
+
+
+class PlayerListView(TickCacheMixin, GameViewMixin, generics.ListAPIView):
     serializer_class = serializers.PlayerSerializer
+    cache_name = "players"
+
+    def get_version(self):
+        # players may be added without a grant of tiles, which bumps the revision
+        return f"{super().get_version()}-{self.game.players.count()}"
 
     def get_queryset(self):
         return self.game.players.all()
 
 
-class TileListView(GameViewMixin, generics.ListAPIView):
+class TileListView(DeltaSyncMixin, TickCacheMixin, GameViewMixin, generics.ListAPIView):
     serializer_class = serializers.TileSerializer
+    filter_backends = [filters.RegionFilter]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [
+        renderers.ColumnarJSONRenderer
+    ]
+    pagination_class = pagination.TileIndexPagination
+    cache_name = "tiles"
+    cached_formats = ["json", "columnar"]
+
+    def should_stream(self):
+        # size of a hexagonal board
+        radius = self.game.radius
+        return 3 * radius * (radius + 1) + 1 > settings.STREAM_LIST_ROWS
+
+    def get_list_data(self):
+        snapshot = game_cache.cache.get(self.game)
+        if self.request.accepted_renderer.format == "columnar":
+            return serializers.columnar_tiles(
+                self.game, [(tile[5], tile[6]) for tile in snapshot.tiles]
+            )
+        return serializers.tile_rows(snapshot)
+
+    def get_serializer(self, *args, **kwargs):
+        # filtered, paged and changed tiles are listed by the generic views
+        if kwargs.get("many") and self.request.accepted_renderer.format == "columnar":
+            return serializers.ColumnarTileListSerializer(self.game, *args)
+        return super().get_serializer(*args, **kwargs)
 
     def get_queryset(self):
         tiles = self.game.tiles.all()
@@ -46,19 +216,237 @@ class MoveAPIView(TileViewMixin, generics.CreateAPIView):
         return super().post(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        serializer.save(source=self.tile)
+        # the movement will be created by the next tick, see models.Order
+        target = serializer.validated_data["target"]
+        if target.game_id != self.tile.game_id:
+            raise ValidationError(
+                {"target": _("Source and target have to be tiles in the same game.")}
+            )
+        if target.id == self.tile.id:
+            raise ValidationError({"target": _("Target has to be other than source.")})
+        movement_id = (
+            Movement.objects.filter(source=self.tile, target=target)
+            .values_list("id", flat=True)
+            .first()
+        )
+        order = Order(
+            game_id=self.tile.game_id,
+            player_id=self.tile.owner_id,
+            kind=Order.CREATE if movement_id is None else Order.UPDATE,
+            movement_id=movement_id or uuid.uuid4(),
+            source=self.tile,
+            target=target,
+            amount=serializer.validated_data["amount"],
+        )
+        orders.submit([order])
+        serializer.instance = Movement(
+            id=order.movement_id, source=self.tile, target=target, amount=order.amount,
+        )
 
 
 class MovementAPIView(generics.RetrieveUpdateDestroyAPIView):
+    """ Changes are queued as orders, applied by the next tick """
+
     permission_classes = [permissions.MovementCommandPermission]
     queryset = Movement.objects.all()
-    serializer_class = serializers.MovementSerializer
+    serializer_class = serializers.MovementUpdateSerializer
+
+    def perform_update(self, serializer):
+        movement = serializer.instance
+        movement.amount = serializer.validated_data.get("amount", movement.amount)
+        orders.submit(
+            [
+                Order(
+                    game_id=movement.source.game_id,
+                    player_id=movement.source.owner_id,
+                    kind=Order.UPDATE,
+                    movement_id=movement.id,
+                    amount=movement.amount,
+                )
+            ]
+        )
+
+    def perform_destroy(self, instance):
+        orders.submit(
+            [
+                Order(
+                    game_id=instance.source.game_id,
+                    player_id=instance.source.owner_id,
+                    kind=Order.DELETE,
+                    movement_id=instance.id,
+                )
+            ]
+        )
+
+
+class OrderBatchAPIView(GameViewMixin, generics.GenericAPIView):
+    """
+    Many movement commands at once, all queued as orders or none.
+
+    Validation takes a constant number of queries, whatever the batch size.
+    """
+
+    permission_classes = [rest_permissions.IsAuthenticated]
+    serializer_class = serializers.OrderSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data
+
+        # ownership is checked against the current state of the game
+        snapshot = game_cache.cache.get(self.game)
+        player_id = snapshot.player_of(request.user.id)
+        if player_id is None:
+            raise PermissionDenied()
+
+        errors = []
+        queued = []
+        created = {}  # path -> movement id, of creates in this batch
+        for operation in operations:
+            kind = operation["kind"]
+            if kind == Order.CREATE:
+                owner_id = snapshot.tile_owner(operation["source"])
+                if not snapshot.has_tile(operation["target"]):
+                    errors.append(
+                        {
+                            "target": _(
+                                "Source and target have to be tiles in the same game."
+                            )
+                        }
+                    )
+                    continue
+                # as for single moves, an existing movement gets a new amount
+                path = (operation["source"], operation["target"])
+                movement_id = snapshot.movement_on(*path)
+                if movement_id is not None:
+                    kind = Order.UPDATE
+                else:
+                    movement_id = created.setdefault(path, uuid.uuid4())
+            else:
+                movement_id = operation["movement"]
+                owner_id = snapshot.movement_owner(movement_id)
+            if owner_id != player_id:
+                errors.append({"non_field_errors": _("You don't own the source tile.")})
+                continue
+            errors.append({})
+            queued.append(
+                Order(
+                    game=self.game,
+                    player_id=player_id,
+                    kind=kind,
+                    movement_id=movement_id,
+                    source_id=operation.get("source"),
+                    target_id=operation.get("target"),
+                    amount=operation.get("amount"),
+                )
+            )
+        if any(errors):
+            raise ValidationError(errors)
+
+        with transaction.atomic():
+            orders.submit(queued)
+        return Response(
+            [
+                {
+                    "kind": order.kind,
+                    "movement": order.movement_id,
+                    "source": order.source_id,
+                    "target": order.target_id,
+                    "amount": order.amount,
+                }
+                for order in queued
+            ],
+            status=status.HTTP_201_CREATED,
+        )
 
 
-class MoveListAPIView(GameViewMixin, generics.ListAPIView):
+class MoveListAPIView(DeltaSyncMixin, GameViewMixin, generics.ListAPIView):
     serializer_class = serializers.MovementSerializer
+    filter_backends = [filters.RegionFilter]
+    region_fields = ["source__", "target__"]
 
     def get_queryset(self):
         return Movement.objects.filter(
             source__game=self.game, source__owner__user=self.request.user,
         )
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        snapshot = game_cache.cache.get(self.game)
+        return Response(
+            [
+                {
+                    "id": movement_id,
+                    "source": source_id,
+                    "target": target_id,
+                    "amount": amount,
+                }
+                for movement_id, source_id, target_id, amount in snapshot.movements
+                if snapshot.user_owns(request.user, snapshot.tile_owner(source_id))
+            ]
+        )
+
+    def get_deleted(self, since_tick):
+        return list(
+            DeletedMovement.objects.filter(
+                game=self.game, tick__gt=since_tick, player__user=self.request.user
+            ).values_list("movement_id", flat=True)
+        )
+
+
+class HistoryAPIView(GameViewMixin, generics.GenericAPIView):
+    """
+    Board of the game at a past tick given by `?tick=N`, see
+    `overthrow.games.history`. As in the movement list, only movements of the
+    user are shown.
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            tick = int(request.query_params["tick"])
+        except (KeyError, ValueError):
+            raise ValidationError({"tick": _("A valid integer is required.")})
+        board = history.reconstruct(self.game, tick)
+        if board is None:
+            raise NotFound(_("History of the game doesn't reach this tick."))
+        board["movements"] = self.own_movements(board)
+        return Response(board)
+
+    def own_movements(self, board):
+        player_id = None
+        if self.request.user.is_authenticated:
+            player_id = (
+                Player.objects.filter(game=self.game, user=self.request.user)
+                .values_list("id", flat=True)
+                .first()
+            )
+        movements = board["movements"]
+        if player_id not in board["players"]:
+            return {column: [] for column in movements}
+        position = board["players"].index(player_id)
+        own = [
+            i
+            for i, source in enumerate(movements["sources"])
+            if board["owners"][source] == position
+        ]
+        return {
+            column: [values[i] for i in own] for column, values in movements.items()
+        }
+
+
+class MetricsAPIView(views.APIView):
+    """
+    Tick metrics in the Prometheus text format, see `overthrow.games.metrics`.
+    Only for staff, scrapers authenticate with a token of a staff user.
+    """
+
+    permission_classes = [rest_permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        if not metrics.enabled():
+            raise NotFound(_("Tick metrics are disabled."))
+        return HttpResponse(
+            metrics.collect().render(), content_type="text/plain; version=0.0.4"
+        )
@@ -0,0 +1,137 @@
+"""
+Writing simulation results (`state.StateDiff`) to the database.
+
+On Postgres the rows are streamed with COPY into temporary tables and applied
+with a few set based statements. Elsewhere plain ORM bulk queries are used.
+"""
+import io
+
+from django.db import connection
+
+from .models import DeletedMovement, Movement, Tile
+
+
+def write_diff(diff):
+    if connection.vendor == "postgresql":
+        write_diff_copy(diff)
+    else:
+        write_diff_orm(diff)
+
+
+def write_diff_orm(diff):
+    Tile.objects.bulk_update(
+        [
+            Tile(id=tile_id, owner_id=owner_id, army=army, changed_tick=tick)
+            for tile_id, owner_id, army, tick in diff.tiles
+        ],
+        ["army", "owner_id", "changed_tick"],
+    )
+    Movement.objects.filter(
+        id__in=[movement_id for movement_id, game_id, player_id, tick in diff.deleted]
+    ).delete()
+    DeletedMovement.objects.bulk_create(
+        [
+            DeletedMovement(
+                movement_id=movement_id, game_id=game_id, player_id=player_id, tick=tick
+            )
+            for movement_id, game_id, player_id, tick in diff.deleted
+        ]
+    )
+    Movement.objects.bulk_create(
+        [
+            Movement(
+                id=movement_id,
+                source_id=source_id,
+                target_id=target_id,
+                amount=amount,
+                changed_tick=tick,
+            )
+            for movement_id, source_id, target_id, amount, tick in diff.created
+        ]
+    )
+    Movement.objects.bulk_update(
+        [
+            Movement(
+                id=movement_id, source_id=source_id, amount=amount, changed_tick=tick
+            )
+            for movement_id, source_id, amount, tick in diff.updated
+        ],
+        ["source_id", "amount", "changed_tick"],
+    )
+
+
+TILES_SQL = f"""
+UPDATE {Tile._meta.db_table} AS tile
+SET owner_id = diff.owner_id, army = diff.army, changed_tick = diff.changed_tick
+FROM tick_tiles AS diff
+WHERE tile.id = diff.id;
+DROP TABLE tick_tiles;
+"""
+
+# op: c - created, u - updated, d - deleted
+MOVEMENTS_SQL = f"""
+DELETE FROM {Movement._meta.db_table} AS movement
+USING tick_movements AS diff
+WHERE movement.id = diff.id AND diff.op = 'd';
+INSERT INTO {DeletedMovement._meta.db_table} (movement_id, game_id, player_id, tick)
+SELECT id, game_id, player_id, changed_tick FROM tick_movements WHERE op = 'd';
+INSERT INTO {Movement._meta.db_table} (id, source_id, target_id, amount, changed_tick)
+SELECT id, source_id, target_id, amount, changed_tick FROM tick_movements WHERE op = 'c';
+UPDATE {Movement._meta.db_table} AS movement
+SET source_id = diff.source_id, amount = diff.amount, changed_tick = diff.changed_tick
+FROM tick_movements AS diff
+WHERE movement.id = diff.id AND diff.op = 'u';
+DROP TABLE tick_movements;
+"""
+
+
+def write_diff_copy(diff):
+    """ Postgres only. Has to run inside a transaction. """
+    with connection.cursor() as cursor:
+        if diff.tiles:
+            cursor.execute(
+                "CREATE TEMPORARY TABLE tick_tiles "
+                "(id uuid, owner_id uuid, army integer, changed_tick integer) "
+                "ON COMMIT DROP"
+            )
+            cursor.copy_expert(
+                "COPY tick_tiles (id, owner_id, army, changed_tick) FROM STDIN",
+                _copy_buffer(diff.tiles),
+            )
+            cursor.execute(TILES_SQL)
+
+        if diff.created or diff.updated or diff.deleted:
+            cursor.execute(
+                "CREATE TEMPORARY TABLE tick_movements "
+                "(op char, id uuid, source_id uuid, target_id uuid, amount integer, "
+                "game_id uuid, player_id uuid, changed_tick integer) ON COMMIT DROP"
+            )
+            rows = [
+                ("c", m_id, source_id, target_id, amount, None, None, tick)
+                for m_id, source_id, target_id, amount, tick in diff.created
+            ]
+            rows += [
+                ("u", m_id, source_id, None, amount, None, None, tick)
+                for m_id, source_id, amount, tick in diff.updated
+            ]
+            rows += [
+                ("d", m_id, None, None, None, game_id, player_id, tick)
+                for m_id, game_id, player_id, tick in diff.deleted
+            ]
+            cursor.copy_expert(
+                "COPY tick_movements "
+                "(op, id, source_id, target_id, amount, game_id, player_id, "
+                "changed_tick) FROM STDIN",
+                _copy_buffer(rows),
+            )
+            cursor.execute(MOVEMENTS_SQL)
+
+
+def _copy_buffer(rows):
+    """ Rows in COPY text format. Values are uuids, ints or None only. """
+    return io.StringIO(
+        "".join(
+            "\t".join("\\N" if value is None else str(value) for value in row) + "\n"
+            for row in rows
+        )
+    )
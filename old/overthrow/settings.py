@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
+import datetime
 import os
 import environ
 
@@ -141,6 +142,48 @@ REST_FRAMEWORK = {
     ]
 }
 
+# game simulation backend, either dict based
+# "overthrow.games.game_simulator.GameSimulator" or numpy based
+# "overthrow.games.array_simulator.ArrayGameSimulator", picked for each tick
+# by the number of loaded tiles if empty
+GAME_SIMULATOR = env.str("GAME_SIMULATOR", default="")
+ARRAY_SIMULATOR_MIN_TILES = env.int("ARRAY_SIMULATOR_MIN_TILES", default=300)
+
+# game clock
+TICK_DURATION = datetime.timedelta(seconds=env.float("TICK_DURATION", default=60))
+# limit of ticks simulated at once when a game falls behind
+MAX_CATCH_UP_TICKS = env.int("MAX_CATCH_UP_TICKS", default=100)
+# how long a ticker worker owns claimed games, before others may take them over
+TICK_LEASE_DURATION = datetime.timedelta(
+    seconds=env.float("TICK_LEASE_DURATION", default=300)
+)
+# clients further behind than that many ticks get a full reload instead of changes
+DELTA_SYNC_TICKS = env.int("DELTA_SYNC_TICKS", default=100)
+# lists longer than that are streamed from a server side cursor, not cached
+STREAM_LIST_ROWS = env.int("STREAM_LIST_ROWS", default=20000)
+STREAM_CHUNK_SIZE = env.int("STREAM_CHUNK_SIZE", default=2000)
+# number of games whose state each web process keeps in memory
+GAME_STATE_CACHE_SIZE = env.int("GAME_STATE_CACHE_SIZE", default=32)
+# unix socket of the game server (run_game_server), orders go to the database if empty
+GAME_SERVER_SOCKET = env.str("GAME_SERVER_SOCKET", default="")
+GAME_SERVER_TIMEOUT = env.float("GAME_SERVER_TIMEOUT", default=1.0)
+
+# every that many ticks game history has a whole board, 0 disables the history
+GAME_HISTORY_KEYFRAME_INTERVAL = env.int("GAME_HISTORY_KEYFRAME_INTERVAL", default=50)
+# directory for memory mapped game state snapshots, for fast restarts of game servers
+GAME_SNAPSHOT_DIR = env.str("GAME_SNAPSHOT_DIR", default=None)
+# measure phases of ticks and count game cache reads, served to staff at /api/metrics/
+TICK_METRICS = env.bool("TICK_METRICS", default=False)
+# directory where each process keeps its tick metrics, for the web server to sum them
+TICK_METRICS_DIR = env.str("TICK_METRICS_DIR", default=None)
+# files there of other hosts not written for that long are of stopped processes
+TICK_METRICS_FILE_EXPIRY = datetime.timedelta(
+    seconds=env.float("TICK_METRICS_FILE_EXPIRY", default=24 * 3600)
+)
+
+# directory for memory mapped board topologies, shared between worker restarts
+TOPOLOGY_CACHE_DIR = env.str("TOPOLOGY_CACHE_DIR", default=None)
+
 # delay for testing
 SLEEP_TIME = env.int("SLEEP_TIME", default=0)
 